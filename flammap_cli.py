@@ -9,8 +9,10 @@ __author__ = ['Gregory A. Greene, map.n.trowel@gmail.com']
 import os
 import glob
 import subprocess
+import threading
 import psutil
 import rasterio as rio
+import numpy as np
 from numpy import histogram
 from numpy.ma import masked_equal
 from typing import Union, Optional
@@ -19,6 +21,35 @@ supplementary_path = os.path.join(os.path.dirname(__file__), 'supplementary_data
 fb_path = os.path.join(supplementary_path, 'FB')
 bin_path = os.path.join(fb_path, 'bin')
 
+# LCP band names, in band order
+lcp_band_names = ['elev', 'slope', 'aspect', 'fbfm', 'cnpy_cvr', 'cnpy_ht', 'cbh', 'cbd']
+
+# Overview resampling methods of LCP bands (see convertLCPToCOG)
+lcp_overview_resampling = {
+    'elev': 'average',
+    'slope': 'average',
+    'aspect': 'circular',
+    'fbfm': 'mode',
+    'cnpy_cvr': 'average',
+    'cnpy_ht': 'average',
+    'cbh': 'average',
+    'cbd': 'average'
+}
+
+# Compression levels benchmarked for each GeoTIFF codec, and their creation option names (see benchmarkLCPCompression)
+lcp_compression_levels = {
+    'DEFLATE': (1, 6, 9),
+    'LZW': (None,),
+    'ZSTD': (1, 9, 15),
+    'NONE': (None,)
+}
+compression_level_options = {
+    'DEFLATE': 'zlevel',
+    'ZSTD': 'zstd_level',
+    'LERC_DEFLATE': 'zlevel',
+    'LERC_ZSTD': 'zstd_level'
+}
+
 app_name_dict = {
     'FlamMap': 'TestFlamMap',
     'MTT': 'TestMTT',
@@ -37,70 +68,700 @@ app_exe_dict = {
     'SpatialFOFEM': os.path.join(bin_path, 'TestSpatialFOFEM')
 }
 
+# Output switches (see genInputFile) and the normalized file name suffixes of the grids they produce
+output_switch_dict = {
+    'FLAMELENGTH': ('FLAMELENGTH',),
+    'SPREADRATE': ('SPREADRATE', 'ROS'),
+    'INTENSITY': ('INTENSITY', 'FIRELINEINTENSITY'),
+    'HEATAREA': ('HEATAREA', 'HEATPERUNITAREA'),
+    'CROWNSTATE': ('CROWNSTATE', 'CROWNFIRE'),
+    'MIDFLAME': ('MIDFLAME',),
+    'HORIZRATE': ('HORIZRATE',),
+    'MAXSPREADDIR': ('MAXSPREADDIR',),
+    'ELLIPSEDIM_A': ('ELLIPSEDIMA',),
+    'ELLIPSEDIM_B': ('ELLIPSEDIMB',),
+    'ELLIPSEDIM_C': ('ELLIPSEDIMC',),
+    'MAXSPOT': ('MAXSPOT',),
+    'MAXSPOT_DIR': ('MAXSPOTDIR',),
+    'MAXSPOT_DX': ('MAXSPOTDX',),
+    'CROWNFRACTIONBURNED': ('CROWNFRACTIONBURNED',),
+    'SOLARRADIATION': ('SOLARRADIATION',),
+    'FUELMOISTURE1': ('FUELMOISTURE1',),
+    'FUELMOISTURE10': ('FUELMOISTURE10',),
+    'FUELMOISTURE100': ('FUELMOISTURE100',),
+    'FUELMOISTURE1000': ('FUELMOISTURE1000',),
+    'WINDDIRGRID': ('WINDDIRGRID',),
+    'WINDSPEEDGRID': ('WINDSPEEDGRID',),
+    'MTT_ROS': ('MTTROS', 'MTTSPREADRATE'),
+    'MTT_ARRIVAL': ('MTTARRIVAL', 'MTTARRIVALTIME'),
+    'MTT_CONTOUR': ('MTTCONTOUR',),
+    'MTT_INTENSITY': ('MTTINTENSITY',),
+    'ARRIVALTIME': ('ARRIVALTIME',),
+    'SPREADDIR': ('SPREADDIR', 'SPREADDIRECTION'),
+    'RXINTENSITY': ('RXINTENSITY', 'REACTIONINTENSITY'),
+    'IGNITION': ('IGNITION', 'IGNITIONS'),
+}
+
+# Alternate output switch names
+output_alias_dict = {
+    'MTTSPREADRATE': 'MTT_ROS',
+    'MTTARRIVALTIME': 'MTT_ARRIVAL',
+    'MTTCONTOUR': 'MTT_CONTOUR',
+    'MTTINTENSITY': 'MTT_INTENSITY',
+}
+
+# File extensions of raster grid outputs
+output_grid_exts = ('.asc', '.tif', '.tiff')
+
+# Valid value ranges of LCP bands (LANDFIRE units and scaling: canopy height and CBH in meters * 10,
+# CBD in kg/m3 * 100), used by preflightCheck
+lcp_valid_ranges = {
+    'elev': (-500, 9000),
+    'slope': (0, 90),
+    'aspect': (-1, 360),
+    'cnpy_cvr': (0, 100),
+    'cnpy_ht': (0, 510),
+    'cbh': (0, 510),
+    'cbd': (0, 100)
+}
+
+# Non-burnable FBFM codes
+non_burnable_fbfm = (91, 92, 93, 98, 99)
+
+# Standard FBFM codes: the 13 Anderson fuel models, and the 40 Scott and Burgan fuel models
+# (NB, GR, GS, SH, TU, TL and SB groups), used by preflightCheck
+standard_fbfm_codes = (tuple(range(1, 14)) + non_burnable_fbfm + tuple(range(101, 110)) + tuple(range(121, 125)) +
+                       tuple(range(141, 150)) + tuple(range(161, 166)) + tuple(range(181, 190)) +
+                       tuple(range(201, 205)))
+
+# Categorical and direction outputs, which are never averaged when blending grids
+non_blendable_outputs = ('CROWNSTATE', 'IGNITION', 'MAXSPREADDIR', 'MAXSPOT_DIR', 'SPREADDIR', 'WINDDIRGRID')
+
+# Lower edges of the flame length classes (meters) used for ensemble flame length probabilities
+default_flame_bins = (0, 0.6, 1.2, 1.8, 2.4, 3.7)
+
+# Seconds per time unit, for durations in app messages and timings files
+time_unit_dict = {
+    'ms': 0.001, 'msec': 0.001, 'millisecond': 0.001, 'milliseconds': 0.001,
+    's': 1, 'sec': 1, 'secs': 1, 'second': 1, 'seconds': 1,
+    'm': 60, 'min': 60, 'mins': 60, 'minute': 60, 'minutes': 60,
+    'h': 3600, 'hr': 3600, 'hrs': 3600, 'hour': 3600, 'hours': 3600
+}
+
+# Run outcome classes (see classifyRun), and whether a failed run is worth retrying on a fresh worker
+run_outcome_retry = {
+    'success': False,
+    'killed': True,             # Terminated by a signal (e.g., out-of-memory killer, node preemption)
+    'resource': True,           # Out of memory, disk space or file handles
+    'crash': True,              # Segmentation fault, access violation or abort
+    'error': True,              # Failed for an unrecognized reason
+    'input_error': False,       # Invalid or missing inputs (fails again on any worker)
+    'missing_outputs': False    # Exit status 0, but expected outputs were not written
+}
+
+# Exit statuses of runs killed by a signal or crashed (POSIX negative signal numbers and shell 128 + signal
+# codes, and Windows NTSTATUS codes)
+killed_exit_codes = (-9, -15, -2, 137, 143, 130, 0xC000013A)
+crash_exit_codes = (-11, -6, -7, -4, -8, 139, 134, 135, 132, 136, 0xC0000005, 0xC00000FD, 0xC0000409, 0xC000001D)
+
+# Case insensitive patterns of app message lines, checked in order by classifyRun. Input errors are only
+# recognized on the error lines of the apps (lines starting with "error" or "fatal"), and only in stderr, since
+# warnings and progress messages also mention missing or invalid values
+run_failure_patterns = {
+    'resource': (r'out of memory', r'bad_alloc', r'cannot allocate', r'insufficient memory',
+                 r'memory allocation', r'no space left', r'disk full', r'too many open files',
+                 r'resource temporarily unavailable'),
+    'crash': (r'segmentation fault', r'access violation', r'core dumped', r'stack overflow', r'abort',
+              r'free\(\): invalid', r'double free', r'heap corruption', r'corrupted (?:size|double-linked)'),
+    'input_error': (r'^\W*(?:error|fatal)\b.*(?:cannot open|can\'t open|unable to (?:open|read|load)|'
+                    r'could not (?:open|read|load)|failed to (?:open|read|load)|not found|no such file|'
+                    r'invalid|out of range|unsupported|missing)',
+                    r'^\W*error (?:reading|loading|opening)')
+}
+
+
+fb_data_url = 'https://www.alturassolutions.com/FB/FB.zip'
+fb_stamp_name = 'FB_version.json'
+
+
+class _FileLock:
+    """
+    Minimal cross-process lock based on exclusive creation of a lock file. Used to serialize access to
+    shared cache and queue directories between processes (and nodes on a shared filesystem).
+    """
+    def __init__(self, lock_path: str, timeout: float = 3600, stale_after: float = 3600, poll: float = 0.5):
+        self.lock_path = lock_path
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self.poll = poll
+
+    def __enter__(self):
+        import time
+
+        start = time.time()
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                with os.fdopen(fd, 'w') as file:
+                    file.write(f'{os.getpid()}\n')
+                return self
+            except FileExistsError:
+                # Break locks left behind by crashed processes
+                try:
+                    if time.time() - os.path.getmtime(self.lock_path) > self.stale_after:
+                        os.remove(self.lock_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.time() - start > self.timeout:
+                    raise TimeoutError(f'Timed out waiting for lock: {self.lock_path}')
+                time.sleep(self.poll)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            os.remove(self.lock_path)
+        except FileNotFoundError:
+            pass
+
+
+def _readJson(path: str) -> dict:
+    import json
+
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _writeJson(path: str, data: dict) -> None:
+    import json
+
+    # Write to a temporary file first so readers never see a partial file
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(data, file, indent=2)
+    os.replace(tmp_path, path)
+
+    return
+
+
+def _fileCRC32(path: str, chunk_size: int = 1 << 20) -> int:
+    import zlib
+
+    crc = 0
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            crc = zlib.crc32(chunk, crc)
+
+    return crc & 0xFFFFFFFF
+
 
-def downloadApps() -> None:
+def _fetchArchive(data_url: str,
+                  zip_file_path: str,
+                  chunk_size: int = 1 << 16,
+                  max_retries: int = 3,
+                  timeout: float = 60,
+                  check_remote: bool = True,
+                  force: bool = False,
+                  current_meta: Optional[dict] = None,
+                  suppress_messages: bool = False) -> dict:
+    """
+    Download an archive into a cache location, resuming partial transfers with HTTP range requests and
+    skipping the transfer when the server reports the cached copy is unchanged (ETag/Last-Modified).
+
+    :param current_meta: metadata of an already extracted copy of the archive. Used for the conditional request
+        when the archive itself is no longer cached.
+    :return: the cache metadata of the archive (url, etag, last_modified, size)
+    """
     import requests
+    import time
+    import zipfile
+
+    meta_path = f'{zip_file_path}.json'
+    part_path = f'{zip_file_path}.part'
+    part_meta_path = f'{part_path}.json'
+
+    cached_meta = _readJson(meta_path) if os.path.exists(zip_file_path) else (current_meta or {})
+    if cached_meta.get('url') != data_url:
+        cached_meta = {}
+
+    # Use the cached archive without contacting the server
+    if cached_meta and not force and not check_remote:
+        return cached_meta
+
+    for attempt in range(1, max_retries + 1):
+        headers = {}
+
+        # Ask the server whether the cached archive is still current
+        if cached_meta and not force:
+            if cached_meta.get('etag'):
+                headers['If-None-Match'] = cached_meta['etag']
+            if cached_meta.get('last_modified'):
+                headers['If-Modified-Since'] = cached_meta['last_modified']
+
+        # Resume a partial transfer, as long as the remote file has not changed since it started
+        part_meta = _readJson(part_meta_path) if os.path.exists(part_path) else {}
+        offset = os.path.getsize(part_path) if part_meta.get('url') == data_url else 0
+        validator = part_meta.get('etag') or part_meta.get('last_modified')
+        if offset > 0 and validator:
+            headers['Range'] = f'bytes={offset}-'
+            headers['If-Range'] = validator
+        else:
+            offset = 0
+
+        try:
+            with requests.get(data_url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 304:
+                    if not suppress_messages:
+                        print(f'\tCached archive is current: {zip_file_path}')
+                    return cached_meta
+
+                if response.status_code == 416:
+                    # The requested range starts at the end of the file: the partial file may already hold the
+                    # whole archive (e.g., the process stopped before publishing it). Otherwise start over.
+                    total = response.headers.get('Content-Range', '*/*').split('/')[-1]
+                    total = int(total) if total.isdigit() else part_meta.get('size') or 0
+                    if not offset or total != offset:
+                        for path in (part_path, part_meta_path):
+                            if os.path.exists(path):
+                                os.remove(path)
+                        if not suppress_messages:
+                            print('\tPartial download does not match the remote file, restarting')
+                        continue
+                    mode = None
+                elif response.status_code == 206:
+                    mode = 'ab'
+                    total = response.headers.get('Content-Range', '*/*').split('/')[-1]
+                    total = int(total) if total.isdigit() else 0
+                    if not suppress_messages:
+                        print(f'\tResuming download at byte {offset}')
+                elif response.status_code == 200:
+                    mode = 'wb'
+                    offset = 0
+                    total = int(response.headers.get('Content-Length', 0))
+                else:
+                    raise requests.HTTPError(f'Failed to download file: {response.status_code}')
+
+                if mode is None:
+                    remote_meta = dict(part_meta, size=total)
+                else:
+                    remote_meta = {
+                        'url': data_url,
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified'),
+                        'size': total
+                    }
+                    if mode == 'wb':
+                        _writeJson(part_meta_path, remote_meta)
+
+                    # Stream the response body to the partial file
+                    with open(part_path, mode) as file:
+                        for chunk in response.iter_content(chunk_size=chunk_size):
+                            if chunk:
+                                file.write(chunk)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as err:
+            if not suppress_messages:
+                print(f'\tDownload attempt {attempt} of {max_retries} failed: {err}')
+            if attempt == max_retries:
+                if cached_meta:
+                    if not suppress_messages:
+                        print(f'\tUsing previously cached archive: {zip_file_path}')
+                    return cached_meta
+                raise
+            time.sleep(min(2 ** attempt, 30))
+            continue
+
+        # Verify the transfer is complete and the archive is readable before publishing it
+        size = os.path.getsize(part_path)
+        if total and size != total:
+            if not suppress_messages:
+                print(f'\tIncomplete download ({size} of {total} bytes), retrying')
+            continue
+        try:
+            with zipfile.ZipFile(part_path, 'r'):
+                pass
+        except zipfile.BadZipFile:
+            os.remove(part_path)
+            os.remove(part_meta_path)
+            if attempt == max_retries:
+                raise
+            continue
+
+        remote_meta['size'] = size
+        os.replace(part_path, zip_file_path)
+        _writeJson(meta_path, remote_meta)
+        os.remove(part_meta_path)
+
+        if not suppress_messages:
+            print(f'Download complete: {zip_file_path}')
+
+        return remote_meta
+
+    raise IOError(f'Failed to download {data_url} after {max_retries} attempts')
+
+
+def _extractArchive(zip_file_path: str,
+                    out_dir: str,
+                    chunk_size: int = 1 << 20) -> tuple[int, int]:
+    """
+    Stream the members of a zip archive to disk, skipping members that are already present with a
+    matching size and CRC.
+
+    :return: a tuple with the number of extracted members, and the number of skipped members
+    """
     import shutil
     import zipfile
 
-    # The URL of the zip file
-    data_url = 'https://www.alturassolutions.com/FB/FB.zip'
+    extracted = 0
+    skipped = 0
+    out_root = os.path.realpath(out_dir)
+    with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+        for info in zip_ref.infolist():
+            target = os.path.realpath(os.path.join(out_root, info.filename))
+            if not target.startswith(out_root + os.sep):
+                raise ValueError(f'Unsafe path in archive: {info.filename}')
+
+            if info.is_dir():
+                os.makedirs(target, exist_ok=True)
+                continue
+
+            # Skip members that are already extracted
+            if (os.path.isfile(target) and os.path.getsize(target) == info.file_size and
+                    _fileCRC32(target, chunk_size) == info.CRC):
+                skipped += 1
+                continue
+
+            # Stream the member to a temporary file (the CRC is verified while reading)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp_path = f'{target}.part'
+            with zip_ref.open(info, 'r') as src, open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, chunk_size)
+            os.replace(tmp_path, target)
+            extracted += 1
+
+    return extracted, skipped
+
 
-    # Ensure the supplementary folder exists
-    os.makedirs(supplementary_path, exist_ok=True)
+def downloadApps(data_url: str = fb_data_url,
+                 out_dir: str = supplementary_path,
+                 cache_dir: Optional[str] = None,
+                 force: bool = False,
+                 check_remote: bool = True,
+                 keep_archive: Optional[bool] = None,
+                 max_retries: int = 3,
+                 suppress_messages: bool = False) -> bool:
+    """
+    Download and extract the Missoula Fire Lab applications (FB.zip).
+
+    Interrupted transfers are resumed with HTTP range requests, and the download is skipped when the
+    server reports (via ETag/Last-Modified) that the cached archive is unchanged. Only archive members that are
+    missing, or differ in size/CRC from the files on disk, are extracted.
+    A shared cache directory (e.g., on network storage) lets many nodes provision from one downloaded copy.
+
+    :param data_url: URL of the FB.zip archive
+    :param out_dir: folder to extract the archive into (the FB folder is created within it)
+    :param cache_dir: folder to keep the downloaded archive in. If None, the archive is stored in out_dir.
+    :param force: if True, download and extract the archive even if the local copy is current
+    :param check_remote: if False, use a cached archive without contacting the server
+    :param keep_archive: if True, keep the archive after extraction. Defaults to True when cache_dir is used,
+        otherwise False.
+    :param max_retries: number of download attempts before giving up
+    :param suppress_messages: if True, do not print messages from this function
+    :return: True if the applications are present and current, otherwise False
+    """
+    import requests
+
+    if keep_archive is None:
+        keep_archive = cache_dir is not None
+    if cache_dir is None:
+        cache_dir = out_dir
+
+    # Ensure the supplementary and cache folders exist
+    os.makedirs(out_dir, exist_ok=True)
+    os.makedirs(cache_dir, exist_ok=True)
 
-    # Send an HTTP GET request to the URL
-    print(f'Downloading FB data')
-    response = requests.get(data_url, stream=True)
+    zip_file_path = os.path.join(cache_dir, os.path.basename(data_url.split('?')[0]) or 'FB.zip')
+    stamp_path = os.path.join(out_dir, fb_stamp_name)
 
-    # Check if the request was successful (status code 200)
-    if response.status_code == 200:
-        # Path to save the downloaded zip file
-        zip_file_path = os.path.join(supplementary_path, 'FB.zip')
+    if not suppress_messages:
+        print(f'Downloading FB data')
+
+    # Files extracted from an archive that is no longer cached can still be checked for currency
+    extracted_dir = os.path.join(out_dir, os.path.basename(fb_path))
+    stamp = _readJson(stamp_path) if os.path.exists(extracted_dir) and os.path.exists(stamp_path) else {}
 
-        # Open a local file in binary write mode and save the downloaded content
-        with open(zip_file_path, 'wb') as file:
-            shutil.copyfileobj(response.raw, file)
+    # Only one process at a time downloads into the cache
+    try:
+        with _FileLock(f'{zip_file_path}.lock'):
+            archive_meta = _fetchArchive(data_url,
+                                         zip_file_path,
+                                         max_retries=max_retries,
+                                         check_remote=check_remote,
+                                         force=force,
+                                         current_meta=stamp,
+                                         suppress_messages=suppress_messages)
+    except (requests.RequestException, IOError) as err:
+        print(f'Failed to download file: {err}')
+        return False
 
-        print(f'Download complete: {zip_file_path}')
+    # Skip extraction when the extracted files came from the same archive
+    if not force and stamp and stamp == archive_meta:
+        if not suppress_messages:
+            print(f'FB data is current: {out_dir}')
+        return True
 
-        # Extract the zip file to the supplementary folder
-        with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-            zip_ref.extractall(supplementary_path)
+    # Extract the zip file to the supplementary folder
+    with _FileLock(f'{stamp_path}.lock'):
+        extracted, skipped = _extractArchive(zip_file_path, out_dir)
+        _writeJson(stamp_path, archive_meta)
 
-        print(f'Extraction complete: {supplementary_path}')
+    if not suppress_messages:
+        print(f'Extraction complete: {out_dir} ({extracted} files extracted, {skipped} unchanged)')
 
-        # Delete the zip file after extraction
+    # Delete the zip file after extraction
+    if not keep_archive and os.path.exists(zip_file_path):
         os.remove(zip_file_path)
-        print(f'Zip file removed: {zip_file_path}')
-    else:
-        print(f'Failed to download file: {response.status_code}')
+        os.remove(f'{zip_file_path}.json')
+        if not suppress_messages:
+            print(f'Zip file removed: {zip_file_path}')
+
+    return True
+
+
+def _hornSlopeAspect(elev: np.ndarray, cell_x: float, cell_y: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Compute slope (degrees) and aspect (degrees clockwise from north, NaN where flat) with Horn's method.
+
+    :param elev: float64 elevation array padded with one row/column on each side (NaN as nodata)
+    :param cell_x: cell width, in elevation units
+    :param cell_y: cell height, in elevation units
+    :return: a tuple with the slope and aspect arrays (the size of the unpadded elevation array)
+    """
+    center = elev[1:-1, 1:-1]
+
+    # Replace nodata neighbours with the center cell value
+    def _nb(rows: slice, cols: slice) -> np.ndarray:
+        arr = elev[rows, cols]
+        return np.where(np.isnan(arr), center, arr)
+
+    a, b, c = _nb(np.s_[:-2], np.s_[:-2]), _nb(np.s_[:-2], np.s_[1:-1]), _nb(np.s_[:-2], np.s_[2:])
+    d, f = _nb(np.s_[1:-1], np.s_[:-2]), _nb(np.s_[1:-1], np.s_[2:])
+    g, h, i = _nb(np.s_[2:], np.s_[:-2]), _nb(np.s_[2:], np.s_[1:-1]), _nb(np.s_[2:], np.s_[2:])
+
+    dz_dx = ((c + 2 * f + i) - (a + 2 * d + g)) / (8 * cell_x)
+    dz_dy = ((g + 2 * h + i) - (a + 2 * b + c)) / (8 * cell_y)
+
+    slope = np.degrees(np.arctan(np.hypot(dz_dx, dz_dy)))
+
+    # Azimuth of the downslope direction (rows increase southward), NaN where flat
+    aspect = np.degrees(np.arctan2(-dz_dx, dz_dy)) % 360
+    aspect[(dz_dx == 0) & (dz_dy == 0)] = np.nan
+
+    return slope, aspect
+
+
+def _writeSlopeAspectBands(dst,
+                           elev_path: str,
+                           slope_band: Optional[int] = 2,
+                           aspect_band: Optional[int] = 3,
+                           block_rows: int = 512) -> None:
+    """
+    Derive slope (degrees) and aspect (degrees) bands of an open LCP file from an elevation raster, processing
+    the elevation in row windows with a one row overlap, so the full raster is never held in memory.
+    Band descriptions, statistics and histogram tags are written as in genLCP.
+
+    :param dst: LCP file opened for writing
+    :param elev_path: path to elevation dataset (in the same units as the projected CRS)
+    :param slope_band: band to write slope into (None to skip)
+    :param aspect_band: band to write aspect into (None to skip)
+    :param block_rows: number of rows to process at a time
+    """
+    from rasterio.windows import Window
+
+    # Exact value counts (slope 0-90, aspect -1-359), from which the band statistics are computed
+    value_counts = {slope_band: np.zeros(362, dtype='int64'), aspect_band: np.zeros(362, dtype='int64')}
+
+    with rio.open(elev_path) as src:
+        if src.crs is not None and src.crs.is_geographic:
+            raise ValueError(f'Slope and aspect can not be derived from a geographic CRS: {elev_path}')
+        cell_x, cell_y = abs(src.transform.a), abs(src.transform.e)
+        height, width = src.height, src.width
+
+        for row in range(0, height, block_rows):
+            rows = min(block_rows, height - row)
+
+            # Read the window with one row of overlap above and below
+            row0 = max(row - 1, 0)
+            row1 = min(row + rows + 1, height)
+            elev = src.read(1, window=Window(0, row0, width, row1 - row0)).astype('float64')
+            if src.nodata is not None:
+                elev[elev == src.nodata] = np.nan
+
+            # Pad the landscape edges by replicating the edge cells
+            pad_top = 1 if row0 == row else 0
+            pad_bottom = 1 if row1 == row + rows else 0
+            elev = np.pad(elev, ((pad_top, pad_bottom), (1, 1)), mode='edge')
+
+            slope, aspect = _hornSlopeAspect(elev, cell_x, cell_y)
+            nodata_mask = np.isnan(elev[1:-1, 1:-1])
+            window = Window(0, row, width, rows)
+            # Flat cells get an aspect of -1, as in LANDFIRE aspect data
+            aspect = np.where(np.isnan(aspect), -1, np.rint(aspect) % 360)
+            for band, arr in [(slope_band, np.rint(slope)), (aspect_band, aspect)]:
+                if band:
+                    dst.write(np.where(nodata_mask, -999, arr).astype('int16'), band, window=window)
+                    value_counts[band] += np.bincount(arr[~nodata_mask].astype('int64') + 1, minlength=362)
+
+    for band, desc in [(slope_band, 'slope'), (aspect_band, 'aspect')]:
+        if band:
+            dst.set_band_description(band, desc)
+            values = np.nonzero(value_counts[band])[0]
+            counts = value_counts[band][values]
+            values = values - 1
+            if values.size:
+                mean = np.average(values, weights=counts)
+                hist, _ = histogram(values, bins=256, weights=counts)
+                dst.update_tags(band,
+                                min=float(values.min()),
+                                max=float(values.max()),
+                                mean=float(mean),
+                                std=float(np.sqrt(np.average((values - mean) ** 2, weights=counts))),
+                                histogram=','.join(map(str, hist.astype('int64').tolist())))
+
+    return
+
+
+def _getLCPMeta(ref_meta: dict, creation_options: Optional[dict] = None) -> dict:
+    """
+    Get the output metadata of an LCP file from the metadata of its reference (elevation) raster.
+    Creation options (e.g., from selectLCPCompression) replace the default compression, predictor and tiling.
+    """
+    out_meta = ref_meta.copy()
+
+    # Update metadata for the output GeoTIFF
+    out_meta.update({
+        'count': 8,         # 8 output bands
+        'dtype': 'int16',   # 16-bit integer format
+        'nodata': -999,     # Nodata value for all bands
+        'compress': 'DEFLATE',  # Compression method
+        'zlevel': 9,        # Compression level (0-9)
+        'predictor': 2,     # Improve compression for continuous data
+        'tiled': True,      # Enable tiling for efficient access
+        'blockxsize': 128,  # Tile width
+        'blockysize': 128,  # Tile height
+        'BIGTIFF': 'YES'    # Support >4GB output files
+    })
+
+    if creation_options:
+        # Drop the default level and predictor, which may not apply to the requested codec
+        for key in ('zlevel', 'zstd_level', 'predictor'):
+            out_meta.pop(key, None)
+        out_meta.update(creation_options)
+
+    return out_meta
+
+
+def _cogOptions(creation_options: Optional[dict], **defaults) -> dict:
+    """
+    Get the convertLCPToCOG compression arguments (compress, level, predictor, block_size) matching LCP creation
+    options (e.g., from selectLCPCompression), or the defaults if there are no creation options.
+    """
+    options = {key.lower(): value for key, value in (creation_options or {}).items()}
+    if not options:
+        return defaults
+
+    level = options.get('zlevel', options.get('zstd_level', options.get('level')))
+    cog_options = {'compress': options.get('compress', defaults.get('compress', 'DEFLATE')),
+                   'level': None if level is None else int(level),
+                   'predictor': int(options.get('predictor', 1))}
+    if 'blockxsize' in options:
+        cog_options['block_size'] = int(options['blockxsize'])
+
+    return cog_options
+
+
+def _readLCPBand(path: str, ref_shape: Optional[tuple] = None) -> np.ndarray:
+    """
+    Read an LCP input raster as an int16 array, with its nodata values replaced by -999.
+    """
+    with rio.open(path) as src:
+        # Read and convert to int16 to match output dtype
+        arr = src.read(1).astype('int16')
+
+        # Replace input nodata values with unified -999
+        nodata_value = src.nodata
+        if nodata_value is not None:
+            arr[arr == nodata_value] = -999
+
+    # Check shape consistency with the reference raster
+    if ref_shape is not None and arr.shape != ref_shape:
+        raise ValueError(f'Raster size mismatch in {path}. Expected {ref_shape}, got {arr.shape}')
+
+    return arr
+
+
+def _writeLCPBand(dst, band: int, arr: np.ndarray, desc: str) -> None:
+    """
+    Write an int16 band to an open LCP file, with its description, basic statistics and histogram tags.
+    """
+    # Write the current band to the output file
+    dst.write(arr, band)
+
+    # Set band description (e.g., 'elev', 'slope', ...)
+    dst.set_band_description(band, desc)
+
+    # Mask nodata values before computing statistics
+    arr_masked = masked_equal(arr, -999)
+
+    # Compute and write basic stats as band-level metadata
+    stats = {
+        'min': float(arr_masked.min()),
+        'max': float(arr_masked.max()),
+        'mean': float(arr_masked.mean()),
+        'std': float(arr_masked.std())
+    }
+    dst.update_tags(band, **stats)
+
+    # Compute histogram (256 bins) and store as comma-separated string
+    hist, bin_edges = histogram(arr_masked.compressed(), bins=256)
+    dst.update_tags(band, histogram=','.join(map(str, hist.tolist())))
 
     return
 
 
 def genLCP(lcp_file: str,
            elev_path: str,
-           slope_path: str,
-           aspect_path: str,
+           slope_path: Optional[str],
+           aspect_path: Optional[str],
            fbfm_path: str,
            cc_path: str,
            ch_path: str,
            cbh_path: str,
-           cbd_path: str) -> None:
+           cbd_path: str,
+           cog: bool = False,
+           overview_levels: tuple = (2, 4, 8, 16, 32),
+           creation_options: Optional[dict] = None) -> None:
     """
     Generate a compressed, tiled, multiband GeoTIFF file suitable for use as a Landscape (LCP) file,
     by stacking 8 raster tif file inputs. Results are not as compressed as the genLCP_gdal function.
+    With cog=True, the file is written as a Cloud-Optimized GeoTIFF with internal overviews (see convertLCPToCOG).
+    Slope and aspect can be derived from the elevation dataset instead (Horn's method, in overlapping windows),
+    by passing None as their paths. This requires a projected elevation dataset in the units of the CRS.
 
     :param lcp_file: path to output lcp file
     :param elev_path: path to elevation dataset
-    :param slope_path: path to slope dataset (degrees)
-    :param aspect_path: path to aspect dataset (degrees)
+    :param slope_path: path to slope dataset (degrees). If None, slope is derived from elevation.
+    :param aspect_path: path to aspect dataset (degrees). If None, aspect is derived from elevation.
     :param fbfm_path: path to fire behavior fuel model (FBFM) dataset
     :param cc_path: path to canopy cover dataset
     :param ch_path: path to canopy height dataset
     :param cbh_path: path to canopy base height (CBH) dataset
     :param cbd_path: path to canopy bulk density (CBD) dataset
+    :param cog: if True, write a Cloud-Optimized GeoTIFF with overviews
+    :param overview_levels: overview decimation factors used when cog is True
+    :param creation_options: GeoTIFF creation options replacing the default DEFLATE level 9 compression
+        (e.g., from selectLCPCompression). Their compression, level, predictor and tile size also apply to the COG.
     :return: None
     """
     print(f'Generating LCP file at {lcp_file}')
@@ -112,65 +773,33 @@ def genLCP(lcp_file: str,
     # Read metadata from the reference raster
     with rio.open(elev_path) as ref_ras:
         ref_shape = ref_ras.shape
-        out_meta = ref_ras.meta.copy()
-
-    # Update metadata for the output GeoTIFF
-    out_meta.update({
-        'count': 8,         # 8 output bands
-        'dtype': 'int16',   # 16-bit integer format
-        'nodata': -999,     # Nodata value for all bands
-        'compress': 'DEFLATE',  # Compression method
-        'zlevel': 9,        # Compression level (0-9)
-        'predictor': 2,     # Improve compression for continuous data
-        'tiled': True,      # Enable tiling for efficient access
-        'blockxsize': 128,  # Tile width
-        'blockysize': 128,  # Tile height
-        'BIGTIFF': 'YES'    # Support >4GB output files
-    })
+        out_meta = _getLCPMeta(ref_ras.meta, creation_options)
 
     # Write data to output LCP file
     print('\tSaving LCP file')
     with rio.open(lcp_file, 'w', **out_meta) as dst:
         # Loop through each input raster and corresponding band name
         for band, (path, desc) in enumerate(zip(rasters, band_names), start=1):
-            with rio.open(path) as src:
-                # Read and convert to int16 to match output dtype
-                arr = src.read(1).astype('int16')
-
-                # Replace input nodata values with unified -999
-                nodata_value = src.nodata
-                if nodata_value is not None:
-                    arr[arr == nodata_value] = -999
-
-                # Check shape consistency with the reference raster
-                if arr.shape != ref_shape:
-                    raise ValueError(f'Raster size mismatch in {path}. Expected {ref_shape}, got {arr.shape}')
-
-                # Write the current band to the output file
-                dst.write(arr, band)
-
-                # Set band description (e.g., 'elev', 'slope', ...)
-                dst.set_band_description(band, desc)
+            if path is None:
+                continue
+            arr = _readLCPBand(path, ref_shape)
+            _writeLCPBand(dst, band, arr, desc)
 
-                # Mask nodata values before computing statistics
-                arr_masked = masked_equal(arr, -999)
-
-                # Compute and write basic stats as band-level metadata
-                stats = {
-                    'min': float(arr_masked.min()),
-                    'max': float(arr_masked.max()),
-                    'mean': float(arr_masked.mean()),
-                    'std': float(arr_masked.std())
-                }
-                dst.update_tags(band, **stats)
-
-                # Compute histogram (256 bins) and store as comma-separated string
-                hist, bin_edges = histogram(arr_masked.compressed(), bins=256)
-                dst.update_tags(band, histogram=','.join(map(str, hist.tolist())))
+        # Derive missing slope and aspect bands from elevation
+        if slope_path is None or aspect_path is None:
+            print('\tDeriving slope and aspect from elevation')
+            _writeSlopeAspectBands(dst,
+                                   elev_path,
+                                   slope_band=2 if slope_path is None else None,
+                                   aspect_band=3 if aspect_path is None else None)
 
         # Add overall description tag to the first band
         dst.update_tags(1, DESCRIPTIONS=','.join(band_names))
 
+    if cog:
+        convertLCPToCOG(lcp_file, overview_levels=overview_levels,
+                        **_cogOptions(creation_options, compress='DEFLATE', level=9, predictor=2))
+
     print(f'\tLCP file complete')
 
     return
@@ -184,10 +813,14 @@ def genLCP_gdal(lcp_file: str,
                 cc_path: str,
                 ch_path: str,
                 cbh_path: str,
-                cbd_path: str) -> None:
+                cbd_path: str,
+                cog: bool = False,
+                overview_levels: tuple = (2, 4, 8, 16, 32),
+                creation_options: Optional[dict] = None) -> None:
     """
     Generate a compressed, tiled, multiband GeoTIFF file suitable for use as a Landscape (LCP) file,
     by stacking 8 raster layers using GDAL's VRT (Virtual Raster) and Translate functions.
+    With cog=True, the file is written as a Cloud-Optimized GeoTIFF with internal overviews (see convertLCPToCOG).
 
     This function mimics the output structure and compression (size) used by ArcGIS Pro when using the Composite Bands
     tool to export stacked rasters to multi-band TIFF format with LZW compression.
@@ -201,6 +834,11 @@ def genLCP_gdal(lcp_file: str,
     :param ch_path: path to canopy height dataset
     :param cbh_path: path to canopy base height (CBH) dataset
     :param cbd_path: path to canopy bulk density (CBD) dataset
+    :param cog: if True, write a Cloud-Optimized GeoTIFF with overviews (LZW compressed, without predictor,
+        unless creation options are given)
+    :param overview_levels: overview decimation factors used when cog is True
+    :param creation_options: GeoTIFF creation options replacing the default LZW compression and tiling
+        (e.g., from selectLCPCompression). Their compression, level, predictor and tile size also apply to the COG.
     :return: None
     """
     def _updateLCP_Bands(file_path: str):
@@ -240,18 +878,14 @@ def genLCP_gdal(lcp_file: str,
     subprocess.run(vrt_cmd, check=True)
 
     print('\tTranslating VRT to compressed GeoTIFF...')
-    translate_cmd = [
-        'gdal_translate',
-        '-of', 'GTiff',
-        '-co', 'COMPRESS=LZW',
-        '-co', 'TILED=YES',
-        '-co', 'BLOCKXSIZE=128',
-        '-co', 'BLOCKYSIZE=128',
-        '-co', 'BIGTIFF=YES',
-        '-ot', 'Int16',
-        vrt_path,
-        lcp_file
-    ]
+    options = {'COMPRESS': 'LZW', 'TILED': 'YES', 'BLOCKXSIZE': 128, 'BLOCKYSIZE': 128, 'BIGTIFF': 'YES'}
+    if creation_options:
+        options.update({key.upper(): ('YES' if value is True else value)
+                        for key, value in creation_options.items()})
+    translate_cmd = ['gdal_translate', '-of', 'GTiff']
+    for key, value in options.items():
+        translate_cmd += ['-co', f'{key}={value}']
+    translate_cmd += ['-ot', 'Int16', vrt_path, lcp_file]
 
     subprocess.run(translate_cmd, check=True)
 
@@ -263,77 +897,810 @@ def genLCP_gdal(lcp_file: str,
     print('\tUpdating LCP file band names...')
     _updateLCP_Bands(lcp_file)
 
+    if cog:
+        convertLCPToCOG(lcp_file, overview_levels=overview_levels,
+                        **_cogOptions(creation_options, compress='LZW', predictor=1))
+
     print(f'\tLCP file complete')
 
     return
 
 
-def getRawsTextFile(in_path: str) -> tuple[int, str]:
+def _downsampleBlocks(arr: np.ndarray, factor: int, method: str, nodata: Optional[float]) -> np.ndarray:
     """
-    Extracts contents from a text file containing RAWS-formatted weather data, and
-    returns a tuple containing the length of the data, and a string representation of the data.
-
-    :param in_path: Path to the text file.
-    :return: Number of lines, and a formatted string containing the contents of the text file.
+    Downsample a 2D array by an integer factor, reducing each factor x factor block of cells (partial blocks at
+    the edges are padded with nodata) with the given method: "average", "mode" (most frequent value, for
+    categorical bands) or "circular" (mean direction in degrees, for aspect; blocks with only flat cells get -1).
+    Nodata cells are ignored.
     """
-    lines = None
-    contents = None
-    try:
-        with open(in_path, 'r') as reader:
-            data = reader.read().rstrip('\n')
-        with open(in_path, 'w') as writer:
-            zero_line = data.split('\n')[0]
-            first_fbfm = zero_line.split(' ')[0]
-            zero_line = zero_line.replace(first_fbfm, '0', 1)
-            writer.write(f'{zero_line}\n{data}')
-        with open(in_path, 'r') as file:
-            contents = file.read()
-            # contents.replace('\n\n', '\n')
-            lines = len(contents.split('\n'))
-    except FileNotFoundError:
-        print('The data directory does not exist')
+    rows, cols = arr.shape
+    out_rows, out_cols = -(-rows // factor), -(-cols // factor)
+    fill = nodata if nodata is not None else 0
 
-    return lines, contents
+    def _blocks(grid: np.ndarray) -> np.ndarray:
+        return grid.reshape(out_rows, factor, out_cols, factor).transpose(0, 2, 1, 3).reshape(
+            out_rows * out_cols, factor * factor)
 
+    padded = np.full((out_rows * factor, out_cols * factor), fill, dtype=arr.dtype)
+    padded[:rows, :cols] = arr
+    inside = np.zeros(padded.shape, dtype=bool)
+    inside[:rows, :cols] = True
+    blocks = _blocks(padded)
+    valid = _blocks(inside)
+    if nodata is not None:
+        valid &= blocks != nodata
 
-def genWeatherString(weather_list: list[list]) -> tuple[int, str]:
+    if method == 'mode':
+        # Count the values of each block with a single bincount over (block, value index) pairs
+        values, inverse = np.unique(blocks, return_inverse=True)
+        inverse = inverse.reshape(blocks.shape)
+        counts = np.bincount((np.arange(len(blocks))[:, None] * len(values) + inverse)[valid],
+                             minlength=len(blocks) * len(values)).reshape(len(blocks), len(values))
+        out = values[counts.argmax(axis=1)].astype('float64')
+    elif method == 'circular':
+        directions = valid & (blocks >= 0)
+        radians = np.deg2rad(blocks.astype('float64'))
+        sin_sum = np.where(directions, np.sin(radians), 0).sum(axis=1)
+        cos_sum = np.where(directions, np.cos(radians), 0).sum(axis=1)
+        out = np.rint(np.rad2deg(np.arctan2(sin_sum, cos_sum))) % 360
+        out[~directions.any(axis=1)] = -1
+    else:
+        n_valid = valid.sum(axis=1)
+        total = np.where(valid, blocks, 0).sum(axis=1, dtype='float64')
+        out = total / np.maximum(n_valid, 1)
+        if np.issubdtype(arr.dtype, np.integer):
+            out = np.rint(out)
+    out[~valid.any(axis=1)] = fill
+
+    return out.reshape(out_rows, out_cols).astype(arr.dtype)
+
+
+def convertLCPToCOG(lcp_file: str,
+                    out_path: Optional[str] = None,
+                    overview_levels: tuple = (2, 4, 8, 16, 32),
+                    compress: str = 'DEFLATE',
+                    level: Optional[int] = None,
+                    predictor: int = 2,
+                    block_size: int = 512,
+                    suppress_messages: bool = False) -> str:
     """
-    Converts a list of lists of properly formatted weather data, and returns a tuple containing the
-    length of the list, and a string representation of the data.
-    This function is intended to be used if passing data from a Pandas DataFrame or array that has been
-    converted to a list of lists. Do not include column names, only the data.
+    Convert an LCP file (see genLCP) to a Cloud-Optimized GeoTIFF with internal overviews, so coarse reads and
+    previews only touch a small fraction of the file. Overviews are computed per band in a single streaming pass
+    over strips of the LCP (each level from the previous one), with the resampling method of
+    lcp_overview_resampling (mode for fbfm, circular mean for aspect, average for the other bands), since GDAL
+    overviews use one method for all bands. They are then written into the COG through a VRT that declares them
+    as the overviews of each band.
 
-    :param weather_list: A list of lists containing properly formatted weather data.
-    :return: A tuple with the length of the list and the formatted string.
+    :param lcp_file: path to the LCP file
+    :param out_path: path to the output COG. If None, the LCP file is replaced.
+    :param overview_levels: overview decimation factors (levels after the first one that fits in a single tile
+        are skipped)
+    :param compress: GDAL compression method
+    :param level: compression level (e.g., 1-12 for DEFLATE, 1-22 for ZSTD). If None, the GDAL default is used.
+    :param predictor: GDAL predictor (2 = horizontal differencing, 1 = none)
+    :param block_size: COG tile size
+    :param suppress_messages: if True, do not print messages from this function
+    :return: path to the COG
     """
-    if not all(isinstance(sublist, list) for sublist in weather_list):
-        raise ValueError('Input must be a list of lists.')
+    import shutil
+    import tempfile
+    from xml.sax.saxutils import escape
+    from rasterio.shutil import copy as rio_copy
+    from rasterio.windows import Window
 
-    list_length = len(weather_list)
-    formatted_string = '\n'.join(' '.join(map(str, sublist)) for sublist in sorted(weather_list))
+    out_path = out_path or lcp_file
+    tmp_dir = tempfile.mkdtemp(prefix='.cog_', dir=os.path.dirname(os.path.abspath(out_path)))
+    if not suppress_messages:
+        print(f'\tConverting LCP file to COG with overviews ({out_path})')
 
-    return list_length, formatted_string
+    try:
+        with rio.open(lcp_file) as src:
+            height, width, count, nodata = src.height, src.width, src.count, src.nodata
+            # As GDAL does, stop at the first level that fits in one tile
+            levels = []
+            for factor in sorted(overview_levels):
+                if min(height, width) // factor < 1:
+                    break
+                levels.append(factor)
+                if max(-(-height // factor), -(-width // factor)) <= block_size:
+                    break
+            names = [desc or (lcp_band_names[band] if band < len(lcp_band_names) else '')
+                     for band, desc in enumerate(src.descriptions)]
+            methods = [lcp_overview_resampling.get(name, 'average') for name in names]
+            dtype = src.dtypes[0]
 
+            # Stream strips of rows (a multiple of the largest factor) and write every overview level
+            overview_paths = {factor: os.path.join(tmp_dir, f'overview_{factor}.tif') for factor in levels}
+            overviews = {}
+            for factor, path in overview_paths.items():
+                overviews[factor] = rio.open(path, 'w', driver='GTiff', height=-(-height // factor),
+                                             width=-(-width // factor), count=count, dtype=dtype, nodata=nodata,
+                                             crs=src.crs, transform=src.transform * src.transform.scale(factor),
+                                             tiled=True, blockxsize=256, blockysize=256)
+            max_factor = levels[-1] if levels else 1
+            strip_rows = max_factor * max(1, 512 // max_factor)
+            try:
+                for row in range(0, height, strip_rows):
+                    rows = min(strip_rows, height - row)
+                    strip = src.read(window=Window(0, row, width, rows))
+                    # Each level is computed from the previous one (as GDAL does), when the factors allow it
+                    prev_factor, prev = 1, strip
+                    for factor, dst in overviews.items():
+                        step, base = (factor // prev_factor, prev) if factor % prev_factor == 0 else (factor, strip)
+                        out = np.stack([_downsampleBlocks(base[band], step, methods[band], nodata)
+                                        for band in range(count)])
+                        dst.write(out, window=Window(0, row // factor, out.shape[2], out.shape[1]))
+                        prev_factor, prev = factor, out
+            finally:
+                for dst in overviews.values():
+                    dst.close()
 
-def genCommandFile(out_path: str,
-                   command_list:  list[list[Union[str, int]]],
-                   suppress_messages: bool = False) -> None:
+            # VRT of the LCP bands, with their descriptions, tags and overviews
+            def _metadata(tags: dict) -> str:
+                items = ''.join(f'<MDI key="{escape(str(key))}">{escape(str(value))}</MDI>'
+                                for key, value in tags.items())
+                return f'<Metadata>{items}</Metadata>'
+
+            gdal_type = {'int16': 'Int16', 'uint8': 'Byte', 'uint16': 'UInt16', 'int32': 'Int32',
+                         'float32': 'Float32', 'float64': 'Float64'}[dtype]
+            vrt_bands = []
+            for band in range(1, count + 1):
+                overview_xml = ''.join(
+                    f'<Overview><SourceFilename relativeToVRT="0">{escape(path)}</SourceFilename>'
+                    f'<SourceBand>{band}</SourceBand></Overview>' for path in overview_paths.values())
+                vrt_bands.append(
+                    f'<VRTRasterBand dataType="{gdal_type}" band="{band}">'
+                    + (f'<NoDataValue>{nodata}</NoDataValue>' if nodata is not None else '')
+                    + f'<Description>{escape(src.descriptions[band - 1] or "")}</Description>'
+                    + _metadata(src.tags(band))
+                    + f'<SimpleSource><SourceFilename relativeToVRT="0">{escape(os.path.abspath(lcp_file))}'
+                      f'</SourceFilename><SourceBand>{band}</SourceBand></SimpleSource>'
+                    + overview_xml + '</VRTRasterBand>')
+            vrt_path = os.path.join(tmp_dir, 'lcp.vrt')
+            with open(vrt_path, 'w') as file:
+                file.write(f'<VRTDataset rasterXSize="{width}" rasterYSize="{height}">'
+                           f'<SRS>{escape(src.crs.to_wkt()) if src.crs else ""}</SRS>'
+                           f'<GeoTransform>{", ".join(map(repr, src.transform.to_gdal()))}</GeoTransform>'
+                           + _metadata(src.tags()) + ''.join(vrt_bands) + '</VRTDataset>')
+
+        cog_path = os.path.join(tmp_dir, 'lcp_cog.tif')
+        options = {'level': level} if level is not None else {}
+        rio_copy(vrt_path, cog_path, driver='COG', compress=compress, predictor=predictor, blocksize=block_size,
+                 overviews='FORCE_USE_EXISTING' if levels else 'NONE', BIGTIFF='IF_SAFER', **options)
+        os.replace(cog_path, out_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return out_path
+
+
+def benchmarkLCPCompression(lcp_file: str,
+                            sample_size: int = 1024,
+                            codecs: Optional[dict] = None,
+                            predictors: tuple = (1, 2),
+                            block_sizes: tuple = (128, 256, 512),
+                            n_reads: int = 3,
+                            suppress_messages: bool = False) -> list[dict]:
     """
-    Function to generate a command file
-    :param out_path: path to save the output command file
-    :param command_list: list of lists that contain the command file data
+    Benchmark GeoTIFF compression profiles for an LCP file, by writing a sample window from the center of the
+    landscape (all bands) with each combination of codec, level, predictor and block size, then reading it back.
+    Codecs that are not supported by the GDAL build are skipped. The encode time covers compressing and writing
+    the sample, the decode time is the fastest of n_reads full reads (the file is then in the OS cache, so it
+    measures decompression rather than disk speed).
+
+    :param lcp_file: path to the LCP file
+    :param sample_size: width and height of the sample window (clipped to the landscape)
+    :param codecs: dictionary of codec names and tuples of levels to test (None = codec default).
+        If None, lcp_compression_levels is used.
+    :param predictors: GDAL predictors to test (1 = none, 2 = horizontal differencing). Ignored for "NONE".
+    :param block_sizes: tile sizes to test
+    :param n_reads: number of timed reads of each sample file
     :param suppress_messages: if True, do not print messages from this function
-    :return: None
+    :return: list of dictionaries with the compress, level, predictor, block_size, bytes, ratio (to the
+        uncompressed size), encode_seconds and decode_seconds of each profile
     """
+    import shutil
+    import tempfile
+    import time
+    from rasterio.errors import RasterioError
+    from rasterio.windows import Window
+
+    codecs = codecs or lcp_compression_levels
+
+    # Read the sample window from the center of the landscape
+    with rio.open(lcp_file) as src:
+        rows, cols = min(sample_size, src.height), min(sample_size, src.width)
+        window = Window((src.width - cols) // 2, (src.height - rows) // 2, cols, rows)
+        sample = src.read(window=window)
+        profile = {'driver': 'GTiff', 'height': rows, 'width': cols, 'count': src.count, 'dtype': src.dtypes[0],
+                   'nodata': src.nodata, 'crs': src.crs, 'transform': src.window_transform(window),
+                   'tiled': True}
+    raw_bytes = sample.nbytes
+
     if not suppress_messages:
-        print('\n<<<<< [flammap_cli.py] Generating Command File >>>>>')
-    if os.path.exists(out_path):
-        os.remove(out_path)
+        print(f'Benchmarking LCP compression on a {rows} x {cols} sample of {lcp_file}')
 
+    results = []
+    unsupported = set()
+    tmp_dir = tempfile.mkdtemp(prefix='.lcp_bench_', dir=os.path.dirname(os.path.abspath(lcp_file)))
     try:
-        file = open(out_path, 'w')
-        for row in command_list:
-            file.write(' '.join(map(str, row)) + '\n')
+        profiles = [(compress.upper(), level, predictor, block_size)
+                    for compress, levels in codecs.items()
+                    for level in levels
+                    for predictor in (predictors if compress.upper() != 'NONE' else (1,))
+                    for block_size in block_sizes]
+        for compress, level, predictor, block_size in profiles:
+            if compress in unsupported:
+                continue
+            options = {'compress': compress, 'predictor': predictor,
+                       'blockxsize': block_size, 'blockysize': block_size}
+            if level is not None and compress in compression_level_options:
+                options[compression_level_options[compress]] = level
+            path = os.path.join(tmp_dir, f'sample_{len(results)}.tif')
+
+            try:
+                start = time.perf_counter()
+                with rio.open(path, 'w', **profile, **options) as dst:
+                    dst.write(sample)
+                encode_seconds = time.perf_counter() - start
+                with rio.open(path) as dst:
+                    written = dst.compression.name.upper() if dst.compression else 'NONE'
+            except RasterioError:
+                written = None
+            # GDAL falls back to no compression (with a warning) for codecs it was built without
+            if written is None or written.replace('_', '') != compress.replace('_', ''):
+                if not suppress_messages:
+                    print(f'\tSkipping {compress}: not supported by this GDAL build')
+                unsupported.add(compress)
+                continue
+
+            decode_seconds = float('inf')
+            for _ in range(n_reads):
+                start = time.perf_counter()
+                with rio.open(path) as dst:
+                    dst.read()
+                decode_seconds = min(decode_seconds, time.perf_counter() - start)
+
+            size = os.path.getsize(path)
+            os.remove(path)
+            results.append({
+                'compress': compress,
+                'level': level,
+                'predictor': predictor,
+                'block_size': block_size,
+                'bytes': size,
+                'ratio': size / raw_bytes,
+                'encode_seconds': encode_seconds,
+                'decode_seconds': decode_seconds
+            })
+            if not suppress_messages:
+                print(f'\t{compress} level={level} predictor={predictor} block={block_size}: '
+                      f'{size / raw_bytes:.3f} of raw size, encode {encode_seconds:.3f}s, '
+                      f'decode {decode_seconds:.3f}s')
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return results
+
+
+def selectLCPCompression(results: list[dict],
+                         objective: str = 'fastest_read',
+                         max_size_ratio: float = 1.3) -> dict:
+    """
+    Choose an LCP compression profile from benchmarkLCPCompression results, and return it as GeoTIFF creation
+    options for genLCP, genLCP_gdal or LCPBuilder (creation_options argument).
+    Objectives:
+        "fastest_read": the fastest decode among profiles within max_size_ratio of the smallest size
+        "fastest_write": the fastest encode among profiles within max_size_ratio of the smallest size
+        "smallest": the smallest size (ties are broken by decode time)
+
+    :param results: list of benchmark results from benchmarkLCPCompression
+    :param objective: selection objective ("fastest_read", "fastest_write", "smallest")
+    :param max_size_ratio: maximum size of the chosen profile, as a multiple of the smallest size
+    :return: dictionary of GeoTIFF creation options
+    """
+    if not results:
+        raise ValueError('No compression benchmark results to select from')
+
+    smallest = min(result['bytes'] for result in results)
+    candidates = [result for result in results if result['bytes'] <= smallest * max_size_ratio]
+
+    if objective == 'fastest_read':
+        best = min(candidates, key=lambda result: (result['decode_seconds'], result['bytes']))
+    elif objective == 'fastest_write':
+        best = min(candidates, key=lambda result: (result['encode_seconds'], result['bytes']))
+    elif objective == 'smallest':
+        best = min(results, key=lambda result: (result['bytes'], result['decode_seconds']))
+    else:
+        raise ValueError(f'Invalid objective: {objective}. Must be "fastest_read", "fastest_write" or "smallest"')
+
+    options = {'compress': best['compress'],
+               'predictor': best['predictor'],
+               'blockxsize': best['block_size'],
+               'blockysize': best['block_size']}
+    if best['level'] is not None and best['compress'] in compression_level_options:
+        options[compression_level_options[best['compress']]] = best['level']
+
+    return options
+
+
+def _updateBandStats(tags: dict, old_values: np.ndarray, new_values: np.ndarray) -> Optional[dict]:
+    """
+    Incrementally update the band statistics and histogram tags written by genLCP, given the valid values
+    that were removed from and added to the band.
+
+    :return: the updated tags, or None if they can not be updated incrementally (e.g., the band has no
+        statistics tags, or the value range changed), in which case they must be recomputed
+    """
+    if not all(key in tags for key in ['min', 'max', 'mean', 'std', 'histogram']):
+        return None
+
+    hist = np.array([int(v) for v in tags['histogram'].split(',')], dtype='int64')
+    mn, mx = float(tags['min']), float(tags['max'])
+    if new_values.size and (new_values.min() < mn or new_values.max() > mx):
+        return None
+    if old_values.size and ((old_values == mn).any() or (old_values == mx).any()):
+        # The minimum or maximum value may have been removed
+        return None
+
+    # Histogram edges as computed by numpy.histogram over the original value range
+    edges = np.histogram_bin_edges(np.array([mn, mx]), bins=hist.size)
+    hist = hist - np.histogram(old_values, bins=edges)[0] + np.histogram(new_values, bins=edges)[0]
+    count = hist.sum()
+    if count == 0:
+        return None
+
+    old_count = count - new_values.size + old_values.size
+    mean, std = float(tags['mean']), float(tags['std'])
+    total = mean * old_count - old_values.sum(dtype='float64') + new_values.sum(dtype='float64')
+    total_sq = ((std ** 2 + mean ** 2) * old_count -
+                (old_values.astype('float64') ** 2).sum() + (new_values.astype('float64') ** 2).sum())
+    new_mean = total / count
+
+    return {
+        'min': mn,
+        'max': mx,
+        'mean': float(new_mean),
+        'std': float(np.sqrt(max(total_sq / count - new_mean ** 2, 0))),
+        'histogram': ','.join(map(str, hist.tolist()))
+    }
+
+
+def _computeBandStats(dst, band: int, nodata: Union[int, float] = -999) -> dict:
+    """Compute the band statistics and histogram tags written by genLCP, reading the band block by block"""
+    count = 0
+    total = 0.0
+    total_sq = 0.0
+    mn, mx = np.inf, -np.inf
+    windows = [window for _, window in dst.block_windows(band)]
+    for window in windows:
+        arr = dst.read(band, window=window)
+        valid = arr[arr != nodata].astype('float64')
+        if valid.size:
+            count += valid.size
+            total += valid.sum()
+            total_sq += (valid ** 2).sum()
+            mn, mx = min(mn, valid.min()), max(mx, valid.max())
+    if count == 0:
+        return {}
+
+    edges = np.histogram_bin_edges(np.array([mn, mx]), bins=256)
+    hist = np.zeros(256, dtype='int64')
+    for window in windows:
+        arr = dst.read(band, window=window)
+        hist += np.histogram(arr[arr != nodata], bins=edges)[0]
+    mean = total / count
+
+    return {
+        'min': float(mn),
+        'max': float(mx),
+        'mean': float(mean),
+        'std': float(np.sqrt(max(total_sq / count - mean ** 2, 0))),
+        'histogram': ','.join(map(str, hist.tolist()))
+    }
+
+
+def patchLCP(base_lcp: str,
+             out_lcp: str,
+             edits: dict,
+             compact: Optional[bool] = None,
+             suppress_messages: bool = False) -> dict[str, int]:
+    """
+    Generate a variant of an LCP file (see genLCP) by applying per-band edits, e.g., fuel treatment polygons with
+    new FBFM, canopy cover, CBH or CBD values, without rebuilding the whole landscape.
+
+    The edits of all bands are grouped per tile, and each tile touched by an edit is read and written once with all
+    its edited bands. By default, the base LCP is copied and only the changed tiles are re-encoded, so all
+    untouched compressed tiles are kept byte-for-byte. GDAL appends re-encoded tiles at the end of the file (the
+    space of the old tiles is not reclaimed, and with pixel interleaving a tile holds all 8 bands), so the file
+    grows with every edited tile. When the edits are dense, the output is instead written as a new, compact file
+    (see compact). The band statistics and histogram tags are updated incrementally from the changed cells (and
+    recomputed only when the value range of the band changes).
+
+    Edits are given per band name ("elev", "slope", "aspect", "fbfm", "cnpy_cvr", "cnpy_ht", "cbh", "cbd"), as:
+        * a numpy masked array with the full landscape shape: unmasked cells are replaced
+        * a numpy array with the full landscape shape: all cells are replaced
+        * a list of (geometry, value) tuples: cells within each geometry (a GeoJSON-like mapping or an object with
+          a __geo_interface__, in the LCP CRS) are set to the value. Later geometries take precedence, and nodata
+          cells are not changed.
+
+    Example:
+        patchLCP(base_lcp, 'treated.tif', {'fbfm': [(unit_polygon, 186)], 'cbh': [(unit_polygon, 40)]})
+
+    :param base_lcp: path to the base LCP file
+    :param out_lcp: path to the output LCP file
+    :param edits: dictionary of band names and edits
+    :param compact: if True, write all tiles to a new file (no growth from re-encoded tiles); if False, patch a copy
+        of the base LCP in place. If None, a new file is written when the edits touch more than a quarter of
+        the tiles.
+    :param suppress_messages: if True, do not print messages from this function
+    :return: dictionary of band names and the number of tiles whose values changed
+    """
+    import shutil
+    from rasterio.features import rasterize, bounds as geom_bounds
+    from rasterio.windows import from_bounds, transform as window_transform
+
+    if not suppress_messages:
+        print(f'Patching LCP file {base_lcp} into {out_lcp}')
+
+    for band_name in edits:
+        if band_name not in lcp_band_names:
+            raise ValueError(f'Invalid band name "{band_name}": Must be one of: {", ".join(lcp_band_names)}')
+
+    with rio.open(base_lcp) as src:
+        profile = src.profile
+        predictor = src.tags(ns='IMAGE_STRUCTURE').get('PREDICTOR')
+        pixel_interleave = src.interleaving is not None and src.interleaving.name == 'pixel'
+        shape = src.shape
+        transform = src.transform
+        nodata = src.nodata if src.nodata is not None else -999
+        descriptions = list(src.descriptions)
+        windows = [window for _, window in src.block_windows(1)]
+
+    # Get the tiles touched by the edits of each band
+    specs = {}
+    tile_edits = {}
+    for band_name, edit in edits.items():
+        band = descriptions.index(band_name) + 1 if band_name in descriptions else \
+            lcp_band_names.index(band_name) + 1
+        if isinstance(edit, np.ndarray):
+            if edit.shape != shape:
+                raise ValueError(f'Edit array size mismatch for {band_name}. Expected {shape}, got {edit.shape}')
+            spec = {'mask': np.ma.getmaskarray(edit), 'data': np.ma.getdata(edit)}
+            touched = range(len(windows))
+        else:
+            # Only visit the tiles within the bounds of the edit geometries
+            shapes = [(getattr(geom, '__geo_interface__', geom), value) for geom, value in edit]
+            if not shapes:
+                continue
+            left, bottom, right, top = np.array([geom_bounds(geom) for geom, _ in shapes]).T
+            region = from_bounds(left.min(), bottom.min(), right.max(), top.max(), transform)
+            spec = {'shapes': shapes}
+            touched = [i for i, window in enumerate(windows) if
+                       window.col_off < region.col_off + region.width and
+                       window.col_off + window.width > region.col_off and
+                       window.row_off < region.row_off + region.height and
+                       window.row_off + window.height > region.row_off]
+        specs[band_name] = dict(spec, band=band, changed=0, removed=[], added=[])
+        for i in touched:
+            tile_edits.setdefault(i, []).append(band_name)
+
+    if compact is None:
+        compact = len(tile_edits) > len(windows) / 4
+
+    def _apply(spec: dict, old: np.ndarray, window) -> np.ndarray:
+        if 'shapes' not in spec:
+            block = window.toslices()
+            return np.where(spec['mask'][block], old, spec['data'][block]).astype(old.dtype)
+        burned = rasterize(spec['shapes'],
+                           out_shape=old.shape,
+                           transform=window_transform(window, transform),
+                           fill=-32768,
+                           dtype='int32')
+        return np.where((burned != -32768) & (old != nodata), burned, old).astype(old.dtype)
+
+    def _patchTile(src, dst, i: int) -> None:
+        window = windows[i]
+        data = src.read(window=window)
+        changed_bands = []
+        for band_name in tile_edits.get(i, []):
+            spec = specs[band_name]
+            old = data[spec['band'] - 1]
+            new = _apply(spec, old, window)
+            changed = new != old
+            if not changed.any():
+                continue
+
+            # Keep the valid values that changed, to update the band statistics
+            old_changed = old[changed]
+            new_changed = new[changed]
+            spec['removed'].append(old_changed[old_changed != nodata])
+            spec['added'].append(new_changed[new_changed != nodata])
+
+            data[spec['band'] - 1] = new
+            changed_bands.append(spec['band'])
+            spec['changed'] += 1
+
+        if compact:
+            dst.write(data, window=window)
+        elif changed_bands:
+            # With pixel interleaving, a tile holds all bands and is re-encoded once
+            indexes = list(range(1, data.shape[0] + 1)) if pixel_interleave else changed_bands
+            dst.write(data[[index - 1 for index in indexes]], indexes=indexes, window=window)
+
+        return
+
+    if compact:
+        # Write all tiles to a new file with the layout and compression of the base LCP
+        tmp_path = f'{out_lcp}.{os.getpid()}.{threading.get_ident()}.tmp.tif'
+        if predictor:
+            profile['predictor'] = int(predictor)
+        with rio.open(base_lcp) as src, rio.open(tmp_path, 'w', **profile) as dst:
+            dst.update_tags(**src.tags())
+            for band in range(1, src.count + 1):
+                dst.set_band_description(band, src.descriptions[band - 1])
+                dst.update_tags(band, **src.tags(band))
+            for i in range(len(windows)):
+                _patchTile(src, dst, i)
+        os.replace(tmp_path, out_lcp)
+    else:
+        shutil.copyfile(base_lcp, out_lcp)
+        with rio.open(out_lcp, 'r+') as dst:
+            for i in sorted(tile_edits):
+                _patchTile(dst, dst, i)
+
+    changed_blocks = {}
+    with rio.open(out_lcp, 'r+') as dst:
+        for band_name, spec in specs.items():
+            band = spec['band']
+            if spec['changed']:
+                tags = dst.tags(band)
+                stats = _updateBandStats(tags, np.concatenate(spec['removed']), np.concatenate(spec['added']))
+                if stats is None and 'histogram' in tags:
+                    stats = _computeBandStats(dst, band, nodata)
+                if stats:
+                    dst.update_tags(band, **stats)
+            changed_blocks[band_name] = spec['changed']
+
+            if not suppress_messages:
+                print(f'\t{band_name}: {spec["changed"]} of {len(windows)} tiles changed')
+
+    if not suppress_messages:
+        print(f'\tLCP file complete{" (compact rewrite)" if compact else ""}')
+
+    return changed_blocks
+
+
+class LCPBuilder:
+    """
+    Builder for many LCP variants in one session (e.g., fuel scenario sets that share terrain and canopy bands).
+
+    Decoded int16 input bands are kept in an LRU cache bounded by memory, keyed by path, modification time and
+    size, so bands shared across variants (elevation, slope, aspect, and often canopy) are read and decoded once.
+    Cached bands are read-only and are invalidated when their source file changes.
+    Variants are encoded in parallel by buildMany().
+
+    Example:
+        builder = LCPBuilder(max_cache_bytes=4 * 1024 ** 3)
+        builder.buildMany([
+            {'lcp_file': 'base.tif', 'fbfm_path': 'fbfm_base.tif', **shared_paths},
+            {'lcp_file': 'treated.tif', 'fbfm_path': 'fbfm_treated.tif', **shared_paths},
+        ])
+    """
+    def __init__(self,
+                 max_cache_bytes: int = 2 * 1024 ** 3,
+                 max_workers: Optional[int] = None,
+                 creation_options: Optional[dict] = None,
+                 suppress_messages: bool = False):
+        """
+        :param max_cache_bytes: maximum memory used by cached bands (bytes)
+        :param max_workers: number of variants to encode at the same time. Defaults to the number of CPUs.
+        :param creation_options: GeoTIFF creation options replacing the default LCP compression
+            (e.g., from selectLCPCompression)
+        :param suppress_messages: if True, do not print messages from this class
+        """
+        from collections import OrderedDict
+
+        self.max_cache_bytes = max_cache_bytes
+        self.max_workers = max_workers or os.cpu_count()
+        self.creation_options = creation_options
+        self.suppress_messages = suppress_messages
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    @property
+    def cache_bytes(self) -> int:
+        """Memory used by cached bands (bytes)"""
+        return self._cache_bytes
+
+    def clear(self) -> None:
+        """Empty the band cache"""
+        with self._lock:
+            self._cache.clear()
+            self._cache_bytes = 0
+
+        return
+
+    def getBand(self, path: str, ref_shape: Optional[tuple] = None) -> np.ndarray:
+        """
+        Get a decoded int16 band (nodata as -999) from the cache, reading it if needed.
+
+        :param path: path to the input raster
+        :param ref_shape: expected shape of the raster
+        :return: read-only int16 array
+        """
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                arr = self._cache[key]
+                if ref_shape is not None and arr.shape != ref_shape:
+                    raise ValueError(f'Raster size mismatch in {path}. Expected {ref_shape}, got {arr.shape}')
+                return arr
+
+            # Wait for a band that another thread is already reading
+            event = self._loading.get(key)
+            if event is None:
+                self._loading[key] = threading.Event()
+                self.misses += 1
+
+        if event is not None:
+            event.wait()
+            return self.getBand(path, ref_shape)
+
+        try:
+            arr = _readLCPBand(path, ref_shape)
+            arr.flags.writeable = False
+            with self._lock:
+                if arr.nbytes <= self.max_cache_bytes:
+                    # Evict the least recently used bands until the new band fits
+                    while self._cache_bytes + arr.nbytes > self.max_cache_bytes:
+                        _, evicted = self._cache.popitem(last=False)
+                        self._cache_bytes -= evicted.nbytes
+                    self._cache[key] = arr
+                    self._cache_bytes += arr.nbytes
+        finally:
+            with self._lock:
+                self._loading.pop(key).set()
+
+        return arr
+
+    def build(self,
+              lcp_file: str,
+              elev_path: str,
+              slope_path: Optional[str],
+              aspect_path: Optional[str],
+              fbfm_path: str,
+              cc_path: str,
+              ch_path: str,
+              cbh_path: str,
+              cbd_path: str) -> str:
+        """
+        Generate an LCP file (same output as genLCP), using cached input bands.
+
+        :param lcp_file: path to output lcp file
+        :param elev_path: path to elevation dataset
+        :param slope_path: path to slope dataset (degrees). If None, slope is derived from elevation.
+        :param aspect_path: path to aspect dataset (degrees). If None, aspect is derived from elevation.
+        :param fbfm_path: path to fire behavior fuel model (FBFM) dataset
+        :param cc_path: path to canopy cover dataset
+        :param ch_path: path to canopy height dataset
+        :param cbh_path: path to canopy base height (CBH) dataset
+        :param cbd_path: path to canopy bulk density (CBD) dataset
+        :return: path to the output lcp file
+        """
+        if not self.suppress_messages:
+            print(f'Generating LCP file at {lcp_file}')
+
+        rasters = [elev_path, slope_path, aspect_path, fbfm_path, cc_path, ch_path, cbh_path, cbd_path]
+
+        # Read metadata from the reference raster
+        with rio.open(elev_path) as ref_ras:
+            ref_shape = ref_ras.shape
+            out_meta = _getLCPMeta(ref_ras.meta, self.creation_options)
+
+        with rio.open(lcp_file, 'w', **out_meta) as dst:
+            for band, (path, desc) in enumerate(zip(rasters, lcp_band_names), start=1):
+                if path is not None:
+                    _writeLCPBand(dst, band, self.getBand(path, ref_shape), desc)
+            if slope_path is None or aspect_path is None:
+                _writeSlopeAspectBands(dst,
+                                       elev_path,
+                                       slope_band=2 if slope_path is None else None,
+                                       aspect_band=3 if aspect_path is None else None)
+            dst.update_tags(1, DESCRIPTIONS=','.join(lcp_band_names))
+
+        if not self.suppress_messages:
+            print(f'\tLCP file complete: {lcp_file}')
+
+        return lcp_file
+
+    def buildMany(self, variants: list[dict]) -> list[str]:
+        """
+        Generate several LCP variants in parallel.
+
+        :param variants: list of dictionaries of build() arguments, one per variant
+        :return: list of output lcp file paths
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(lambda kwargs: self.build(**kwargs), variants))
+
+
+def getRawsTextFile(in_path: str) -> tuple[int, str]:
+    """
+    Extracts contents from a text file containing RAWS-formatted weather data, and
+    returns a tuple containing the length of the data, and a string representation of the data.
+
+    :param in_path: Path to the text file.
+    :return: Number of lines, and a formatted string containing the contents of the text file.
+    """
+    lines = None
+    contents = None
+    try:
+        with open(in_path, 'r') as reader:
+            data = reader.read().rstrip('\n')
+        with open(in_path, 'w') as writer:
+            zero_line = data.split('\n')[0]
+            first_fbfm = zero_line.split(' ')[0]
+            zero_line = zero_line.replace(first_fbfm, '0', 1)
+            writer.write(f'{zero_line}\n{data}')
+        with open(in_path, 'r') as file:
+            contents = file.read()
+            # contents.replace('\n\n', '\n')
+            lines = len(contents.split('\n'))
+    except FileNotFoundError:
+        print('The data directory does not exist')
+
+    return lines, contents
+
+
+def genWeatherString(weather_list: list[list]) -> tuple[int, str]:
+    """
+    Converts a list of lists of properly formatted weather data, and returns a tuple containing the
+    length of the list, and a string representation of the data.
+    This function is intended to be used if passing data from a Pandas DataFrame or array that has been
+    converted to a list of lists. Do not include column names, only the data.
+
+    :param weather_list: A list of lists containing properly formatted weather data.
+    :return: A tuple with the length of the list and the formatted string.
+    """
+    if not all(isinstance(sublist, list) for sublist in weather_list):
+        raise ValueError('Input must be a list of lists.')
+
+    list_length = len(weather_list)
+    formatted_string = '\n'.join(' '.join(map(str, sublist)) for sublist in sorted(weather_list))
+
+    return list_length, formatted_string
+
+
+def genCommandFile(out_path: str,
+                   command_list:  list[list[Union[str, int]]],
+                   suppress_messages: bool = False) -> None:
+    """
+    Function to generate a command file
+    :param out_path: path to save the output command file
+    :param command_list: list of lists that contain the command file data
+    :param suppress_messages: if True, do not print messages from this function
+    :return: None
+    """
+    if not suppress_messages:
+        print('\n<<<<< [flammap_cli.py] Generating Command File >>>>>')
+    if os.path.exists(out_path):
+        os.remove(out_path)
+
+    try:
+        file = open(out_path, 'w')
+        for row in command_list:
+            file.write(' '.join(map(str, row)) + '\n')
         file.close()
         if not suppress_messages:
             print('Command file complete')
@@ -343,6 +1710,35 @@ def genCommandFile(out_path: str,
     return
 
 
+def genCommandRow(app_select: str,
+                  lcp_file: str,
+                  input_file: str,
+                  out_base: str,
+                  ign_file: Optional[str] = None,
+                  barrier_file: Optional[str] = None,
+                  out_type: int = 2) -> list[Union[str, int]]:
+    """
+    Function to generate one command file row (see genCommandFile) for the selected app.
+        FlamMap rows: [lcp_file, input_file, out_base, out_type]
+        MTT, TOM and Farsite rows: [lcp_file, input_file, ign_file, barrier_file (0 if none), out_base, out_type]
+    :param app_select: The name of the selected fire modelling application.
+        Options are "FlamMap", "MTT", "TOM", "Farsite".
+    :param lcp_file: path to the landscape file
+    :param input_file: path to the input file
+    :param out_base: path and base name of the outputs
+    :param ign_file: path to the ignition shapefile (MTT, TOM and Farsite)
+    :param barrier_file: path to the barrier shapefile (MTT, TOM and Farsite)
+    :param out_type: the output type code passed to the app
+    :return: list of command file row values
+    """
+    if app_select == 'FlamMap':
+        return [lcp_file, input_file, out_base, out_type]
+    elif app_select in ['MTT', 'TOM', 'Farsite']:
+        return [lcp_file, input_file, ign_file, barrier_file if barrier_file else 0, out_base, out_type]
+    else:
+        raise ValueError(f'Invalid application selection: Must be one of: {", ".join(app_name_dict.keys())}')
+
+
 def genInputFile(
         out_dir: str,
         out_name: str,
@@ -1084,10 +2480,266 @@ def genInputFile(
     return out_path
 
 
+def _scanLCPWindow(lcp_file: str, window, valid_ranges: dict, local, opened: list) -> dict:
+    """
+    Scan one window of an LCP file for preflightCheck (each thread keeps its own open dataset, which is also
+    added to opened, so the caller can close them)
+    """
+    if not hasattr(local, 'datasets'):
+        local.datasets = {}
+    src = local.datasets.get(lcp_file)
+    if src is None:
+        src = local.datasets[lcp_file] = rio.open(lcp_file)
+        opened.append(src)
+
+    nodata = src.nodata if src.nodata is not None else -999
+    data = src.read(window=window)
+    nodata_mask = data == nodata
+    ref_mask = nodata_mask[0]
+
+    result = {'fbfm': np.unique(data[3][~nodata_mask[3]]), 'mismatch': {}, 'out_of_range': {}}
+    for band, name in enumerate(lcp_band_names):
+        mismatch = int((nodata_mask[band] != ref_mask).sum())
+        if mismatch:
+            result['mismatch'][name] = mismatch
+        if name in valid_ranges:
+            low, high = valid_ranges[name]
+            bad = ~nodata_mask[band] & ((data[band] < low) | (data[band] > high))
+            if bad.any():
+                row, col = np.argwhere(bad)[0]
+                result['out_of_range'][name] = (int(bad.sum()),
+                                                (int(row + window.row_off), int(col + window.col_off)),
+                                                int(data[band][row, col]))
+
+    return result
+
+
+def _getSwitchRecords(lines: list[str], switch: str) -> list[list[str]]:
+    """Get the data records (split into values) following a multi-line switch of an input file"""
+    for i, line in enumerate(lines):
+        if line.upper().startswith(f'{switch}:'):
+            count = int(line.split(':', 1)[1].split()[0])
+            records = [record.split() for record in lines[i + 1:] if record and not record.startswith('#')]
+            return records[:count]
+
+    return []
+
+
+def _parseInputFile(input_file: str) -> dict:
+    """Get the switches of an input file as a dictionary, with the data records of multi-line switches"""
+    with open(input_file, 'r') as file:
+        lines = [line.strip() for line in file]
+
+    switches = {}
+    for line in lines:
+        if ':' in line and not line.startswith('#'):
+            key, value = line.split(':', 1)
+            switches[key.strip().upper()] = value.strip()
+
+    switches['_lines'] = lines
+
+    return switches
+
+
+def preflightCheck(lcp_file: str,
+                   input_file: Optional[str] = None,
+                   fbfm_csv: Optional[str] = None,
+                   valid_ranges: Optional[dict] = None,
+                   chunk_size: int = 1024,
+                   max_workers: Optional[int] = None,
+                   raise_on_error: bool = False,
+                   suppress_messages: bool = False) -> list[dict]:
+    """
+    Fast pre-flight validation of an LCP file (and optionally the input file of a run) before launching long runs.
+    The LCP is scanned in one pass, window by window, by a pool of threads.
+
+    LCP checks:
+        * FBFM codes that are not standard fuel models (see standard_fbfm_codes), or are missing from the fbfm_csv table
+        * FBFM codes without fuel moistures, when the input file has no default (model 0) fuel moisture entry
+        * nodata masks that differ between bands (compared to the elevation band)
+        * values out of range (see lcp_valid_ranges)
+    Input file checks:
+        * a default (model 0) FUEL_MOISTURES_DATA entry
+        * RAWS/WEATHER_DATA/WIND_DATA records covering FARSITE_START_TIME to FARSITE_END_TIME (Farsite), or
+          CONDITIONING_PERIOD_END (FlamMap, MTT and TOM fuel conditioning), in sequential order
+        * burn periods within the simulation period
+        * referenced files (ignitions, barriers, gridded winds, custom fuels) exist
+
+    :param lcp_file: path to the LCP file
+    :param input_file: path to the input file (see genInputFile)
+    :param fbfm_csv: path to a CSV table of valid FBFM codes (VALUE column), e.g., for custom fuel models.
+        If None, the standard FBFM13 and FBFM40 codes are valid (see standard_fbfm_codes).
+    :param valid_ranges: dictionary of band names and (min, max) valid values. Defaults to lcp_valid_ranges.
+    :param chunk_size: width and height of the windows scanned by each thread
+    :param max_workers: number of threads. Defaults to the number of CPUs.
+    :param raise_on_error: if True, raise a ValueError when errors are found
+    :param suppress_messages: if True, do not print messages from this function
+    :return: list of issues, as dictionaries with the "level" ("error" or "warning"), "check", and "message"
+    """
+    import csv
+    from concurrent.futures import ThreadPoolExecutor
+    from rasterio.windows import Window
+
+    if valid_ranges is None:
+        valid_ranges = lcp_valid_ranges
+
+    issues = []
+
+    def _issue(level: str, check: str, message: str) -> None:
+        issues.append({'level': level, 'check': check, 'message': message})
+
+    if not suppress_messages:
+        print(f'\n<<<<< [flammap_cli.py] Pre-flight check of {lcp_file} >>>>>')
+
+    # Check the input file
+    moisture_models = None
+    if input_file is not None:
+        switches = _parseInputFile(input_file)
+        lines = switches['_lines']
+
+        if 'FUEL_MOISTURES_DATA' in switches:
+            moisture_models = {int(float(r[0])) for r in _getSwitchRecords(lines, 'FUEL_MOISTURES_DATA')}
+            if 0 not in moisture_models:
+                _issue('warning', 'fuel_moisture', 'FUEL_MOISTURES_DATA has no default (model 0) entry')
+            else:
+                moisture_models = None
+        else:
+            _issue('error', 'fuel_moisture', 'Input file has no FUEL_MOISTURES_DATA')
+
+        def _time(value: str) -> tuple:
+            month, day, hhmm = value.split()[:3]
+            return int(month), int(day), int(hhmm)
+
+        # Period the weather and wind records must cover: the Farsite simulation period, or the end of the fuel
+        # moisture conditioning period (FlamMap, MTT and TOM)
+        period = None
+        if 'FARSITE_START_TIME' in switches and 'FARSITE_END_TIME' in switches:
+            sim_start = _time(switches['FARSITE_START_TIME'])
+            sim_end = _time(switches['FARSITE_END_TIME'])
+            if sim_end <= sim_start:
+                _issue('error', 'time_coverage',
+                       f'FARSITE_END_TIME {sim_end} is not after FARSITE_START_TIME {sim_start}')
+            period = (sim_start, sim_end, f'the simulation period ({sim_start} to {sim_end})')
+
+            for record in _getSwitchRecords(lines, 'FARSITE_BURN_PERIODS'):
+                month, day, start, end = [int(v) for v in record[:4]]
+                if (month, day, end) < sim_start or (month, day, start) > sim_end:
+                    _issue('warning', 'time_coverage',
+                           f'Burn period {month:02d} {day:02d} {start:04d}-{end:04d} is outside the simulation period')
+        elif switches.get('CONDITIONING_PERIOD_END'):
+            cond_end = _time(switches['CONDITIONING_PERIOD_END'])
+            period = (cond_end, cond_end, f'CONDITIONING_PERIOD_END ({cond_end})')
+
+        if period is not None:
+            sim_start, sim_end, description = period
+            for switch in ['RAWS', 'WEATHER_DATA', 'WIND_DATA']:
+                if switch not in switches:
+                    continue
+                records = [[int(float(v)) for v in r[:4]] for r in _getSwitchRecords(lines, switch)]
+                if not records:
+                    _issue('error', 'time_coverage', f'{switch} has no records')
+                    continue
+                # RAWS records: Year Mth Day HHMM, WIND_DATA records: Mth Day Hour, WEATHER_DATA records: Mth Day
+                if switch == 'RAWS':
+                    times = [tuple(r[1:4]) for r in records]
+                elif switch == 'WIND_DATA':
+                    times = [tuple(r[:3]) for r in records]
+                else:
+                    times = [(r[0], r[1], 0) for r in records]
+                if times != sorted(times):
+                    _issue('error', 'time_coverage', f'{switch} records are not in sequential order')
+                first, last = min(times), max(times)
+                if switch == 'WEATHER_DATA':
+                    # Daily records cover their whole day
+                    last = (last[0], last[1], 2359)
+                if first > sim_start or last < sim_end:
+                    _issue('error', 'time_coverage',
+                           f'{switch} records ({first} to {last}) do not cover {description}')
+
+        for switch in ['FARSITE_IGNITION_FILE', 'MTT_IGNITION_FILE', 'FARSITE_BARRIER_FILE', 'MTT_BARRIER_FILE',
+                       'GRIDDED_WIND_SPEED_FILE', 'GRIDDED_WINDS_DIRECTION_FILE', 'CUSTOM_FUELS_FILE',
+                       'TREAT_IGNITION_FILE', 'TREAT_IDEAL_LANDSCAPE', 'ROS_ADJUST_FILE']:
+            path = switches.get(switch)
+            if path and path != 'None':
+                full_path = path if os.path.isabs(path) else os.path.join(os.path.dirname(input_file), path)
+                if not os.path.exists(full_path):
+                    _issue('error', 'missing_file', f'{switch} not found: {path}')
+
+    # Get the valid FBFM codes
+    if fbfm_csv is None:
+        valid_fbfm = set(standard_fbfm_codes)
+        fbfm_source = 'the standard FBFM13/FBFM40 fuel models'
+    else:
+        with open(fbfm_csv, 'r', newline='') as file:
+            valid_fbfm = {int(float(row['VALUE'])) for row in csv.DictReader(file)}
+        fbfm_source = os.path.basename(fbfm_csv)
+
+    # Scan the LCP file in windows
+    with rio.open(lcp_file) as src:
+        if src.count != 8:
+            _issue('error', 'lcp_bands', f'Expected 8 bands, found {src.count}')
+            return issues
+        windows = [Window(col, row, min(chunk_size, src.width - col), min(chunk_size, src.height - row))
+                   for row in range(0, src.height, chunk_size) for col in range(0, src.width, chunk_size)]
+
+    local = threading.local()
+    opened = []
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+            results = list(executor.map(lambda w: _scanLCPWindow(lcp_file, w, valid_ranges, local, opened), windows))
+    finally:
+        for src in opened:
+            src.close()
+
+    fbfm_codes = set(np.unique(np.concatenate([r['fbfm'] for r in results])).tolist())
+    mismatch = {}
+    out_of_range = {}
+    for result in results:
+        for name, count in result['mismatch'].items():
+            mismatch[name] = mismatch.get(name, 0) + count
+        for name, (count, location, value) in result['out_of_range'].items():
+            if name in out_of_range:
+                out_of_range[name] = (out_of_range[name][0] + count,) + out_of_range[name][1:]
+            else:
+                out_of_range[name] = (count, location, value)
+
+    missing = sorted(fbfm_codes - valid_fbfm)
+    if missing:
+        _issue('error', 'fbfm_codes', f'FBFM codes not in {fbfm_source}: {missing}')
+    if moisture_models is not None:
+        burnable = {code for code in fbfm_codes if code not in non_burnable_fbfm}
+        missing = sorted(burnable - moisture_models)
+        if missing:
+            _issue('error', 'fuel_moisture', f'FBFM codes without fuel moistures (and no model 0 default): {missing}')
+    for name, count in mismatch.items():
+        _issue('error', 'nodata_mask', f'Band {name} nodata mask differs from elev in {count} cells')
+    for name, (count, location, value) in out_of_range.items():
+        low, high = valid_ranges[name]
+        _issue('error', 'value_range', f'Band {name} has {count} values outside {low}-{high} '
+                                       f'(e.g., {value} at row/col {location})')
+
+    if not suppress_messages:
+        for issue in issues:
+            print(f'\t{issue["level"].upper()} [{issue["check"]}] {issue["message"]}')
+        print(f'Pre-flight check complete: {len(issues)} issues found')
+
+    if raise_on_error and any(issue['level'] == 'error' for issue in issues):
+        raise ValueError(f'Pre-flight check failed for {lcp_file}:\n' +
+                         '\n'.join(issue['message'] for issue in issues if issue['level'] == 'error'))
+
+    return issues
+
+
+# Process ids of the apps currently run by runApp (runApp can be called from several threads)
+_active_app_pids = set()
+_active_app_lock = threading.Lock()
+
+
 def runApp(app_select: str,
            command_file_path: str,
            app_exe_path: Optional[str] = None,
-           suppress_messages: bool = False) -> tuple[str, str]:
+           suppress_messages: bool = False,
+           return_code: bool = False) -> Union[tuple[str, str], tuple[str, str, int]]:
     """
     Function to run the selected fire app through the command line interface
     :param app_select: The name of the selected fire modelling application.
@@ -1095,12 +2747,16 @@ def runApp(app_select: str,
     :param command_file_path: path to command file
     :param app_exe_path: path to the app executable file
     :param suppress_messages: suppress intermediate print statements during program execution
+    :param return_code: if True, also return the exit status of the app
     :return: A tuple containing the standard output messages, and the CLI app errors
+        (and the app exit status if return_code is True)
     """
     # Check if the FB folder exists within the supplementary_data folder
-    # If not, download the application data
+    # If not, download the application data (a folder without a version stamp, e.g., from an older install, is used
+    # as is; downloadApps treats its version as unknown)
     if not os.path.exists(fb_path):
-        downloadApps()
+        if not downloadApps(check_remote=False):
+            raise IOError(f'The fire modelling applications are missing and could not be downloaded to {fb_path}')
 
     if app_exe_path is None:
         # Get the name of the application executable file
@@ -1113,27 +2769,47 @@ def runApp(app_select: str,
         # Run fire model through command line interface
         if not suppress_messages:
             print('Running CLI command...')
-        app_cli = subprocess.Popen(
-            [app_exe_path, command_file_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            cwd=os.path.dirname(command_file_path)
-        )
-        stdout, stderr = app_cli.communicate()
+        # The lock is held from the start of the app until its pid is registered, so the cleanup of another
+        # thread cannot see (and kill) an app that was just started
+        with _active_app_lock:
+            app_cli = subprocess.Popen(
+                [app_exe_path, command_file_path],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                cwd=os.path.dirname(command_file_path)
+            )
+            _active_app_pids.add(app_cli.pid)
+        try:
+            stdout, stderr = app_cli.communicate()
+            returncode = app_cli.returncode
+        finally:
+            with _active_app_lock:
+                _active_app_pids.discard(app_cli.pid)
         if not suppress_messages:
             print(f'{stdout}\n{stderr}')
 
         del app_cli
 
         # Delete the current CLI app process if it's still running
-        try:
-            worker_proc = psutil.Process(os.getpid())
-            for child in worker_proc.children(recursive=True):  # Kill all child processes running app
-                if app_name_dict[app_select] in child.name():
-                    child.kill()
-        except psutil.NoSuchProcess:
-            pass
+        # (apps started by other threads of this process, and their child processes, are left running)
+        with _active_app_lock:
+            protected = set(_active_app_pids)
+            for pid in _active_app_pids:
+                try:
+                    protected.update(child.pid for child in psutil.Process(pid).children(recursive=True))
+                except psutil.NoSuchProcess:
+                    pass
+            try:
+                children = psutil.Process(os.getpid()).children(recursive=True)
+            except psutil.NoSuchProcess:
+                children = []
+            for child in children:  # Kill all child processes running app
+                try:
+                    if app_name_dict[app_select] in child.name() and child.pid not in protected:
+                        child.kill()
+                except psutil.NoSuchProcess:
+                    pass
 
         if not suppress_messages:
             print(f'<<<<< {app_select} modelling complete >>>>>')
@@ -1143,6 +2819,8 @@ def runApp(app_select: str,
                          f'The "app_selection" variable be one of the following:\n'
                          f'{", ".join(app_name_dict.keys())}')
 
+    if return_code:
+        return stdout, stderr, returncode
     return stdout, stderr
 
 
@@ -1177,9 +2855,5117 @@ def appTest(app_selection: str) -> None:
     return
 
 
+def _parseMetricLines(text: str) -> dict:
+    """
+    Parse "label: value [unit]" and "label = value [unit]" lines of an app message or timings text into
+    numeric values (keyed by the normalized label), durations (in seconds), warnings and errors.
+    """
+    import re
+
+    number = r'-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?'
+    line_patterns = [re.compile(rf'^\s*(?P<label>[^:=]*?[A-Za-z)][^:=]*?)\s*[:=]\s*(?P<value>{number})\s*'
+                                rf'(?P<unit>[A-Za-z]*)\b'),
+                     re.compile(rf'^\s*(?P<label>[A-Za-z][^:=]*?[A-Za-z)])\s+(?P<value>{number})\s*'
+                                rf'(?P<unit>[A-Za-z]*)\s*\.?\s*$')]
+    label_unit = re.compile(r'\(\s*(' + '|'.join(time_unit_dict) + r')\s*\)', re.IGNORECASE)
+
+    parsed = {'values': {}, 'durations': {}, 'warnings': [], 'errors': []}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if re.search(r'warn', line, re.IGNORECASE):
+            parsed['warnings'].append(line)
+        elif re.search(r'error|fail|exception|unable|could not', line, re.IGNORECASE):
+            parsed['errors'].append(line)
+
+        match = next((m for m in (pattern.match(line) for pattern in line_patterns) if m), None)
+        if match is None:
+            continue
+        label = match.group('label')
+        unit = match.group('unit').lower()
+        unit_match = label_unit.search(label)
+        if unit not in time_unit_dict and unit_match:
+            unit = unit_match.group(1).lower()
+        key = re.sub(r'[^a-z0-9]+', '_', label_unit.sub('', label).lower()).strip('_')
+        if not key:
+            continue
+        value = float(match.group('value'))
+        if unit in time_unit_dict and ('time' in key or unit not in ('m', 's', 'h')):
+            parsed['durations'][key] = value * time_unit_dict[unit]
+        else:
+            parsed['values'][key] = int(value) if value.is_integer() else value
+
+    return parsed
+
+
+def parseTimingsFile(timings_path: str) -> dict:
+    """
+    Parse a FARSITETIMINGS output file (see genInputFile) into durations, values (e.g., burned edge vertices),
+    warnings and errors. See _parseMetricLines.
+
+    :param timings_path: path to the timings text file
+    :return: dictionary with "durations" (seconds), "values", "warnings" and "errors"
+    """
+    with open(timings_path, errors='replace') as file:
+        return _parseMetricLines(file.read())
+
+
+def getRunMetrics(app_select: str,
+                  stdout: str,
+                  stderr: str = '',
+                  out_dir: Optional[str] = None,
+                  out_name: Optional[str] = None,
+                  lcp_file: Optional[str] = None,
+                  wall_seconds: Optional[float] = None) -> dict:
+    """
+    Turn the messages returned by runApp (and the FARSITETIMINGS file of the run, if any) into a typed
+    performance record, so runtime can be attributed to landscape size, resolution and spotting settings
+    across a batch.
+
+    :param app_select: The name of the selected fire modelling application
+    :param stdout: the standard output messages of the app
+    :param stderr: the CLI app errors
+    :param out_dir: the run output folder, searched for the timings file
+    :param out_name: the base name of the run outputs
+    :param lcp_file: path to the LCP file of the run, to record its size and resolution
+    :param wall_seconds: the measured wall clock time of the run
+    :return: dictionary with the keys:
+        "app", "wall_seconds", "total_seconds" (model time reported by the app),
+        "landscape_load_seconds", "burned_vertices", "phases" (dictionary of durations in seconds),
+        "values" (other numeric values), "warnings", "errors", "timings_file",
+        and "lcp_rows", "lcp_cols", "lcp_cells", "lcp_res" if lcp_file is given
+    """
+    parsed = _parseMetricLines(stdout or '')
+    stderr_lines = [line.strip() for line in (stderr or '').splitlines() if line.strip()]
+    parsed['errors'] += [line for line in stderr_lines if line not in parsed['errors']]
+
+    # Merge the timings file of the run
+    timings_file = None
+    if out_dir is not None:
+        candidates = [path for path in glob.glob(os.path.join(out_dir, '*'))
+                      if 'TIMINGS' in _normOutputName(os.path.basename(path)) and
+                      os.path.splitext(path)[1].lower() in ('.txt', '.csv', '')]
+        if out_name is not None:
+            candidates = [path for path in candidates if os.path.basename(path).startswith(out_name)] or candidates
+        if candidates:
+            timings_file = sorted(candidates)[0]
+            timings = parseTimingsFile(timings_file)
+            for key in ('values', 'durations'):
+                parsed[key].update(timings[key])
+            parsed['warnings'] += timings['warnings']
+            parsed['errors'] += timings['errors']
+
+    durations = parsed['durations']
+    total = [value for key, value in durations.items() if 'total' in key or 'run_time' in key]
+    load = [value for key, value in durations.items() if ('lcp' in key or 'landscape' in key) and
+            any(word in key for word in ('load', 'read', 'open'))]
+    vertices = [value for key, value in parsed['values'].items() if 'vert' in key]
+
+    metrics = {
+        'app': app_select,
+        'wall_seconds': wall_seconds,
+        'total_seconds': max(total) if total else None,
+        'landscape_load_seconds': max(load) if load else None,
+        'burned_vertices': int(max(vertices)) if vertices else None,
+        'phases': durations,
+        'values': parsed['values'],
+        'warnings': parsed['warnings'],
+        'errors': parsed['errors'],
+        'timings_file': timings_file
+    }
+    if lcp_file is not None:
+        with rio.open(lcp_file) as src:
+            metrics.update({'lcp_rows': src.height, 'lcp_cols': src.width, 'lcp_cells': src.height * src.width,
+                            'lcp_res': abs(src.transform.a)})
+
+    return metrics
+
+
+def _tryRunMetrics(*args, **kwargs) -> dict:
+    """
+    Call getRunMetrics, returning {"error": repr(exception)} if the messages or timings file cannot be parsed,
+    so metrics parsing never changes the outcome of a run.
+    """
+    try:
+        return getRunMetrics(*args, **kwargs)
+    except Exception as e:
+        return {'error': repr(e)}
+
+
+def getExpectedOutputs(input_file: str) -> list[str]:
+    """
+    Get the output switches requested in an input file (e.g., "FLAMELENGTH:" or "MTTARRIVALTIME:" lines),
+    i.e., the outputs a successful run is expected to write.
+
+    :param input_file: path to the input file
+    :return: list of output switch names
+    """
+    switches = _parseInputFile(input_file)
+    expected = []
+    for key in switches:
+        switch = output_alias_dict.get(key, key)
+        if switch in output_switch_dict and switch not in expected:
+            expected.append(switch)
+
+    return expected
+
+
+def classifyRun(exit_status: Optional[int],
+                stderr: str = '',
+                stdout: str = '',
+                out_dir: Optional[str] = None,
+                out_name: Optional[str] = None,
+                expected_outputs: Optional[list[str]] = None) -> dict:
+    """
+    Classify the outcome of a model run (see run_outcome_retry) from its exit status, its messages and its
+    outputs, so batch runners can tell transient failures (worth retrying on a fresh worker) from
+    deterministic ones (bad inputs, missing outputs), which should be quarantined.
+
+    Runs killed by a signal or crashed are recognized from their exit status, and other failures from the
+    patterns of run_failure_patterns in their messages (input errors only from the error lines of stderr).
+    Unrecognized failures are classified as "error", which is retried. Runs with exit status 0 are checked for
+    their expected outputs (some apps exit with status 0 after reporting bad inputs).
+
+    :param exit_status: the exit status of the app (None if it could not be started)
+    :param stderr: the CLI app errors
+    :param stdout: the standard output messages of the app
+    :param out_dir: the run output folder, checked for the expected outputs
+    :param out_name: the base name of the run outputs
+    :param expected_outputs: output switches the run must produce (see getExpectedOutputs). Not checked if None.
+    :return: dictionary with the keys "outcome", "retry" (True for transient failures) and "reason"
+    """
+    import re
+
+    def _result(outcome: str, reason: str) -> dict:
+        return {'outcome': outcome, 'retry': run_outcome_retry[outcome], 'reason': reason}
+
+    def _match(text: str, outcomes: tuple) -> Optional[tuple[str, str]]:
+        for outcome in outcomes:
+            for pattern in run_failure_patterns[outcome]:
+                match = re.search(f'.*{pattern}.*', text or '', re.IGNORECASE | re.MULTILINE)
+                if match:
+                    return outcome, match.group(0).strip()[:500]
+        return None
+
+    if exit_status is None:
+        return _result('error', 'The app could not be started')
+    if exit_status in killed_exit_codes:
+        return _result('killed', f'Killed (exit status {exit_status})')
+    if exit_status in crash_exit_codes:
+        return _result('crash', f'Crashed (exit status {exit_status})')
+
+    if exit_status != 0:
+        match = _match(stderr, ('resource', 'crash', 'input_error')) or _match(stdout, ('resource', 'crash'))
+        if match:
+            return _result(*match)
+        return _result('error', f'Exit status {exit_status}')
+
+    if expected_outputs and out_dir is not None:
+        outputs = RunOutputs(out_dir, out_name=out_name)
+        missing = [switch for switch in expected_outputs if switch not in outputs]
+        if missing:
+            # Some apps exit with status 0 after reporting bad inputs
+            match = _match(stderr, ('resource', 'input_error')) or _match(stdout, ('resource',))
+            if match:
+                return _result(*match)
+            return _result('missing_outputs', f'Missing outputs: {", ".join(missing)}')
+
+    return _result('success', '')
+
+
+def _retryDelay(attempts: int, backoff_seconds: float, max_backoff_seconds: float) -> float:
+    """Get the delay before retrying a job: exponential backoff with jitter (50-100% of the delay)"""
+    import random
+
+    return min(max_backoff_seconds, backoff_seconds * 2 ** max(attempts - 1, 0)) * random.uniform(0.5, 1)
+
+
+def _normOutputName(name: str) -> str:
+    return name.upper().replace('_', '').replace('-', '').replace(' ', '')
+
+
+def _matchOutputSwitches(file_path: str) -> list[str]:
+    """
+    Get the output switches a model output file belongs to, based on the longest matching file name suffix.
+
+    :param file_path: path to the output file
+    :return: list of matching output switch names (empty if the file is not a recognized output)
+    """
+    stem = _normOutputName(os.path.splitext(os.path.basename(file_path))[0])
+    matches = []
+    best = 0
+    for switch, tokens in output_switch_dict.items():
+        for token in tokens:
+            if stem.endswith(token) and len(token) >= best:
+                if len(token) > best:
+                    matches = []
+                    best = len(token)
+                if switch not in matches:
+                    matches.append(switch)
+
+    return matches
+
+
+def _readAsciiHeader(file) -> tuple[dict, int]:
+    """
+    Read the header of an ESRI ASCII grid from an open binary file.
+
+    :return: a tuple with the header values, and the byte offset where the grid values start
+    """
+    header = {}
+    while True:
+        pos = file.tell()
+        line = file.readline()
+        parts = line.split()
+        if not parts or not parts[0][:1].isalpha():
+            file.seek(pos)
+            return header, pos
+        header[parts[0].decode().lower()] = float(parts[1])
+
+
+def readAsciiGrid(asc_path: str,
+                  out_path: Optional[str] = None,
+                  chunk_size: int = 1 << 24) -> tuple[np.ndarray, dict]:
+    """
+    Parse an ESRI ASCII grid into a float32 array, in chunks of raw text converted with vectorized NumPy parsing.
+    Nodata cells are returned as NaN.
+
+    :param asc_path: path to the ASCII grid
+    :param out_path: optional path to a .npy file. If provided, the grid is parsed into a memory-mapped
+        file at this location, so grids larger than memory can be read.
+    :param chunk_size: number of bytes of text to parse at a time
+    :return: a tuple with the array, and a dictionary of the georeferencing (shape, transform, crs, nodata)
+    """
+    with open(asc_path, 'rb') as file:
+        header, _ = _readAsciiHeader(file)
+        nrows = int(header['nrows'])
+        ncols = int(header['ncols'])
+        cellsize = header['cellsize']
+        nodata = header.get('nodata_value', None)
+
+        # Convert the lower left cell center/corner to the upper left corner
+        xll = header['xllcorner'] if 'xllcorner' in header else header['xllcenter'] - cellsize / 2
+        yll = header['yllcorner'] if 'yllcorner' in header else header['yllcenter'] - cellsize / 2
+
+        if out_path is None:
+            arr = np.empty((nrows, ncols), dtype='float32')
+        else:
+            arr = np.lib.format.open_memmap(out_path, mode='w+', dtype='float32', shape=(nrows, ncols))
+        flat = arr.reshape(-1)
+
+        # Parse the values in chunks, splitting each chunk at the last whitespace character
+        count = 0
+        remainder = b''
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                text = remainder
+            else:
+                text = remainder + chunk
+                split = max(text.rfind(b' '), text.rfind(b'\n'), text.rfind(b'\t'))
+                if split < 0:
+                    remainder = text
+                    continue
+                text, remainder = text[:split], text[split:]
+            if text and not text.isspace():
+                values = np.array(text.split(), dtype='float32')
+                if nodata is not None:
+                    values[values == nodata] = np.nan
+                if count + values.size > arr.size:
+                    raise ValueError(f'Too many values in {asc_path}: expected {arr.size}')
+                flat[count:count + values.size] = values
+                count += values.size
+            if not chunk:
+                break
+
+    if count != arr.size:
+        raise ValueError(f'Incomplete grid in {asc_path}: expected {arr.size} values, got {count}')
+
+    if isinstance(arr, np.memmap):
+        arr.flush()
+
+    # Use the projection file written alongside the grid, if present
+    crs = None
+    prj_path = os.path.splitext(asc_path)[0] + '.prj'
+    if os.path.exists(prj_path):
+        with open(prj_path, 'r') as prj:
+            crs = prj.read().strip() or None
+
+    profile = {
+        'shape': (nrows, ncols),
+        'transform': [cellsize, 0.0, xll, 0.0, -cellsize, yll + nrows * cellsize],
+        'crs': crs,
+        'nodata': nodata
+    }
+
+    return arr, profile
+
+
+def _formatAsciiRows(chunk: np.ndarray, precision: int) -> bytes:
+    """
+    Format a block of grid rows as fixed-width ASCII text in a vectorized way: each value is written right-aligned
+    into a byte matrix, one digit position at a time across the whole block.
+
+    :param chunk: 2D array of values
+    :param precision: number of decimals
+    :return: formatted text (values separated by spaces, one grid row per line)
+    """
+    scaled = np.rint(chunk * 10 ** precision).astype('int64')
+    rows, cols = scaled.shape
+    negative = scaled < 0
+    remaining = np.abs(scaled)
+    n_digits = max(len(str(int(remaining.max()))) if remaining.size else 1, precision + 1)
+
+    # Columns of each value: sign, digits, decimal point (if any), and separator
+    width = n_digits + 2 + (1 if precision else 0)
+    out = np.full((rows, cols, width), ord(' '), dtype='uint8')
+    out[:, -1, -1] = ord('\n')
+
+    pos = width - 2
+    sign_pos = np.full(scaled.shape, pos, dtype='int64')
+    for i in range(n_digits):
+        if precision and i == precision:
+            out[:, :, pos] = ord('.')
+            pos -= 1
+        # Leading zeros stay blank, except the digit before the decimal point
+        visible = (remaining > 0) | (i <= precision)
+        out[:, :, pos] = np.where(visible, (remaining % 10).astype('uint8') + ord('0'), ord(' '))
+        sign_pos = np.where(visible, pos - 1, sign_pos)
+        remaining //= 10
+        pos -= 1
+    np.put_along_axis(out, sign_pos[..., None],
+                      np.where(negative, ord('-'), ord(' ')).astype('uint8')[..., None], axis=-1)
+
+    return out.tobytes()
+
+
+def writeAsciiGrid(out_path: str,
+                   arr: np.ndarray,
+                   lcp_file: Optional[str] = None,
+                   transform=None,
+                   crs=None,
+                   precision: int = 0,
+                   nodata: Union[int, float] = -9999,
+                   chunk_rows: int = 256) -> str:
+    """
+    Write a 2D array as an ESRI ASCII grid with fixed precision. Chunks of rows are formatted with vectorized
+    NumPy operations into fixed-width text, rather than formatting values one at a time.
+
+    The grid is aligned to an LCP file when lcp_file is given: it covers the LCP extent, with a cell size of the LCP
+    extent divided by the array size (e.g., a coarser gridded winds resolution). Otherwise, the transform is used.
+    Read grids back with readAsciiGrid (which can parse them into a memory-mapped array).
+
+    :param out_path: path to the output .asc file
+    :param arr: 2D array of values. NaN and masked values are written as nodata.
+    :param lcp_file: path to the LCP file to align the grid to
+    :param transform: affine transform of the grid (used if lcp_file is None). Cells must be square.
+    :param crs: CRS of the grid, written to a .prj file (defaults to the LCP CRS)
+    :param precision: number of decimals to write (0 writes integers, as required for gridded winds)
+    :param nodata: nodata value
+    :param chunk_rows: number of rows to format at a time
+    :return: path to the output file
+    """
+    arr = np.ma.filled(np.ma.masked_invalid(arr).astype('float64'), nodata)
+    nrows, ncols = arr.shape
+
+    if lcp_file is not None:
+        with rio.open(lcp_file) as src:
+            left, bottom, right, top = src.bounds
+            crs = crs if crs is not None else src.crs
+        cellsize = (right - left) / ncols
+        if not np.isclose(cellsize, (top - bottom) / nrows, rtol=1e-6):
+            raise ValueError(f'Array shape {arr.shape} does not give square cells over the extent of {lcp_file}')
+    elif transform is not None:
+        cellsize = transform.a
+        if not np.isclose(cellsize, -transform.e, rtol=1e-6):
+            raise ValueError('ASCII grids require square cells')
+        left, bottom = transform.c, transform.f + transform.e * nrows
+    else:
+        raise ValueError('Either lcp_file or transform is required')
+
+    tmp_path = f'{out_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as file:
+        file.write(f'ncols {ncols}\n'
+                   f'nrows {nrows}\n'
+                   f'xllcorner {left!r}\n'
+                   f'yllcorner {bottom!r}\n'
+                   f'cellsize {cellsize!r}\n'
+                   f'NODATA_value {nodata}\n'.encode())
+        for row in range(0, nrows, chunk_rows):
+            file.write(_formatAsciiRows(arr[row:row + chunk_rows], precision))
+    os.replace(tmp_path, out_path)
+
+    if crs is not None:
+        with open(os.path.splitext(out_path)[0] + '.prj', 'w') as prj:
+            prj.write(crs.to_wkt() if hasattr(crs, 'to_wkt') else str(crs))
+
+    return out_path
+
+
+def genGriddedWinds(out_dir: str,
+                    scenarios: dict,
+                    lcp_file: str,
+                    precision: int = 0,
+                    max_workers: Optional[int] = None) -> dict[str, tuple[str, str]]:
+    """
+    Write gridded wind speed and direction ASCII grids (e.g., from WindNinja-like arrays) for many scenarios,
+    aligned to an LCP file, using a thread pool across files.
+    The output paths are meant for the gridded_wind_spd_file and gridded_wind_dir_file parameters of genInputFile.
+
+    :param out_dir: path to the output folder
+    :param scenarios: dictionary of scenario names and (wind speed array, wind direction array) tuples
+    :param lcp_file: path to the LCP file to align the grids to
+    :param precision: number of decimals to write (gridded winds must be integer grids, so 0 by default)
+    :param max_workers: number of files to write at the same time. Defaults to the number of CPUs.
+    :return: dictionary of scenario names and (wind speed path, wind direction path) tuples
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = []
+    for name, (wind_speed, wind_direction) in scenarios.items():
+        jobs.append((os.path.join(out_dir, f'{name}_vel.asc'), wind_speed))
+        jobs.append((os.path.join(out_dir, f'{name}_ang.asc'), np.mod(wind_direction, 360)))
+
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        paths = list(executor.map(lambda job: writeAsciiGrid(job[0], job[1], lcp_file=lcp_file, precision=precision),
+                                  jobs))
+
+    return {name: (paths[2 * i], paths[2 * i + 1]) for i, name in enumerate(scenarios)}
+
+
+def sampleIgnitions(lcp_file: str,
+                    n_points: int,
+                    density_path: Optional[str] = None,
+                    seed: Optional[int] = None,
+                    excluded_fbfm: tuple = non_burnable_fbfm,
+                    jitter: bool = True,
+                    block_rows: int = 256) -> np.ndarray:
+    """
+    Sample random ignition points from the cells of an LCP file, weighted by an optional ignition density raster
+    and excluding non-burnable fuels. Sampling is vectorized: points are first allocated to blocks of rows with a
+    multinomial draw on the block weights, then drawn within each block in a single weighted choice.
+
+    :param lcp_file: path to the LCP file
+    :param n_points: number of points to sample
+    :param density_path: path to an ignition density raster (relative weights; resampled to the LCP grid with
+        nearest neighbour if needed). If None, all burnable cells have the same weight.
+    :param seed: random seed, so the same seed always gives the same points
+    :param excluded_fbfm: FBFM codes where ignitions are not placed (non-burnable fuels by default)
+    :param jitter: if True, place points at a random location within their cell, otherwise at the cell center
+    :param block_rows: number of rows read at a time
+    :return: array of (x, y) point coordinates in the LCP coordinate system, in random order
+    """
+    from contextlib import ExitStack
+    from rasterio.windows import Window
+
+    rng = np.random.default_rng(seed)
+    ref = _getLcpProfile(lcp_file)
+    height, width = ref['height'], ref['width']
+    windows = [Window(0, row, width, min(block_rows, height - row)) for row in range(0, height, block_rows)]
+
+    with ExitStack() as stack:
+        lcp = stack.enter_context(rio.open(lcp_file))
+        density = stack.enter_context(_AlignedReader(density_path, ref)) if density_path else None
+
+        def _weights(window) -> np.ndarray:
+            fbfm = lcp.read(4, window=window)
+            if density is None:
+                weights = np.ones(fbfm.shape, dtype='float64')
+            else:
+                weights = _readWindowFloat(density, window).astype('float64')
+                weights[~np.isfinite(weights) | (weights < 0)] = 0
+            weights[np.isin(fbfm, excluded_fbfm) | (fbfm <= 0)] = 0
+            return weights.ravel()
+
+        # Allocate points to blocks of rows, then draw cells within each block
+        block_sums = np.array([_weights(window).sum() for window in windows])
+        if block_sums.sum() <= 0:
+            raise ValueError(f'No cells of {lcp_file} can be ignited')
+        block_counts = rng.multinomial(n_points, block_sums / block_sums.sum())
+
+        rows, cols = [], []
+        for window, count in zip(windows, block_counts):
+            if count == 0:
+                continue
+            weights = _weights(window)
+            cells = rng.choice(weights.size, size=count, p=weights / weights.sum())
+            rows.append(window.row_off + cells // width)
+            cols.append(cells % width)
+
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    offsets = rng.random((2, n_points)) if jitter else np.full((2, n_points), 0.5)
+    xs, ys = ref['transform'] * (cols + offsets[0], rows + offsets[1])
+
+    return np.column_stack([xs, ys])[rng.permutation(n_points)]
+
+
+def _pointShapefileBytes(xy: np.ndarray, ids: np.ndarray) -> tuple[bytes, bytes, bytes]:
+    """
+    Encode points as the .shp, .shx and .dbf contents of a point shapefile, with an integer "Id" field.
+    Records are packed with NumPy structured arrays rather than one record at a time.
+    """
+    import datetime
+    import struct
+
+    n = len(xy)
+    records = np.zeros(n, dtype=[('number', '>i4'), ('length', '>i4'),
+                                 ('type', '<i4'), ('x', '<f8'), ('y', '<f8')])
+    records['number'] = np.arange(1, n + 1)
+    records['length'] = 10
+    records['type'] = 1
+    records['x'], records['y'] = xy[:, 0], xy[:, 1]
+
+    index = np.zeros(n, dtype=[('offset', '>i4'), ('length', '>i4')])
+    index['offset'] = 50 + 14 * np.arange(n)
+    index['length'] = 10
+
+    def _header(n_bytes: int) -> bytes:
+        bbox = (*xy.min(axis=0), *xy.max(axis=0)) if n else (0, 0, 0, 0)
+        return (struct.pack('>7i', 9994, 0, 0, 0, 0, 0, n_bytes // 2) +
+                struct.pack('<2i4d4d', 1000, 1, *bbox, 0, 0, 0, 0))
+
+    # dBASE III table with one numeric field
+    width = 10
+    today = datetime.date.today()
+    dbf_header = (struct.pack('<4BIHH20x', 3, today.year - 1900, today.month, today.day, n, 65, width + 1) +
+                  struct.pack('<11sc4xBB14x', b'Id', b'N', width, 0) + b'\r')
+    values = np.char.rjust(np.asarray(ids, dtype='int64').astype(f'S{width}'), width)
+    dbf_records = np.char.add(b' ', values)
+
+    return (_header(100 + records.nbytes) + records.tobytes(),
+            _header(100 + index.nbytes) + index.tobytes(),
+            dbf_header + dbf_records.tobytes() + b'\x1a')
+
+
+def writeIgnitionShapefile(shp_path: str,
+                           xy: np.ndarray,
+                           ids: Optional[np.ndarray] = None,
+                           crs=None) -> str:
+    """
+    Write points to a point shapefile (.shp, .shx, .dbf and .prj) that can be used as an MTT or Farsite
+    ignition file.
+
+    :param shp_path: path to the output .shp file
+    :param xy: array of (x, y) point coordinates
+    :param ids: values of the "Id" field. Defaults to zeros (as in a single ignition run).
+    :param crs: rasterio CRS (or any CRS definition accepted by rasterio) written to the .prj file
+    :return: path to the shapefile
+    """
+    xy = np.asarray(xy, dtype='float64').reshape(-1, 2)
+    ids = np.zeros(len(xy), dtype='int64') if ids is None else ids
+    base = os.path.splitext(shp_path)[0]
+
+    for ext, data in zip(('.shp', '.shx', '.dbf'), _pointShapefileBytes(xy, ids)):
+        with open(base + ext, 'wb') as file:
+            file.write(data)
+    if crs is not None:
+        with open(base + '.prj', 'w') as file:
+            file.write(rio.crs.CRS.from_user_input(crs).to_wkt(version='WKT1_ESRI'))
+
+    return base + '.shp'
+
+
+def _readDbf(dbf_path: str, fields: Optional[list[str]] = None) -> dict:
+    """
+    Read the columns of a dBASE table in bulk, with NumPy structured arrays rather than one record at a time.
+    Numeric fields without decimals are returned as int64 (blank values as 0), other numeric fields as float64
+    (blank values as NaN), and other field types as stripped strings.
+    """
+    import struct
+
+    with open(dbf_path, 'rb') as file:
+        dbf = file.read()
+    n, header_len, record_len = struct.unpack('<IHH', dbf[4:12])
+    specs, pos = [], 32
+    while dbf[pos:pos + 1] != b'\r':
+        name, kind, width, decimals = struct.unpack('<11sc4xBB14x', dbf[pos:pos + 32])
+        specs.append((name.split(b'\x00')[0].decode(), kind, width, decimals))
+        pos += 32
+    dtype = [('deleted', 'S1')] + [(name, f'S{width}') for name, _, width, _ in specs]
+    table = np.frombuffer(dbf, dtype=np.dtype(dtype), count=n, offset=header_len)
+
+    columns = {}
+    for name, kind, _, decimals in specs:
+        if fields is not None and name not in fields:
+            continue
+        values = np.char.strip(table[name])
+        if kind in (b'N', b'F') and decimals == 0:
+            columns[name] = np.where(values == b'', b'0', values).astype('int64')
+        elif kind in (b'N', b'F'):
+            columns[name] = np.where(values == b'', b'nan', values).astype('float64')
+        else:
+            columns[name] = np.char.decode(values, 'latin-1')
+    for field in fields or []:
+        if field not in columns:
+            raise KeyError(f'Field "{field}" not found in {dbf_path}')
+
+    return columns
+
+
+def readIgnitionShapefile(shp_path: str, field: str = 'Id') -> tuple[np.ndarray, np.ndarray]:
+    """
+    Read the points of a point shapefile, and the values of an integer field, in bulk.
+
+    :param shp_path: path to the point shapefile
+    :param field: name of the integer field to read
+    :return: array of (x, y) point coordinates, and array of field values
+    """
+    import struct
+
+    with open(shp_path, 'rb') as file:
+        data = file.read()
+    if struct.unpack('<i', data[32:36])[0] != 1:
+        raise ValueError(f'Only point shapefiles are supported: {shp_path}')
+    records = np.frombuffer(data, offset=100,
+                            dtype=[('number', '>i4'), ('length', '>i4'), ('type', '<i4'), ('x', '<f8'), ('y', '<f8')])
+    if np.any(records['length'] != 10) or np.any(records['type'] != 1):
+        raise ValueError(f'Unsupported point records in {shp_path}')
+
+    values = _readDbf(os.path.splitext(shp_path)[0] + '.dbf', [field])[field].astype('int64')
+
+    return np.column_stack([records['x'], records['y']]), values
+
+
+def genIgnitionFiles(lcp_file: str,
+                     out_dir: str,
+                     n_runs: int,
+                     points_per_run: int = 1,
+                     density_path: Optional[str] = None,
+                     seed: Optional[int] = None,
+                     single_file: bool = False,
+                     excluded_fbfm: tuple = non_burnable_fbfm,
+                     max_workers: Optional[int] = None,
+                     suppress_messages: bool = False) -> list[str]:
+    """
+    Generate random ignitions for many runs (e.g., for burn probability), sampled with sampleIgnitions.
+    Ignitions are written either as one small shapefile per run ("ignition_{run}.shp", written in a thread pool),
+    or as a single multi-feature shapefile with the run number in the "Id" field, which genIgnitionCommands
+    splits into per-run files when packing the command file.
+
+    :param lcp_file: path to the LCP file
+    :param out_dir: path to the output folder
+    :param n_runs: number of runs
+    :param points_per_run: number of ignition points in each run
+    :param density_path: path to an ignition density raster (see sampleIgnitions)
+    :param seed: random seed, so the same seed always gives the same ignitions
+    :param single_file: if True, write a single "ignitions.shp" file with all runs
+    :param excluded_fbfm: FBFM codes where ignitions are not placed
+    :param max_workers: number of files to write at the same time. Defaults to the number of CPUs.
+    :param suppress_messages: if True, do not print messages from this function
+    :return: list of ignition shapefile paths (one per run, or a single path if single_file is True)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    if not suppress_messages:
+        print(f'\n<<<<< [flammap_cli.py] Generating ignitions for {n_runs} runs >>>>>')
+    os.makedirs(out_dir, exist_ok=True)
+    xy = sampleIgnitions(lcp_file, n_runs * points_per_run, density_path=density_path, seed=seed,
+                         excluded_fbfm=excluded_fbfm)
+    crs = _getLcpProfile(lcp_file)['crs']
+    run_ids = np.repeat(np.arange(n_runs), points_per_run)
+
+    if single_file:
+        paths = [writeIgnitionShapefile(os.path.join(out_dir, 'ignitions.shp'), xy, run_ids, crs)]
+    else:
+        digits = len(str(max(n_runs - 1, 0)))
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+            paths = list(executor.map(
+                lambda run: writeIgnitionShapefile(os.path.join(out_dir, f'ignition_{run:0{digits}d}.shp'),
+                                                   xy[run * points_per_run:(run + 1) * points_per_run],
+                                                   np.full(points_per_run, run), crs),
+                range(n_runs)))
+
+    if not suppress_messages:
+        print(f'{len(paths)} ignition file(s) written to {out_dir}')
+
+    return paths
+
+
+def genIgnitionCommands(out_path: str,
+                        app_select: str,
+                        lcp_file: str,
+                        input_file: str,
+                        ign_files: Union[str, list[str]],
+                        out_dir: str,
+                        barrier_file: Optional[str] = None,
+                        out_type: int = 2,
+                        suppress_messages: bool = False) -> list[list[Union[str, int]]]:
+    """
+    Pack a command file with one run per ignition file. A single multi-feature ignition file from
+    genIgnitionFiles (single_file=True) is split by its "Id" field into per-run shapefiles first.
+
+    :param out_path: path to save the output command file
+    :param app_select: The name of the selected fire modelling application (MTT, TOM or Farsite)
+    :param lcp_file: path to the LCP file
+    :param input_file: path to the input file used for all runs
+    :param ign_files: list of per-run ignition shapefiles, or the path to a single multi-feature ignition file
+    :param out_dir: path to the output folder. Each run writes its outputs to "{out_dir}/{run name}".
+    :param barrier_file: path to the barrier shapefile
+    :param out_type: the output type code passed to the app
+    :param suppress_messages: if True, do not print messages from this function
+    :return: the command file rows
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if isinstance(ign_files, str):
+        xy, run_ids = readIgnitionShapefile(ign_files)
+        prj_path = os.path.splitext(ign_files)[0] + '.prj'
+        crs = None
+        if os.path.exists(prj_path):
+            with open(prj_path) as file:
+                crs = file.read()
+        ign_dir = os.path.join(out_dir, 'ignitions')
+        os.makedirs(ign_dir, exist_ok=True)
+        # Group the points by run
+        order = np.argsort(run_ids, kind='stable')
+        runs, starts = np.unique(run_ids[order], return_index=True)
+        digits = len(str(max(runs.max(), 0)))
+        ign_files = [writeIgnitionShapefile(os.path.join(ign_dir, f'ignition_{run:0{digits}d}.shp'),
+                                            run_xy, np.full(len(run_xy), run), crs)
+                     for run, run_xy in zip(runs, np.split(xy[order], starts[1:]))]
+
+    command_list = []
+    for ign_file in ign_files:
+        run_name = os.path.splitext(os.path.basename(ign_file))[0]
+        command_list.append(genCommandRow(app_select, lcp_file, input_file, os.path.join(out_dir, run_name),
+                                          ign_file=ign_file, barrier_file=barrier_file, out_type=out_type))
+    genCommandFile(out_path, command_list, suppress_messages=suppress_messages)
+
+    return command_list
+
+
+class OutputGrid:
+    """
+    A single model output grid (ASCII or GeoTIFF), exposed as a lazily loaded, memory-mapped float32 array.
+
+    The first access to the array parses the grid into a float32 .npy cache file (nodata as NaN).
+    Later accesses (including from other processes) memory-map the cache directly, as long as the source
+    file is unchanged.
+    """
+    def __init__(self, path: str, switch: Optional[str] = None, cache_dir: Optional[str] = None):
+        self.path = path
+        self.switch = switch
+        cache_root = cache_dir if cache_dir is not None else os.path.dirname(path)
+        self.cache_path = os.path.join(cache_root, f'{os.path.basename(path)}.f32.npy')
+        self._array = None
+        self._profile = None
+
+    def __repr__(self):
+        return f'OutputGrid(switch={self.switch!r}, path={self.path!r})'
+
+    def _sourceKey(self) -> dict:
+        stat = os.stat(self.path)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def _load(self) -> None:
+        meta_path = f'{self.cache_path}.json'
+        meta = _readJson(meta_path)
+        if meta.get('source') == self._sourceKey() and os.path.exists(self.cache_path):
+            self._profile = meta['profile']
+            self._array = np.load(self.cache_path, mmap_mode='r')
+            return
+
+        os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+        tmp_path = f'{self.cache_path}.{os.getpid()}.{threading.get_ident()}.tmp.npy'
+        if self.path.lower().endswith('.asc'):
+            arr, profile = readAsciiGrid(self.path, out_path=tmp_path)
+        else:
+            with rio.open(self.path) as src:
+                arr = np.lib.format.open_memmap(tmp_path, mode='w+', dtype='float32', shape=src.shape)
+                for _, window in src.block_windows(1):
+                    block = src.read(1, window=window).astype('float32')
+                    if src.nodata is not None:
+                        block[block == src.nodata] = np.nan
+                    arr[window.toslices()] = block
+                arr.flush()
+                profile = {
+                    'shape': src.shape,
+                    'transform': list(src.transform)[:6],
+                    'crs': src.crs.to_wkt() if src.crs else None,
+                    'nodata': src.nodata
+                }
+        del arr
+        os.replace(tmp_path, self.cache_path)
+        _writeJson(meta_path, {'source': self._sourceKey(), 'profile': profile})
+
+        self._profile = profile
+        self._array = np.load(self.cache_path, mmap_mode='r')
+
+        return
+
+    @property
+    def array(self) -> np.ndarray:
+        """Read-only memory-mapped float32 array of the grid (nodata as NaN)"""
+        if self._array is None:
+            self._load()
+        return self._array
+
+    @property
+    def profile(self) -> dict:
+        """Georeferencing of the grid: shape, transform (GDAL/Affine order), crs (WKT), and source nodata"""
+        if self._profile is None:
+            self._load()
+        return self._profile
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return tuple(self.profile['shape'])
+
+    @property
+    def transform(self):
+        from rasterio.transform import Affine
+        return Affine(*self.profile['transform'])
+
+    @property
+    def crs(self):
+        from rasterio.crs import CRS
+        return CRS.from_wkt(self.profile['crs']) if self.profile['crs'] else None
+
+
+class RunOutputs:
+    """
+    Mapping of output switch names (e.g., "FLAMELENGTH", "MTT_ARRIVAL", "ARRIVALTIME") to the OutputGrid
+    objects of a model run. Output switch aliases (e.g., "MTTARRIVALTIME") are accepted as keys.
+    """
+    def __init__(self, out_dir: str, out_name: Optional[str] = None, cache_dir: Optional[str] = None):
+        """
+        :param out_dir: folder containing the model outputs
+        :param out_name: base name of the run's outputs (the output path given in the command file).
+            If None, all grids in out_dir are considered.
+        :param cache_dir: folder to store the float32 cache files in. If None, caches are stored next to the grids.
+        """
+        self.out_dir = out_dir
+        self.out_name = out_name
+        self.cache_dir = cache_dir
+        self.grids = {}
+
+        pattern = f'{out_name}*' if out_name else '*'
+        paths = sorted(glob.glob(os.path.join(out_dir, pattern)))
+        for path in paths:
+            ext = os.path.splitext(path)[1].lower()
+            if ext not in output_grid_exts:
+                continue
+            for switch in _matchOutputSwitches(path):
+                # Prefer GeoTIFF outputs when a grid was written in both formats
+                if switch not in self.grids or ext != '.asc':
+                    self.grids[switch] = OutputGrid(path, switch=switch, cache_dir=cache_dir)
+
+    def __repr__(self):
+        return f'RunOutputs({self.out_dir!r}, switches={list(self.grids)})'
+
+    def __contains__(self, switch: str) -> bool:
+        return output_alias_dict.get(switch.upper(), switch.upper()) in self.grids
+
+    def __getitem__(self, switch: str) -> OutputGrid:
+        key = output_alias_dict.get(switch.upper(), switch.upper())
+        if key not in self.grids:
+            raise KeyError(f'Output {switch} not found in {self.out_dir}. Available outputs: {", ".join(self.grids)}')
+        return self.grids[key]
+
+    def __iter__(self):
+        return iter(self.grids)
+
+    def __len__(self) -> int:
+        return len(self.grids)
+
+    def keys(self):
+        return self.grids.keys()
+
+    def items(self):
+        return self.grids.items()
+
+
+def readOutputs(out_dir: str,
+                out_name: Optional[str] = None,
+                cache_dir: Optional[str] = None) -> RunOutputs:
+    """
+    Find the raster outputs of a model run and return them keyed by output switch name.
+    Grids are only parsed when their array is first accessed, and are cached as memory-mapped float32 files,
+    so repeated analyses of the same outputs do not re-parse them.
+
+    Example:
+        outputs = readOutputs(out_dir, 'farsite_testing_output')
+        flame_length = outputs['FLAMELENGTH'].array
+        transform = outputs['FLAMELENGTH'].transform
+
+    :param out_dir: folder containing the model outputs
+    :param out_name: base name of the run's outputs (the output path given in the command file)
+    :param cache_dir: folder to store the float32 cache files in. If None, caches are stored next to the grids.
+    :return: RunOutputs object
+    """
+    return RunOutputs(out_dir, out_name=out_name, cache_dir=cache_dir)
+
+
+def _gatherBytes(data: np.ndarray, starts: np.ndarray, dtype: str) -> np.ndarray:
+    """Read one value of the given dtype at each byte offset of a uint8 buffer"""
+    size = np.dtype(dtype).itemsize
+    return data[starts[:, None] + np.arange(size)].view(dtype).ravel()
+
+
+def _ragged(starts: np.ndarray, counts: np.ndarray, stride: int) -> np.ndarray:
+    """Byte offsets of counts[i] consecutive items of stride bytes starting at starts[i], for all i"""
+    total = int(counts.sum())
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + stride * (np.arange(total) - first)
+
+
+def readShapefileArrays(shp_path: str, fields: Optional[list[str]] = None) -> dict:
+    """
+    Read the geometries of a shapefile into flat coordinate and offset arrays (GeoArrow layout), along with its
+    attribute columns, without building a Python object per feature. Records are located with the .shx index
+    and decoded with vectorized gathers from a memory-mapped .shp file. Only x and y coordinates are read
+    (Z and M values are ignored).
+
+    Feature i is made of the parts (rings, lines, or points) part_offsets[geom_offsets[i]:geom_offsets[i + 1]],
+    and part j is made of the coordinates coords[part_offsets[j]:part_offsets[j + 1]]. Point and multipoint
+    features have one part per feature. Null shapes have no parts.
+
+    :param shp_path: path to the shapefile (point, polyline, polygon or multipoint)
+    :param fields: attribute fields to read. If None, all fields are read.
+    :return: dictionary with the shape type ("shape_type"), (x, y) coordinates ("coords"), part offsets into the
+        coordinates ("part_offsets"), feature offsets into the parts ("geom_offsets"), attribute columns
+        ("attributes"), and CRS WKT from the .prj file ("crs", None if missing)
+    """
+    import struct
+
+    base = os.path.splitext(shp_path)[0]
+    with open(shp_path, 'rb') as file:
+        shape_type = struct.unpack('<i', file.read(100)[32:36])[0]
+    with open(base + '.shx', 'rb') as file:
+        index = np.frombuffer(file.read(), dtype=[('offset', '>i4'), ('length', '>i4')], offset=100)
+
+    data = np.memmap(shp_path, dtype='uint8', mode='r')
+    content = index['offset'].astype('int64') * 2 + 8
+    n = len(index)
+    if n:
+        record_types = _gatherBytes(data, content, '<i4')
+    else:
+        record_types = np.zeros(0, dtype='int32')
+    null = record_types == 0
+    base_type = shape_type % 10
+
+    if base_type == 1:
+        # Points: x and y follow the shape type
+        counts = np.where(null, 0, 1)
+        coords = np.column_stack([_gatherBytes(data, content[~null] + 4, '<f8'),
+                                  _gatherBytes(data, content[~null] + 12, '<f8')])
+        part_counts = counts
+        part_offsets = np.r_[0, np.cumsum(counts)]
+    elif base_type in (3, 5, 8):
+        # Polylines and polygons: bounding box, number of parts, number of points, parts, points
+        # Multipoints: bounding box, number of points, points
+        valid = content[~null]
+        if base_type == 8:
+            n_parts = np.ones(len(valid), dtype='int64')
+            n_points = _gatherBytes(data, valid + 36, '<i4').astype('int64')
+            point_start = valid + 40
+            parts = np.zeros(len(valid), dtype='int64')
+        else:
+            n_parts = _gatherBytes(data, valid + 36, '<i4').astype('int64')
+            n_points = _gatherBytes(data, valid + 40, '<i4').astype('int64')
+            point_start = valid + 44 + 4 * n_parts
+            parts = _gatherBytes(data, _ragged(valid + 44, n_parts, 4), '<i4').astype('int64')
+        point_bytes = _ragged(point_start, n_points, 16)
+        coords = np.column_stack([_gatherBytes(data, point_bytes, '<f8'), _gatherBytes(data, point_bytes + 8, '<f8')])
+        # Convert the per-record part starts to offsets into the flat coordinates
+        point_base = np.repeat(np.cumsum(n_points) - n_points, n_parts)
+        part_offsets = np.r_[parts + point_base, n_points.sum()]
+        part_counts = np.zeros(n, dtype='int64')
+        part_counts[~null] = n_parts
+    else:
+        raise ValueError(f'Unsupported shape type {shape_type} in {shp_path}')
+
+    crs = None
+    if os.path.exists(base + '.prj'):
+        with open(base + '.prj', 'r') as prj:
+            crs = prj.read().strip() or None
+
+    return {
+        'shape_type': shape_type,
+        'coords': np.ascontiguousarray(coords, dtype='float64'),
+        'part_offsets': part_offsets.astype('int64'),
+        'geom_offsets': np.r_[0, np.cumsum(part_counts)].astype('int64'),
+        'attributes': _readDbf(base + '.dbf', fields) if os.path.exists(base + '.dbf') else {},
+        'crs': crs
+    }
+
+
+def readFarsitePerimeters(shp_paths: Union[str, list[str]],
+                          time_field: Optional[str] = None) -> dict:
+    """
+    Read the FARSITEPERIMETERS (or FARSITESPOTFIRES) shapefiles of one or many runs into one set of flat arrays
+    (see readShapefileArrays), with a run index and a timestep per feature.
+
+    :param shp_paths: path, or list of paths, to the shapefiles (one per run)
+    :param time_field: attribute holding the elapsed time of each feature. If None, the first field whose name
+        starts with "elapsed" (case insensitive) is used, or the feature order if there is none.
+    :return: dictionary of readShapefileArrays arrays concatenated over the runs, plus the run index ("run"),
+        the elapsed time ("time") and the timestep index within the run ("timestep") of each feature.
+        Attributes missing from some runs are filled with NaN (numeric) or empty strings.
+    """
+    if isinstance(shp_paths, str):
+        shp_paths = [shp_paths]
+
+    runs = [readShapefileArrays(path) for path in shp_paths]
+    coords, part_offsets, geom_offsets, run_idx, times, timesteps = [], [], [], [], [], []
+    n_points = n_parts = 0
+    for run, arrays in enumerate(runs):
+        n_features = len(arrays['geom_offsets']) - 1
+        coords.append(arrays['coords'])
+        part_offsets.append(arrays['part_offsets'][:-1] + n_points)
+        geom_offsets.append(arrays['geom_offsets'][:-1] + n_parts)
+        n_points += len(arrays['coords'])
+        n_parts += len(arrays['part_offsets']) - 1
+        run_idx.append(np.full(n_features, run, dtype='int64'))
+        timesteps.append(np.arange(n_features))
+
+        attributes = arrays['attributes']
+        field = time_field or next((name for name in attributes if name.lower().startswith('elapsed')), None)
+        if field is not None and field not in attributes:
+            raise KeyError(f'Field "{field}" not found in {shp_paths[run]}')
+        times.append(attributes[field].astype('float64') if field is not None
+                     else np.arange(n_features, dtype='float64'))
+
+    # Union of the attribute columns of all runs
+    attributes = {}
+    names = list(dict.fromkeys(name for arrays in runs for name in arrays['attributes']))
+    for name in names:
+        columns = []
+        for arrays in runs:
+            n_features = len(arrays['geom_offsets']) - 1
+            column = arrays['attributes'].get(name)
+            if column is None:
+                column = np.full(n_features, np.nan)
+            columns.append(column)
+        if all(column.dtype.kind in 'iuf' for column in columns):
+            attributes[name] = np.concatenate(columns)
+        else:
+            attributes[name] = np.concatenate([column.astype(str) if column.dtype.kind in 'U' else
+                                               np.where(np.isnan(column), '', column.astype(str))
+                                               for column in columns])
+
+    return {
+        'shape_type': runs[0]['shape_type'] if runs else 0,
+        'coords': np.concatenate(coords) if coords else np.zeros((0, 2)),
+        'part_offsets': np.r_[np.concatenate(part_offsets) if part_offsets else [], n_points].astype('int64'),
+        'geom_offsets': np.r_[np.concatenate(geom_offsets) if geom_offsets else [], n_parts].astype('int64'),
+        'attributes': attributes,
+        'crs': runs[0]['crs'] if runs else None,
+        'run': np.concatenate(run_idx) if run_idx else np.zeros(0, dtype='int64'),
+        'time': np.concatenate(times) if times else np.zeros(0),
+        'timestep': np.concatenate(timesteps) if timesteps else np.zeros(0, dtype='int64')
+    }
+
+
+def perimeterStats(perimeters: dict) -> dict:
+    """
+    Compute per-feature statistics of perimeters read with readFarsitePerimeters, vectorized over all features
+    and runs: enclosed area (parts are treated as closed rings; holes are subtracted when they are oriented
+    opposite to the outer rings, as in shapefiles), perimeter length, and, within each run, the growth rate, the
+    spread distance (farthest vertex from the centroid of the run's first perimeter) and the spread rate.
+
+    :param perimeters: dictionary of arrays from readFarsitePerimeters
+    :return: dictionary of per-feature arrays: run, time, area, length, growth_rate (area per time unit),
+        spread_distance and spread_rate (distance per time unit). Rates are NaN for the first feature of a run.
+    """
+    coords = perimeters['coords']
+    part_offsets = perimeters['part_offsets']
+    geom_offsets = perimeters['geom_offsets']
+    run = perimeters['run']
+    time = perimeters['time']
+    n_features = len(geom_offsets) - 1
+    n_parts = len(part_offsets) - 1
+
+    # Each vertex is joined to the next vertex of its part (the last vertex wraps around to the first)
+    part_counts = np.diff(part_offsets)
+    part_of_vertex = np.repeat(np.arange(n_parts), part_counts)
+    idx = np.arange(len(coords))
+    nxt = np.where(idx == part_offsets[1:][part_of_vertex] - 1, part_offsets[:-1][part_of_vertex], idx + 1)
+    x, y = coords[:, 0], coords[:, 1]
+    cross = x * y[nxt] - x[nxt] * y
+    edge = np.hypot(x[nxt] - x, y[nxt] - y)
+
+    part_features = np.repeat(np.arange(n_features), np.diff(geom_offsets))
+    feature_of_vertex = part_features[part_of_vertex]
+    area = np.abs(np.bincount(feature_of_vertex, weights=cross, minlength=n_features) / 2)
+    length = np.bincount(feature_of_vertex, weights=edge, minlength=n_features)
+
+    # Centroid of the vertices of the first feature of each run, used as the origin of spread
+    first_feature = np.r_[True, run[1:] != run[:-1]] if n_features else np.zeros(0, dtype=bool)
+    run_group = np.cumsum(first_feature) - 1
+    n_vertices = np.bincount(feature_of_vertex, minlength=n_features)
+    sum_x = np.bincount(feature_of_vertex, weights=x, minlength=n_features)
+    sum_y = np.bincount(feature_of_vertex, weights=y, minlength=n_features)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        origin_x = (sum_x / n_vertices)[first_feature][run_group]
+        origin_y = (sum_y / n_vertices)[first_feature][run_group]
+    distance = np.hypot(x - origin_x[feature_of_vertex], y - origin_y[feature_of_vertex])
+    spread_distance = np.full(n_features, np.nan)
+    has_vertices = n_vertices > 0
+    if has_vertices.any():
+        starts = (np.cumsum(n_vertices) - n_vertices)[has_vertices]
+        spread_distance[has_vertices] = np.maximum.reduceat(distance, starts)
+
+    def _rate(values: np.ndarray) -> np.ndarray:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rate = np.r_[np.nan, np.diff(values) / np.diff(time)] if n_features else np.zeros(0)
+        rate[first_feature] = np.nan
+        return rate
+
+    return {
+        'run': run,
+        'time': time,
+        'area': area,
+        'length': length,
+        'growth_rate': _rate(area),
+        'spread_distance': spread_distance,
+        'spread_rate': _rate(spread_distance)
+    }
+
+
+def _getLcpProfile(lcp_file: str) -> dict:
+    """
+    Get the grid definition (shape, transform, crs) of an LCP file, used to align outputs to the landscape.
+    """
+    with rio.open(lcp_file) as src:
+        return {'height': src.height, 'width': src.width, 'transform': src.transform, 'crs': src.crs}
+
+
+class _AlignedReader:
+    """
+    Context manager that opens a raster and exposes it on the grid of a reference profile (resampling with
+    nearest neighbour when the grids differ), so windows can be read in the reference grid coordinates.
+    """
+    def __init__(self, path: str, ref_profile: dict):
+        self.path = path
+        self.ref_profile = ref_profile
+        self._src = None
+        self._vrt = None
+
+    def __enter__(self):
+        from rasterio.vrt import WarpedVRT
+        from rasterio.enums import Resampling
+
+        self._src = rio.open(self.path)
+        ref = self.ref_profile
+        if (self._src.shape == (ref['height'], ref['width']) and
+                self._src.transform.almost_equals(ref['transform'])):
+            return self._src
+
+        self._vrt = WarpedVRT(self._src,
+                              src_crs=self._src.crs or ref['crs'],
+                              crs=ref['crs'],
+                              transform=ref['transform'],
+                              width=ref['width'],
+                              height=ref['height'],
+                              resampling=Resampling.nearest)
+        return self._vrt
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._vrt is not None:
+            self._vrt.close()
+        self._src.close()
+
+
+def _readWindowFloat(src, window) -> np.ndarray:
+    """Read a window of band 1 as float32, with nodata as NaN"""
+    arr = src.read(1, window=window).astype('float32')
+    if src.nodata is not None:
+        arr[arr == src.nodata] = np.nan
+    return arr
+
+
+def _histogramQuantiles(counts: np.ndarray, edges: np.ndarray, quantiles: tuple) -> np.ndarray:
+    """
+    Estimate per-cell quantiles from per-cell histograms, interpolating linearly within bins.
+
+    :param counts: array of bin counts with shape (bins, rows, cols)
+    :param edges: array of bin edges with length bins + 1
+    :param quantiles: quantiles to estimate (0-1)
+    :return: float32 array with shape (len(quantiles), rows, cols). Cells without observations are NaN.
+    """
+    cum = np.cumsum(counts, axis=0, dtype='float64')
+    total = cum[-1]
+    out = np.full((len(quantiles),) + total.shape, np.nan, dtype='float32')
+    valid = total > 0
+    for i, q in enumerate(quantiles):
+        target = q * total
+        idx = np.argmax(cum >= target[None], axis=0)
+        prev = np.where(idx > 0, np.take_along_axis(cum, np.maximum(idx - 1, 0)[None], axis=0)[0], 0)
+        in_bin = np.take_along_axis(counts, idx[None], axis=0)[0].astype('float64')
+        frac = np.divide(target - prev, in_bin, out=np.zeros_like(target), where=in_bin > 0)
+        value = edges[idx] + np.clip(frac, 0, 1) * (edges[idx + 1] - edges[idx])
+        out[i][valid] = value[valid]
+
+    return out
+
+
+def _readNpzArrayInto(npz_path: str, name: str, out: np.ndarray, chunk_items: int = 1 << 24) -> None:
+    """
+    Copy an array of an .npz file into an existing (e.g., memory-mapped) array of the same shape, in chunks,
+    without loading the whole array in memory.
+    """
+    import zipfile
+
+    with zipfile.ZipFile(npz_path) as archive, archive.open(f'{name}.npy') as file:
+        version = np.lib.format.read_magic(file)
+        read_header = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                       else np.lib.format.read_array_header_2_0)
+        shape, fortran_order, dtype = read_header(file)
+        if tuple(shape) != out.shape or fortran_order:
+            raise ValueError(f'Array {name} of {npz_path} has shape {shape}, expected {out.shape}')
+        flat = out.reshape(-1)
+        for start in range(0, flat.size, chunk_items):
+            n = min(chunk_items, flat.size - start)
+            flat[start:start + n] = np.frombuffer(file.read(n * dtype.itemsize), dtype=dtype, count=n)
+
+    return
+
+
+class EnsembleReducer:
+    """
+    Streaming reducer that accumulates per-cell statistics across an ensemble of model runs (e.g., MTT or Farsite
+    burn probability runs), aligned to the grid of the source LCP.
+
+    Runs are consumed one at a time as they finish, with windowed reads, into fixed-size accumulators (their size
+    depends on the landscape and bin counts, not on the number of runs):
+        * burned counts (burn probability)
+        * flame length bin histograms, and flame length sums (conditional flame length)
+        * fireline intensity sums and maxima
+        * arrival time histograms, used as a per-cell sketch to estimate arrival time percentiles
+    Accumulators are memory-mapped files (in accumulator_dir), so only the windows being updated are resident,
+    and counts are stored as uint16 until the number of runs requires uint32. Several threads can update the
+    reducer at the same time: rasters are read outside the lock, and only the accumulation of each window is
+    serialized.
+
+    Accumulators are checkpointed to disk, so a reducer can be resumed after a crash with EnsembleReducer.load().
+    Runs that were already reduced are skipped by run_id.
+    """
+    # Accumulators holding counts (bounded by the number of runs), and the other accumulators
+    count_arrays = ('burned', 'flame_hist', 'arrival_hist')
+    value_arrays = ('flame_sum', 'intensity_sum', 'intensity_max')
+
+    def __init__(self,
+                 lcp_file: str,
+                 checkpoint_path: Optional[str] = None,
+                 flame_bins: Union[list, tuple] = default_flame_bins,
+                 arrival_bins: Optional[Union[list, tuple, np.ndarray]] = None,
+                 arrival_quantiles: Union[list, tuple] = (0.1, 0.5, 0.9),
+                 checkpoint_every: int = 50,
+                 block_rows: int = 256,
+                 accumulator_dir: Optional[str] = None):
+        """
+        :param lcp_file: path to the source LCP file. Outputs are aligned to its grid.
+        :param checkpoint_path: path to the checkpoint file (.npz). If None, accumulators are not checkpointed.
+        :param flame_bins: lower edges of the flame length classes (meters). The last class is open-ended.
+        :param arrival_bins: edges of the arrival time sketch bins (minutes). Defaults to 48 log-spaced bins
+            between 1 minute and 14 days.
+        :param arrival_quantiles: arrival time quantiles (0-1) to write
+        :param checkpoint_every: number of runs between automatic checkpoints
+        :param block_rows: number of rows to read per window
+        :param accumulator_dir: folder of the memory-mapped accumulator files (working copies, recreated by every
+            reducer). Defaults to "{checkpoint path without extension}_accumulators", or to a temporary folder
+            (removed by close()) if there is no checkpoint.
+        """
+        import tempfile
+
+        self.lcp_file = lcp_file
+        self.checkpoint_path = checkpoint_path
+        self.flame_bins = np.asarray(flame_bins, dtype='float32')
+        if arrival_bins is None:
+            arrival_bins = np.concatenate([[0], np.geomspace(1, 20160, 48)])
+        self.arrival_bins = np.asarray(arrival_bins, dtype='float64')
+        self.arrival_quantiles = tuple(arrival_quantiles)
+        self.checkpoint_every = checkpoint_every
+        self.block_rows = block_rows
+        self.profile = _getLcpProfile(lcp_file)
+        self._cond = threading.Condition()
+        self._in_progress = set()
+        self._pausing = 0
+
+        self._temp_dir = None
+        if accumulator_dir is None:
+            if checkpoint_path is not None:
+                accumulator_dir = f'{os.path.splitext(checkpoint_path)[0]}_accumulators'
+            else:
+                accumulator_dir = self._temp_dir = tempfile.mkdtemp(prefix='ensemble_')
+        self.accumulator_dir = accumulator_dir
+        os.makedirs(accumulator_dir, exist_ok=True)
+
+        shape = (self.profile['height'], self.profile['width'])
+        self.n_runs = 0
+        self.run_ids = set()
+        self._shapes = {
+            'burned': shape,
+            'flame_hist': (len(self.flame_bins),) + shape,
+            'arrival_hist': (len(self.arrival_bins) - 1,) + shape,
+            'flame_sum': shape,
+            'intensity_sum': shape,
+            'intensity_max': shape
+        }
+        self.count_dtype = 'uint16'
+        for name in self.count_arrays:
+            setattr(self, name, self._openAccumulator(name, self.count_dtype))
+        for name in self.value_arrays:
+            setattr(self, name, self._openAccumulator(name, 'float32'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _openAccumulator(self, name: str, dtype: str) -> np.memmap:
+        """Create a zero-filled memory-mapped accumulator file (sparse on most filesystems)"""
+        path = os.path.join(self.accumulator_dir, f'{name}.{dtype}.npy')
+        return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=self._shapes[name])
+
+    def _promote(self, n_runs: int) -> None:
+        """Switch the count accumulators to uint32 before n_runs runs could overflow uint16 (call with the lock)"""
+        if self.count_dtype == 'uint32' or n_runs < np.iinfo('uint16').max:
+            return
+
+        for name in self.count_arrays:
+            old = getattr(self, name)
+            new = self._openAccumulator(name, 'uint32')
+            rows = self._shapes[name][-2]
+            for row in range(0, rows, self.block_rows):
+                new[..., row:row + self.block_rows, :] = old[..., row:row + self.block_rows, :]
+            setattr(self, name, new)
+            path = old.filename
+            del old
+            os.remove(path)
+        self.count_dtype = 'uint32'
+
+        return
+
+    def _quiesce(self):
+        """
+        Context manager holding the lock once no run is being accumulated (new runs wait), so the accumulators
+        are consistent with n_runs and run_ids.
+        """
+        from contextlib import contextmanager
+
+        @contextmanager
+        def _quiesce():
+            with self._cond:
+                self._pausing += 1
+                try:
+                    self._cond.wait_for(lambda: not self._in_progress)
+                    yield
+                finally:
+                    self._pausing -= 1
+                    self._cond.notify_all()
+
+        return _quiesce()
+
+    @classmethod
+    def load(cls, checkpoint_path: str, lcp_file: str, **kwargs) -> 'EnsembleReducer':
+        """
+        Resume a reducer from a checkpoint file. If the checkpoint does not exist, a new reducer is returned.
+        Accumulators are copied from the checkpoint in chunks, so they are never fully loaded in memory.
+
+        :param checkpoint_path: path to the checkpoint file (.npz)
+        :param lcp_file: path to the source LCP file
+        :param kwargs: other EnsembleReducer arguments (bins are taken from the checkpoint)
+        :return: EnsembleReducer object
+        """
+        if not os.path.exists(checkpoint_path):
+            return cls(lcp_file, checkpoint_path=checkpoint_path, **kwargs)
+
+        with np.load(checkpoint_path, allow_pickle=False) as data:
+            kwargs.update({
+                'flame_bins': data['flame_bins'],
+                'arrival_bins': data['arrival_bins'],
+                'arrival_quantiles': tuple(data['arrival_quantiles'])
+            })
+            n_runs = int(data['n_runs'])
+            run_ids = set(data['run_ids'].tolist())
+
+        reducer = cls(lcp_file, checkpoint_path=checkpoint_path, **kwargs)
+        reducer.n_runs = n_runs
+        reducer.run_ids = run_ids
+        reducer._promote(n_runs)
+        try:
+            for name in cls.count_arrays + cls.value_arrays:
+                _readNpzArrayInto(checkpoint_path, name, getattr(reducer, name))
+        except ValueError:
+            reducer.close()
+            raise ValueError(f'Checkpoint {checkpoint_path} does not match the grid of {lcp_file}')
+
+        return reducer
+
+    def checkpoint(self) -> None:
+        """
+        Write the accumulators to the checkpoint file (atomically replacing the previous checkpoint). The
+        accumulators are streamed to the file in chunks; runs wait until the checkpoint is written.
+        """
+        if self.checkpoint_path is None:
+            return
+
+        with self._quiesce():
+            tmp_path = f'{self.checkpoint_path}.{os.getpid()}.{threading.get_ident()}.tmp.npz'
+            np.savez(tmp_path,
+                     n_runs=self.n_runs,
+                     run_ids=np.array(sorted(self.run_ids), dtype='U'),
+                     flame_bins=self.flame_bins,
+                     arrival_bins=self.arrival_bins,
+                     arrival_quantiles=np.array(self.arrival_quantiles),
+                     **{name: getattr(self, name) for name in self.count_arrays + self.value_arrays})
+            os.replace(tmp_path, self.checkpoint_path)
+
+        return
+
+    def close(self) -> None:
+        """Flush the accumulators, and remove them if they are in a temporary folder"""
+        import shutil
+
+        with self._quiesce():
+            for name in self.count_arrays + self.value_arrays:
+                getattr(self, name).flush()
+            if self._temp_dir is not None:
+                for name in self.count_arrays + self.value_arrays:
+                    setattr(self, name, None)
+                shutil.rmtree(self._temp_dir, ignore_errors=True)
+                self._temp_dir = None
+
+        return
+
+    def update(self,
+               outputs: Union[RunOutputs, dict],
+               run_id: Optional[str] = None) -> bool:
+        """
+        Add the outputs of a finished run to the accumulators. Safe to call from several threads.
+
+        A cell is counted as burned where it has an arrival time (MTT_ARRIVAL/ARRIVALTIME), or, if the run has
+        no arrival time output, where the flame length is greater than 0.
+
+        :param outputs: RunOutputs object (see readOutputs), or dictionary of output switch names and raster paths
+        :param run_id: unique identifier of the run, used to skip runs that were already reduced.
+            Defaults to the path of the first output.
+        :return: True if the run was added, False if it was already reduced
+        """
+        from contextlib import ExitStack
+        from rasterio.windows import Window
+
+        paths = {switch: getattr(grid, 'path', grid) for switch, grid in outputs.items()}
+        if run_id is None:
+            run_id = next(iter(paths.values()), '')
+
+        def _first(*switches):
+            return next((paths[s] for s in switches if s in paths), None)
+
+        flame_path = _first('FLAMELENGTH')
+        intensity_path = _first('INTENSITY', 'MTT_INTENSITY')
+        arrival_path = _first('MTT_ARRIVAL', 'ARRIVALTIME')
+        if flame_path is None and arrival_path is None:
+            raise ValueError(f'Run {run_id} has no FLAMELENGTH or arrival time output')
+
+        height, width = self.profile['height'], self.profile['width']
+        n_flame = len(self.flame_bins)
+        n_arrival = len(self.arrival_bins) - 1
+
+        with self._cond:
+            self._cond.wait_for(lambda: not self._pausing)
+            if run_id in self.run_ids or run_id in self._in_progress:
+                return False
+            self._in_progress.add(run_id)
+            self._promote(self.n_runs + len(self._in_progress))
+
+        added = False
+        try:
+            with ExitStack() as stack:
+                flame_src = stack.enter_context(_AlignedReader(flame_path, self.profile)) if flame_path else None
+                intensity_src = (stack.enter_context(_AlignedReader(intensity_path, self.profile))
+                                 if intensity_path else None)
+                arrival_src = stack.enter_context(_AlignedReader(arrival_path, self.profile)) if arrival_path else None
+
+                for row in range(0, height, self.block_rows):
+                    rows = min(self.block_rows, height - row)
+                    window = Window(0, row, width, rows)
+                    block = np.s_[row:row + rows, :]
+
+                    # Read and bin the window outside the lock
+                    arrival = _readWindowFloat(arrival_src, window) if arrival_src else None
+                    flame = _readWindowFloat(flame_src, window) if flame_src else None
+                    if arrival is not None:
+                        burned = np.isfinite(arrival) & (arrival >= 0)
+                    else:
+                        burned = np.isfinite(flame) & (flame > 0)
+                    if not burned.any():
+                        continue
+                    burned_rows, burned_cols = np.nonzero(burned)
+                    burned_rows += row
+                    fl = flame_idx = fi = arrival_idx = None
+                    if flame is not None:
+                        fl = np.where(burned & np.isfinite(flame), flame, 0)
+                        flame_idx = np.clip(np.searchsorted(self.flame_bins, fl[burned], side='right') - 1,
+                                            0, n_flame - 1)
+                    if intensity_src is not None:
+                        intensity = _readWindowFloat(intensity_src, window)
+                        fi = np.where(burned & np.isfinite(intensity), intensity, 0)
+                    if arrival is not None:
+                        arrival_idx = np.clip(np.searchsorted(self.arrival_bins, arrival[burned], side='right') - 1,
+                                              0, n_arrival - 1)
+
+                    # Accumulate the window. Each burned cell falls in exactly one bin, so the histograms are
+                    # incremented with fancy indexing (no repeated indices)
+                    with self._cond:
+                        self.burned[block] += burned
+                        if fl is not None:
+                            self.flame_sum[block] += fl
+                            self.flame_hist[flame_idx, burned_rows, burned_cols] += 1
+                        if fi is not None:
+                            self.intensity_sum[block] += fi
+                            np.maximum(self.intensity_max[block], fi, out=self.intensity_max[block])
+                        if arrival_idx is not None:
+                            self.arrival_hist[arrival_idx, burned_rows, burned_cols] += 1
+            added = True
+        finally:
+            with self._cond:
+                self._in_progress.discard(run_id)
+                if added:
+                    self.n_runs += 1
+                    self.run_ids.add(run_id)
+                self._cond.notify_all()
+                do_checkpoint = added and self.checkpoint_every and self.n_runs % self.checkpoint_every == 0
+
+        if do_checkpoint:
+            self.checkpoint()
+
+        return True
+
+    def write(self, out_dir: str, prefix: str = 'ensemble') -> dict[str, str]:
+        """
+        Write the ensemble results as compressed, tiled GeoTIFFs aligned to the source LCP:
+            * {prefix}_BP.tif: burn probability
+            * {prefix}_CFL.tif: conditional (mean, given burning) flame length
+            * {prefix}_FLP.tif: conditional flame length class probabilities (one band per class)
+            * {prefix}_FI.tif: conditional mean and maximum fireline intensity (2 bands)
+            * {prefix}_ARRIVAL.tif: arrival time percentiles (one band per quantile)
+
+        :param out_dir: path to the output folder
+        :param prefix: prefix of the output file names
+        :return: dictionary of output names and paths
+        """
+        from rasterio.windows import Window
+
+        os.makedirs(out_dir, exist_ok=True)
+        height, width = self.profile['height'], self.profile['width']
+        n_runs = max(self.n_runs, 1)
+        flame_desc = [f'FL_{lo:g}-{hi:g}' for lo, hi in zip(self.flame_bins[:-1], self.flame_bins[1:])]
+        flame_desc.append(f'FL_{self.flame_bins[-1]:g}+')
+        outputs = {
+            'BP': ['burn_probability'],
+            'CFL': ['conditional_flame_length'],
+            'FLP': flame_desc,
+            'FI': ['mean_intensity', 'max_intensity'],
+            'ARRIVAL': [f'arrival_p{q * 100:g}' for q in self.arrival_quantiles]
+        }
+        out_meta = {
+            'driver': 'GTiff',
+            'height': height,
+            'width': width,
+            'dtype': 'float32',
+            'nodata': np.nan,
+            'crs': self.profile['crs'],
+            'transform': self.profile['transform'],
+            'compress': 'DEFLATE',
+            'predictor': 3,
+            'tiled': True,
+            'blockxsize': 128,
+            'blockysize': 128,
+            'BIGTIFF': 'IF_SAFER'
+        }
+
+        # Rows per window, bounded so the float64 cumulative arrival histograms of a window stay near 256 MB
+        n_arrival = len(self.arrival_bins) - 1
+        block_rows = max(1, min(self.block_rows, (256 * 1024 ** 2) // (8 * n_arrival * width)))
+
+        paths = {}
+        with self._quiesce():
+            dsts = {}
+            try:
+                for name, band_names in outputs.items():
+                    paths[name] = os.path.join(out_dir, f'{prefix}_{name}.tif')
+                    dsts[name] = rio.open(paths[name], 'w', count=len(band_names), **out_meta)
+                    for band, desc in enumerate(band_names, start=1):
+                        dsts[name].set_band_description(band, desc)
+                    dsts[name].update_tags(n_runs=self.n_runs)
+
+                for row in range(0, height, block_rows):
+                    rows = min(block_rows, height - row)
+                    window = Window(0, row, width, rows)
+                    block = np.s_[row:row + rows, :]
+                    burned = self.burned[block].astype('float32')
+                    has_burned = burned > 0
+
+                    def _conditional(values):
+                        return np.divide(values, burned, out=np.full(burned.shape, np.nan, dtype='float32'),
+                                         where=has_burned)
+
+                    dsts['BP'].write(burned / n_runs, 1, window=window)
+                    dsts['CFL'].write(_conditional(self.flame_sum[block]), 1, window=window)
+                    dsts['FLP'].write(np.stack([_conditional(self.flame_hist[i][block].astype('float32'))
+                                                for i in range(len(self.flame_bins))]), window=window)
+                    dsts['FI'].write(_conditional(self.intensity_sum[block]), 1, window=window)
+                    dsts['FI'].write(np.where(has_burned, self.intensity_max[block], np.nan), 2, window=window)
+                    dsts['ARRIVAL'].write(_histogramQuantiles(self.arrival_hist[:, row:row + rows, :],
+                                                              self.arrival_bins,
+                                                              self.arrival_quantiles), window=window)
+            finally:
+                for dst in dsts.values():
+                    dst.close()
+
+        return paths
+
+
+def compressOutputs(outputs: RunOutputs,
+                    results: Optional[dict] = None,
+                    compress: str = 'DEFLATE',
+                    cog: bool = True,
+                    delete_source: bool = True) -> dict:
+    """
+    Post-processing step that converts a run's ASCII grid outputs to compressed GeoTIFFs (Cloud-Optimized
+    GeoTIFFs when cog is True).
+
+    :param outputs: RunOutputs object of the run
+    :param results: results of the previous post-processing steps (unused)
+    :param compress: GDAL compression method
+    :param cog: if True, write Cloud-Optimized GeoTIFFs, otherwise tiled GeoTIFFs
+    :param delete_source: if True, delete the ASCII grids (and their .prj files) after conversion
+    :return: dictionary with the converted output paths ("compressed") and bytes saved ("bytes_saved")
+    """
+    from rasterio.shutil import copy as rio_copy
+
+    converted = {}
+    sources = {}
+    bytes_saved = 0
+    for switch, grid in outputs.items():
+        if not grid.path.lower().endswith('.asc'):
+            continue
+        tif_path = os.path.splitext(grid.path)[0] + '.tif'
+        # Grids shared by several output switches are only converted once
+        if grid.path in sources:
+            converted[switch] = grid.path = tif_path
+            continue
+        sources[grid.path] = tif_path
+        if cog:
+            rio_copy(grid.path, tif_path, driver='COG', compress=compress)
+        else:
+            rio_copy(grid.path, tif_path, driver='GTiff', compress=compress, tiled=True)
+        if delete_source:
+            bytes_saved += os.path.getsize(grid.path) - os.path.getsize(tif_path)
+            os.remove(grid.path)
+            prj_path = os.path.splitext(grid.path)[0] + '.prj'
+            if os.path.exists(prj_path):
+                os.remove(prj_path)
+        converted[switch] = tif_path
+        grid.path = tif_path
+
+    return {'compressed': converted, 'bytes_saved': bytes_saved}
+
+
+def summarizeOutputs(outputs: RunOutputs,
+                     results: Optional[dict] = None,
+                     switches: Optional[list[str]] = None) -> dict:
+    """
+    Post-processing step that computes summary statistics of a run's raster outputs, reading them block by block.
+    Statistics are computed over valid (not nodata) cells: the number of valid cells, the number of cells > 0
+    (e.g., burned cells for flame length), the mean and the maximum.
+
+    :param outputs: RunOutputs object of the run
+    :param results: results of the previous post-processing steps (unused)
+    :param switches: output switches to summarize. If None, all outputs are summarized.
+    :return: dictionary with the statistics of each output switch ("summary")
+    """
+    summary = {}
+    for switch, grid in outputs.items():
+        if switches is not None and switch not in switches:
+            continue
+        count = 0
+        positive = 0
+        total = 0.0
+        maximum = None
+        with rio.open(grid.path) as src:
+            for _, window in src.block_windows(1):
+                arr = _readWindowFloat(src, window)
+                valid = arr[np.isfinite(arr)]
+                if valid.size == 0:
+                    continue
+                count += valid.size
+                positive += int((valid > 0).sum())
+                total += float(valid.sum(dtype='float64'))
+                block_max = float(valid.max())
+                maximum = block_max if maximum is None else max(maximum, block_max)
+            cell_area = abs(src.transform.a * src.transform.e)
+        summary[switch] = {
+            'count': count,
+            'positive': positive,
+            'positive_area': positive * cell_area,
+            'mean': total / count if count else None,
+            'max': maximum
+        }
+
+    return {'summary': summary}
+
+
+def deleteOutputs(outputs: RunOutputs,
+                  results: Optional[dict] = None,
+                  keep: Optional[list[str]] = None) -> dict:
+    """
+    Post-processing step that deletes a run's raster outputs (and their float32 caches), e.g., after they were
+    summarized or stacked.
+
+    :param outputs: RunOutputs object of the run
+    :param results: results of the previous post-processing steps (unused)
+    :param keep: paths to keep (e.g., stacked outputs)
+    :return: dictionary with the number of bytes deleted ("bytes_deleted")
+    """
+    keep = set(os.path.abspath(path) for path in (keep or []))
+    bytes_deleted = 0
+    for grid in outputs.grids.values():
+        base = os.path.splitext(grid.path)[0]
+        for path in [grid.path, f'{base}.prj', f'{base}.tfw', f'{grid.path}.aux.xml',
+                     grid.cache_path, f'{grid.cache_path}.json']:
+            if os.path.exists(path) and os.path.abspath(path) not in keep:
+                bytes_deleted += os.path.getsize(path)
+                os.remove(path)
+
+    return {'bytes_deleted': bytes_deleted}
+
+
+def stackOutputs(outputs: RunOutputs,
+                 results: Optional[dict] = None,
+                 out_path: Optional[str] = None,
+                 compress: str = 'DEFLATE',
+                 block_size: int = 256,
+                 delete_source: bool = False) -> dict:
+    """
+    Stack the raster outputs of a run into one tiled, compressed, multiband float32 GeoTIFF.
+    Each band is described by its output switch name (e.g., "FLAMELENGTH"), and, like the bands of genLCP,
+    tagged with basic statistics. Band 1 also holds a DESCRIPTIONS tag listing all band names.
+    Grids are copied window by window, so memory use does not depend on the landscape size.
+
+    Can be used directly, or as a PostProcessPipeline step.
+
+    :param outputs: RunOutputs object of the run
+    :param results: results of the previous post-processing steps (unused)
+    :param out_path: path to the output GeoTIFF. Defaults to "{out_name}_stack.tif" in the output folder.
+    :param compress: GDAL compression method
+    :param block_size: tile width and height
+    :param delete_source: if True, delete the stacked outputs (see deleteOutputs) once the stack is written
+    :return: dictionary with the stack path ("stack") and band names ("stack_bands")
+    """
+    from rasterio.windows import Window
+
+    # Group output switches that share a grid (a file name matching several switches), one band per grid
+    bands = {}
+    for switch, grid in outputs.items():
+        bands.setdefault(grid.path, []).append(switch)
+    if not bands:
+        raise ValueError(f'No raster outputs found in {outputs.out_dir}')
+
+    if out_path is None:
+        out_name = os.path.basename(outputs.out_name) if outputs.out_name else 'outputs'
+        out_path = os.path.join(outputs.out_dir, f'{out_name}_stack.tif')
+
+    # Use the first grid as the reference grid
+    with rio.open(next(iter(bands))) as ref_ras:
+        ref_profile = {'height': ref_ras.height, 'width': ref_ras.width,
+                       'transform': ref_ras.transform, 'crs': ref_ras.crs}
+
+    out_meta = {
+        'driver': 'GTiff',
+        'count': len(bands),
+        'height': ref_profile['height'],
+        'width': ref_profile['width'],
+        'dtype': 'float32',
+        'nodata': np.nan,
+        'crs': ref_profile['crs'],
+        'transform': ref_profile['transform'],
+        'compress': compress,
+        'predictor': 3,                 # Floating point predictor
+        'tiled': True,
+        'blockxsize': block_size,
+        'blockysize': block_size,
+        'interleave': 'band',           # Band interleaving keeps single-output reads contiguous
+        'BIGTIFF': 'IF_SAFER'
+    }
+
+    band_names = []
+    tmp_path = f'{out_path}.{os.getpid()}.tmp.tif'
+    with rio.open(tmp_path, 'w', **out_meta) as dst:
+        for band, (path, switches) in enumerate(bands.items(), start=1):
+            count = 0
+            total = 0.0
+            total_sq = 0.0
+            minimum = np.inf
+            maximum = -np.inf
+            with _AlignedReader(path, ref_profile) as src:
+                for row in range(0, ref_profile['height'], block_size):
+                    rows = min(block_size, ref_profile['height'] - row)
+                    window = Window(0, row, ref_profile['width'], rows)
+                    arr = _readWindowFloat(src, window)
+                    dst.write(arr, band, window=window)
+
+                    # Accumulate band statistics
+                    valid = arr[np.isfinite(arr)].astype('float64')
+                    if valid.size:
+                        count += valid.size
+                        total += valid.sum()
+                        total_sq += (valid ** 2).sum()
+                        minimum = min(minimum, valid.min())
+                        maximum = max(maximum, valid.max())
+
+            dst.set_band_description(band, switches[0])
+            band_names.append(switches[0])
+            stats = {'switches': ','.join(switches), 'source': os.path.basename(path)}
+            if count:
+                mean = total / count
+                stats.update({
+                    'min': float(minimum),
+                    'max': float(maximum),
+                    'mean': float(mean),
+                    'std': float(np.sqrt(max(total_sq / count - mean ** 2, 0)))
+                })
+            dst.update_tags(band, **stats)
+
+        dst.update_tags(1, DESCRIPTIONS=','.join(band_names))
+    os.replace(tmp_path, out_path)
+
+    if delete_source:
+        deleteOutputs(outputs, keep=[out_path])
+
+    return {'stack': out_path, 'stack_bands': band_names}
+
+
+def readStackedOutput(stack_path: str,
+                      switch: str,
+                      window=None) -> np.ndarray:
+    """
+    Read one output from a stack written by stackOutputs, optionally only a window of it.
+
+    :param stack_path: path to the stacked GeoTIFF
+    :param switch: output switch name (or alias) of the band to read
+    :param window: optional rasterio Window to read
+    :return: float32 array (nodata as NaN)
+    """
+    key = output_alias_dict.get(switch.upper(), switch.upper())
+    with rio.open(stack_path) as src:
+        for band in range(1, src.count + 1):
+            switches = src.tags(band).get('switches', src.descriptions[band - 1] or '').split(',')
+            if key in switches:
+                return src.read(band, window=window)
+        raise KeyError(f'Output {switch} not found in {stack_path}. Available outputs: {", ".join(src.descriptions)}')
+
+
+def _marchingSquaresTable() -> np.ndarray:
+    """
+    Build the marching squares segment table, indexed by cell case (corners inside a contour: top left = 1,
+    top right = 2, bottom right = 4, bottom left = 8; saddle cases with an inside cell center are 16 + case).
+    Each case has up to two (start edge, end edge) segments (edges: 0 top, 1 right, 2 bottom, 3 left), oriented
+    so that every contour point starts exactly one segment and ends exactly one, which closes the contours into
+    rings with the inside on the same side.
+    """
+    table = np.full((32, 2, 2), -1, dtype='int8')
+    for case in range(32):
+        inside = [bool(case & (1 << corner)) for corner in range(4)]
+        center_inside = case >= 16
+        # Edges crossed going clockwise from the inside to the outside (exits) and back (entries)
+        exits = [edge for edge in range(4) if inside[edge] and not inside[(edge + 1) % 4]]
+        entries = [edge for edge in range(4) if not inside[edge] and inside[(edge + 1) % 4]]
+        for slot, edge in enumerate(exits):
+            step = 1 if center_inside or len(exits) == 1 else -1
+            end = next(other for other in ((edge + step * k) % 4 for k in range(1, 4)) if other in entries)
+            table[case, slot] = (edge, end)
+
+    return table
+
+
+def extractIsochrones(grid_path: str,
+                      levels: Optional[Union[list, tuple, np.ndarray]] = None,
+                      interval: float = 60.0,
+                      out_path: Optional[str] = None,
+                      simplify: bool = True,
+                      block_rows: int = 1024) -> dict:
+    """
+    Extract arrival time isochrones (fire perimeters at given times) from an MTT_ARRIVAL or ARRIVALTIME grid
+    (ASCII or GeoTIFF), as polygons of the area burned by each time.
+
+    All levels are contoured together with vectorized marching squares over strips of block_rows rows (so memory
+    use does not depend on the grid height), on cell centers with linear interpolation between burned cells,
+    and at the cell boundary between burned and unburned (nodata or negative) cells. Segments are then linked
+    into closed rings by pointer jumping, without a per-level or per-segment Python loop.
+    Rings are oriented as in shapefiles (outer rings clockwise, holes counterclockwise).
+
+    :param grid_path: path to the arrival time grid (minutes)
+    :param levels: arrival times to contour (minutes). If None, multiples of interval up to the latest
+        arrival time are used.
+    :param interval: interval between levels (minutes), used when levels is None (e.g., 60 for hourly perimeters)
+    :param out_path: optional path to a polygon shapefile (one feature per level, see writeIsochroneShapefile)
+    :param simplify: if True, remove the collinear vertices along straight runs of cell boundaries
+    :param block_rows: number of grid rows contoured at a time
+    :return: dictionary of levels and lists of rings (arrays of (x, y) map coordinates, closed)
+    """
+    from rasterio.windows import Window
+
+    with rio.open(grid_path) as src:
+        height, width, transform, crs = src.height, src.width, src.transform, src.crs
+
+        if levels is None:
+            latest = 0.0
+            for _, window in src.block_windows(1):
+                arr = _readWindowFloat(src, window)
+                arr = arr[np.isfinite(arr) & (arr >= 0)]
+                if arr.size:
+                    latest = max(latest, float(arr.max()))
+            levels = np.arange(interval, latest + interval, interval) if latest > 0 else [interval]
+        levels = np.unique(np.asarray(levels, dtype='float64'))
+
+        # The grid is padded with one row and column of unburned cells, so all contours are closed rings.
+        # Contour points lie on the edges between padded cell centers: horizontal edges first, then vertical ones.
+        padded_rows, padded_cols = height + 2, width + 2
+        n_horizontal = padded_rows * (padded_cols - 1)
+        n_edges = n_horizontal + (padded_rows - 1) * padded_cols
+        table = _marchingSquaresTable()
+        corner_offsets = np.array([[(0, 0), (0, 1)], [(0, 1), (1, 1)], [(1, 1), (1, 0)], [(1, 0), (0, 0)]])
+
+        starts, ends, points = [], [], []
+        for row in range(0, padded_rows - 1, block_rows):
+            rows = min(block_rows, padded_rows - 1 - row)
+            # Padded rows row to row + rows are grid rows row - 1 to row + rows - 1
+            strip = np.full((rows + 1, padded_cols), np.inf)
+            first, last = max(row - 1, 0), min(row + rows - 1, height - 1)
+            if first <= last:
+                arr = _readWindowFloat(src, Window(0, first, width, last - first + 1)).astype('float64')
+                arr[~(np.isfinite(arr) & (arr >= 0))] = np.inf
+                strip[first + 1 - row:last + 2 - row, 1:-1] = arr
+
+            # Cell cases of all levels at once, then the segments of the cells crossed by a contour
+            case = np.zeros((len(levels), rows, padded_cols - 1), dtype='uint8')
+            for bit, corner in enumerate((strip[:-1, :-1], strip[:-1, 1:], strip[1:, 1:], strip[1:, :-1])):
+                case |= (corner[None] <= levels[:, None, None]).view('uint8') << bit
+            level_idx, cell_row, cell_col = np.nonzero((case != 0) & (case != 15))
+            cell_case = case[level_idx, cell_row, cell_col]
+            level = levels[level_idx]
+            saddle = np.flatnonzero((cell_case == 5) | (cell_case == 10))
+            center = (strip[cell_row[saddle], cell_col[saddle]] + strip[cell_row[saddle], cell_col[saddle] + 1] +
+                      strip[cell_row[saddle] + 1, cell_col[saddle]] +
+                      strip[cell_row[saddle] + 1, cell_col[saddle] + 1]) / 4
+            cell_case[saddle[center <= level[saddle]]] += 16
+            segments = table[cell_case]
+
+            # Saddle cells have a second segment
+            level_idx, cell_row, cell_col, level = (np.r_[values, values[saddle]]
+                                                    for values in (level_idx, cell_row, cell_col, level))
+            start_edge = np.r_[segments[:, 0, 0], segments[saddle, 1, 0]]
+            end_edge = np.r_[segments[:, 0, 1], segments[saddle, 1, 1]]
+
+            # Edges 0 and 2 are horizontal (top, bottom), edges 1 and 3 vertical (right, left)
+            for edge, ids in ((start_edge, starts), (end_edge, ends)):
+                edge_row = row + cell_row + (edge == 2)
+                edge_col = cell_col + (edge == 1)
+                ids.append(level_idx * n_edges + np.where(edge % 2 == 0,
+                                                          edge_row * (padded_cols - 1) + edge_col,
+                                                          n_horizontal + edge_row * padded_cols + edge_col))
+
+            # Position of the start point along its edge, between the edge's two corner cell centers
+            offsets = corner_offsets[start_edge]
+            value_a = strip[cell_row + offsets[:, 0, 0], cell_col + offsets[:, 0, 1]]
+            value_b = strip[cell_row + offsets[:, 1, 0], cell_col + offsets[:, 1, 1]]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                frac = np.where(np.isfinite(value_a) & np.isfinite(value_b),
+                                (level - value_a) / (value_b - value_a), 0.5)
+            frac = np.clip(frac, 0, 1)[:, None]
+            pos = offsets[:, 0] + frac * (offsets[:, 1] - offsets[:, 0])
+            points.append(np.column_stack([row + cell_row + pos[:, 0], cell_col + pos[:, 1]]))
+
+    starts = np.concatenate(starts)
+    ends = np.concatenate(ends)
+    points = np.concatenate(points)
+    n = len(starts)
+    isochrones = {float(level): [] for level in levels}
+    if n:
+        # Each segment is followed by the segment starting where it ends
+        order = np.argsort(starts)
+        following = order[np.searchsorted(starts, ends, sorter=order)]
+
+        # Label each ring by its smallest segment index, and rank segments by their distance to it
+        n_steps = int(np.ceil(np.log2(n))) + 1
+        label = np.arange(n)
+        jump = following.copy()
+        for _ in range(n_steps):
+            label = np.minimum(label, label[jump])
+            jump = jump[jump]
+        is_root = label == np.arange(n)
+        dist = np.where(is_root, 0, 1)
+        jump = np.where(is_root, np.arange(n), following)
+        for _ in range(n_steps):
+            dist = dist + dist[jump]
+            jump = jump[jump]
+        order = np.lexsort((np.where(is_root, -n - 1, -dist), label))
+        label, points, level_idx = label[order], points[order], starts[order] // n_edges
+        ring_starts = np.flatnonzero(np.r_[True, label[1:] != label[:-1]])
+        ring_ends = np.r_[ring_starts[1:], n]
+
+        if simplify:
+            # Drop vertices that are collinear with their neighbours in the same ring
+            ring_id = np.repeat(np.arange(len(ring_starts)), ring_ends - ring_starts)
+            idx = np.arange(n)
+            prev = np.where(idx == ring_starts[ring_id], ring_ends[ring_id] - 1, idx - 1)
+            nxt = np.where(idx == ring_ends[ring_id] - 1, ring_starts[ring_id], idx + 1)
+            d_prev = points - points[prev]
+            d_next = points[nxt] - points
+            cross = d_prev[:, 0] * d_next[:, 1] - d_prev[:, 1] * d_next[:, 0]
+            keep = np.abs(cross) > 1e-9
+            points, label, level_idx = points[keep], label[keep], level_idx[keep]
+            ring_starts = np.flatnonzero(np.r_[True, label[1:] != label[:-1]])
+            ring_ends = np.r_[ring_starts[1:], len(label)]
+
+        # Convert padded (row, col) positions between cell centers to map coordinates
+        xs, ys = transform * (points[:, 1] - 0.5, points[:, 0] - 0.5)
+        xy = np.column_stack([xs, ys])
+        # Close the rings by repeating their first point
+        closed = np.insert(np.arange(len(xy)), ring_ends, ring_starts)
+        rings = np.split(xy[closed], (ring_ends + np.arange(1, len(ring_ends) + 1))[:-1])
+        for start, ring in zip(ring_starts, rings):
+            isochrones[float(levels[level_idx[start]])].append(ring)
+
+    if out_path is not None:
+        writeIsochroneShapefile(out_path, isochrones, crs)
+
+    return isochrones
+
+
+def _polygonShapefileBytes(records: list[list[np.ndarray]],
+                           fields: dict) -> tuple[bytes, bytes, bytes]:
+    """
+    Encode polygons (one list of closed rings per record) as the .shp, .shx and .dbf contents of a polygon
+    shapefile, with numeric fields given as {name: (values, width, decimals)}.
+    """
+    import datetime
+    import struct
+
+    contents = []
+    for rings in records:
+        xy = np.vstack(rings)
+        parts = np.cumsum([0] + [len(ring) for ring in rings[:-1]])
+        contents.append(struct.pack('<i4d2i', 5, *xy.min(axis=0), *xy.max(axis=0), len(rings), len(xy)) +
+                        parts.astype('<i4').tobytes() + xy.astype('<f8').tobytes())
+
+    lengths = np.array([len(content) // 2 for content in contents], dtype='int64')
+    index = np.zeros(len(contents), dtype=[('offset', '>i4'), ('length', '>i4')])
+    index['offset'] = 50 + np.cumsum(np.r_[0, lengths[:-1] + 4]).astype('int64')
+    index['length'] = lengths
+    shp_records = b''.join(struct.pack('>2i', number, length) + content
+                           for number, (length, content) in enumerate(zip(lengths, contents), start=1))
+
+    def _header(n_bytes: int) -> bytes:
+        if records:
+            xy = np.vstack([ring for rings in records for ring in rings])
+            bbox = (*xy.min(axis=0), *xy.max(axis=0))
+        else:
+            bbox = (0, 0, 0, 0)
+        return (struct.pack('>7i', 9994, 0, 0, 0, 0, 0, n_bytes // 2) +
+                struct.pack('<2i4d4d', 1000, 5, *bbox, 0, 0, 0, 0))
+
+    # dBASE III table with numeric fields
+    today = datetime.date.today()
+    record_len = 1 + sum(width for _, width, _ in fields.values())
+    dbf_header = struct.pack('<4BIHH20x', 3, today.year - 1900, today.month, today.day, len(records),
+                             33 + 32 * len(fields), record_len)
+    dbf_records = np.full(len(records), b' ', dtype='S1')
+    for name, (values, width, decimals) in fields.items():
+        dbf_header += struct.pack('<11sc4xBB14x', name.encode(), b'N', width, decimals)
+        text = np.array([f'{value:{width}.{decimals}f}'.encode() for value in values], dtype=f'S{width}')
+        dbf_records = np.char.add(dbf_records, text)
+    dbf_header += b'\r'
+
+    return (_header(100 + len(shp_records)) + shp_records,
+            _header(100 + index.nbytes) + index.tobytes(),
+            dbf_header + dbf_records.tobytes() + b'\x1a')
+
+
+def writeIsochroneShapefile(shp_path: str, isochrones: dict, crs=None) -> str:
+    """
+    Write isochrones (see extractIsochrones) to a polygon shapefile (.shp, .shx, .dbf and .prj), with one
+    multi-part feature per level, and "Id" (level number) and "Time" (arrival time, minutes) fields.
+    Levels without any burned area are skipped.
+
+    :param shp_path: path to the output .shp file
+    :param isochrones: dictionary of levels and lists of closed rings
+    :param crs: rasterio CRS (or any CRS definition accepted by rasterio) written to the .prj file
+    :return: path to the shapefile
+    """
+    levels = [level for level in sorted(isochrones) if len(isochrones[level])]
+    fields = {'Id': (range(1, len(levels) + 1), 10, 0),
+              'Time': (levels, 16, 3)}
+    base = os.path.splitext(shp_path)[0]
+
+    data = _polygonShapefileBytes([isochrones[level] for level in levels], fields)
+    for ext, content in zip(('.shp', '.shx', '.dbf'), data):
+        with open(base + ext, 'wb') as file:
+            file.write(content)
+    if crs is not None:
+        with open(base + '.prj', 'w') as file:
+            file.write(rio.crs.CRS.from_user_input(crs).to_wkt(version='WKT1_ESRI'))
+
+    return base + '.shp'
+
+
+def contourOutputs(outputs: RunOutputs,
+                   results: Optional[dict] = None,
+                   levels: Optional[Union[list, tuple, np.ndarray]] = None,
+                   interval: float = 60.0,
+                   out_path: Optional[str] = None) -> dict:
+    """
+    Post-processing step that extracts arrival time isochrones of a run (see extractIsochrones) from its
+    MTT_ARRIVAL or ARRIVALTIME output, into one polygon shapefile.
+
+    :param outputs: RunOutputs object of the run
+    :param results: results of the previous post-processing steps (unused)
+    :param levels: arrival times to contour (minutes). If None, multiples of interval are used.
+    :param interval: interval between levels (minutes), used when levels is None
+    :param out_path: path to the output shapefile. Defaults to "{out_name}_isochrones.shp" in the output folder.
+    :return: dictionary with the shapefile path ("isochrones") and the levels with burned area ("isochrone_levels")
+    """
+    switch = next((switch for switch in ('MTT_ARRIVAL', 'ARRIVALTIME') if switch in outputs), None)
+    if switch is None:
+        raise ValueError(f'No arrival time output found in {outputs.out_dir}')
+
+    if out_path is None:
+        out_name = os.path.basename(outputs.out_name) if outputs.out_name else 'outputs'
+        out_path = os.path.join(outputs.out_dir, f'{out_name}_isochrones.shp')
+
+    isochrones = extractIsochrones(outputs[switch].path, levels=levels, interval=interval, out_path=out_path)
+
+    return {'isochrones': out_path, 'isochrone_levels': [level for level, rings in isochrones.items() if rings]}
+
+
+def _postProcessRun(out_dir: str,
+                    out_name: Optional[str],
+                    run_id: str,
+                    steps: list) -> dict:
+    """Run the post-processing steps of one run, passing each step the results of the previous steps"""
+    import time
+
+    outputs = RunOutputs(out_dir, out_name=out_name)
+    results = {'run_id': run_id, 'out_dir': out_dir, 'out_name': out_name, 'timings': {}}
+    for step in steps:
+        start = time.perf_counter()
+        step_results = step(outputs, results)
+        if step_results:
+            results.update(step_results)
+        name = getattr(step, '__name__', None) or getattr(getattr(step, 'func', None), '__name__', repr(step))
+        results['timings'][name] = time.perf_counter() - start
+
+    return results
+
+
+class PostProcessPipeline:
+    """
+    Producer-consumer pipeline that post-processes finished runs in a bounded worker pool while the next
+    model runs are already executing.
+
+    Each submitted run is processed by a list of steps (e.g., compressOutputs, summarizeOutputs, stackOutputs,
+    deleteOutputs, or any callable with the signature step(outputs: RunOutputs, results: dict) -> dict), in order.
+    Back-pressure keeps disk usage bounded: submit() blocks while max_pending runs are waiting or being processed,
+    and while free disk space is below min_free_bytes.
+
+    Example:
+        with PostProcessPipeline([compressOutputs, summarizeOutputs], max_workers=4) as pipeline:
+            for command_file, out_dir, out_name in jobs:
+                runApp('MTT', command_file, suppress_messages=True)
+                pipeline.submit(out_dir, out_name)
+        summaries = pipeline.results
+    """
+    def __init__(self,
+                 steps: list,
+                 max_workers: int = 2,
+                 max_pending: Optional[int] = None,
+                 use_processes: bool = False,
+                 disk_path: Optional[str] = None,
+                 min_free_bytes: Optional[int] = None,
+                 on_complete=None,
+                 suppress_messages: bool = True):
+        """
+        :param steps: list of post-processing steps. Steps must be picklable (module level functions or
+            functools.partial objects) when use_processes is True.
+        :param max_workers: number of post-processing workers
+        :param max_pending: maximum number of runs queued or being processed before submit() blocks.
+            Defaults to twice max_workers.
+        :param use_processes: if True, use a process pool, otherwise a thread pool
+        :param disk_path: path on the disk to monitor for free space (e.g., the output folder)
+        :param min_free_bytes: submit() blocks while the free space on disk_path is below this value and
+            runs are still pending
+        :param on_complete: optional callable, called with the results dictionary of each finished run
+        :param suppress_messages: if True, do not print messages about failed runs
+        """
+        from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+        self.steps = steps
+        self.max_pending = max_pending or max_workers * 2
+        self.disk_path = disk_path
+        self.min_free_bytes = min_free_bytes
+        self.on_complete = on_complete
+        self.suppress_messages = suppress_messages
+        self.results = []
+        self.errors = []
+
+        executor = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self._executor = executor(max_workers=max_workers)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def pending(self) -> int:
+        """Number of runs queued or being processed"""
+        return self._pending
+
+    def _waitForDisk(self) -> None:
+        import shutil
+        import time
+
+        if not self.min_free_bytes or not self.disk_path:
+            return
+        while shutil.disk_usage(self.disk_path).free < self.min_free_bytes and self._pending > 0:
+            time.sleep(0.5)
+
+        return
+
+    def _done(self, future, run_id: str) -> None:
+        try:
+            results = future.result()
+        except Exception as err:
+            results = None
+            with self._lock:
+                self.errors.append((run_id, err))
+            if not self.suppress_messages:
+                print(f'Post-processing failed for run {run_id}: {err}')
+        with self._lock:
+            self._pending -= 1
+            if results is not None:
+                self.results.append(results)
+        self._slots.release()
+        if results is not None and self.on_complete is not None:
+            self.on_complete(results)
+
+        return
+
+    def submit(self, out_dir: str, out_name: Optional[str] = None, run_id: Optional[str] = None):
+        """
+        Queue a finished run for post-processing. Blocks while the pipeline is full (back-pressure).
+
+        :param out_dir: folder containing the run outputs
+        :param out_name: base name of the run outputs
+        :param run_id: identifier of the run. Defaults to out_name.
+        :return: concurrent.futures.Future of the run's results dictionary
+        """
+        run_id = run_id or out_name or out_dir
+        self._waitForDisk()
+        self._slots.acquire()
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(_postProcessRun, out_dir, out_name, run_id, self.steps)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda fut: self._done(fut, run_id))
+
+        return future
+
+    def close(self, wait: bool = True) -> None:
+        """Wait for the queued runs to finish (if wait is True) and shut down the workers"""
+        self._executor.shutdown(wait=wait)
+
+        return
+
+
+class ResultsCatalog:
+    """
+    Columnar catalog of per-run results (scenario parameters, timings, output summary statistics and output
+    locations), so many runs can be filtered without opening their outputs. Rows are buffered and written in
+    batches as separate Parquet (or Arrow IPC) part files in the catalog folder, so several processes can append
+    to the same catalog. Requires pyarrow.
+
+    The append() method takes the results dictionary of a PostProcessPipeline run, so it can be used as the
+    pipeline's on_complete callback (use summarizeOutputs as a step to get the output statistics). Summary columns
+    are named "{output switch}_{statistic}", e.g., "FLAMELENGTH_positive_area" (burned area), "FLAMELENGTH_mean",
+    "FLAMELENGTH_max" or "MTT_ARRIVAL_max"; parameters are named "param_{name}" and timings "time_{name}".
+    Performance metrics from getRunMetrics (a "metrics" dictionary in the results) are named "metric_{name}",
+    "metric_n_warnings"/"metric_n_errors" and "phase_{name}".
+
+    Example:
+        with ResultsCatalog('catalog') as catalog:
+            with PostProcessPipeline([summarizeOutputs], on_complete=catalog.append) as pipeline:
+                ...
+        table = catalog.read(columns=['run_id', 'out_dir'], filter=pyarrow.compute.field('FLAMELENGTH_max') > 10)
+    """
+    def __init__(self, catalog_dir: str, batch_size: int = 1000, file_format: str = 'parquet'):
+        """
+        :param catalog_dir: path to the catalog folder (created if it does not exist)
+        :param batch_size: number of rows buffered before a part file is written
+        :param file_format: "parquet" or "arrow" (Arrow IPC files)
+        """
+        if file_format not in ('parquet', 'arrow'):
+            raise ValueError(f'Invalid catalog file format: {file_format}. Options are "parquet" and "arrow"')
+        self.catalog_dir = catalog_dir
+        self.batch_size = batch_size
+        self.file_format = file_format
+        self._rows = []
+        self._seq = 0
+        self._lock = threading.Lock()
+        os.makedirs(catalog_dir, exist_ok=True)
+
+    def __repr__(self):
+        return f'ResultsCatalog({self.catalog_dir!r}, parts={len(self.parts())}, buffered={len(self._rows)})'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+
+    @staticmethod
+    def _flatten(results: dict, params: Optional[dict]) -> dict:
+        """Flatten a run results dictionary into a catalog row"""
+        import json
+
+        row = {}
+        for key, value in results.items():
+            if key == 'summary':
+                for switch, stats in value.items():
+                    row.update({f'{switch}_{stat}': stat_value for stat, stat_value in stats.items()})
+            elif key == 'timings':
+                row.update({f'time_{name}': float(seconds) for name, seconds in value.items()})
+            elif key == 'params':
+                params = dict(value, **(params or {}))
+            elif key == 'metrics' and isinstance(value, dict):
+                for name, metric in value.items():
+                    if name == 'phases':
+                        row.update({f'phase_{phase}': seconds for phase, seconds in metric.items()})
+                    elif isinstance(metric, list):
+                        row[f'metric_n_{name}'] = len(metric)
+                    elif metric is None or isinstance(metric, (str, int, float, bool)):
+                        row[f'metric_{name}'] = metric
+            elif value is None or isinstance(value, (str, int, float, bool)):
+                row[key] = value
+            else:
+                row[key] = json.dumps(value, default=str)
+        for name, value in (params or {}).items():
+            row[f'param_{name}'] = value if value is None or isinstance(value, (str, int, float, bool)) \
+                else json.dumps(value, default=str)
+
+        return row
+
+    @staticmethod
+    def _toTable(rows: list[dict]):
+        """Convert catalog rows to a pyarrow.Table, with the union of the columns of all rows"""
+        import pyarrow as pa
+
+        columns = {}
+        for row in rows:
+            columns.update(dict.fromkeys(row))
+
+        return pa.Table.from_pydict({name: [row.get(name) for row in rows] for name in columns})
+
+    def append(self, results: dict, params: Optional[dict] = None) -> None:
+        """
+        Add the results of a run to the catalog (thread-safe). A part file is written every batch_size rows.
+
+        :param results: results dictionary of the run (e.g., from PostProcessPipeline, with "run_id", "out_dir",
+            "out_name", "timings" and "summary"), with any other scalar values (e.g., "exit_status") as columns
+        :param params: scenario parameters of the run (also read from a "params" dictionary in results)
+        :return: None
+        """
+        row = self._flatten(results, params)
+        with self._lock:
+            self._rows.append(row)
+            if len(self._rows) < self.batch_size:
+                return
+            rows, self._rows = self._rows, []
+        self._writePart(self._toTable(rows))
+
+        return
+
+    def flush(self) -> None:
+        """Write the buffered rows to a part file"""
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if rows:
+            self._writePart(self._toTable(rows))
+
+        return
+
+    def _writePart(self, table) -> str:
+        """Write a pyarrow.Table as a new part file"""
+        import time
+        import pyarrow as pa
+
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        part_path = os.path.join(self.catalog_dir, f'part-{time.time_ns()}-{os.getpid()}-{seq:06d}.'
+                                                   f'{self.file_format}')
+
+        # Write to a temporary file first so readers never see a partial part file
+        tmp_path = f'{part_path}.tmp'
+        if self.file_format == 'parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(table, tmp_path, compression='zstd')
+        else:
+            with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, part_path)
+
+        return part_path
+
+    def parts(self) -> list[str]:
+        """Get the paths of the part files of the catalog"""
+        return sorted(glob.glob(os.path.join(self.catalog_dir, f'part-*.{self.file_format}')))
+
+    def _dataset(self, parts: list[str]):
+        """Open the part files as a single dataset, unifying their schemas (columns missing from a part are null)"""
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        if self.file_format == 'parquet':
+            import pyarrow.parquet as pq
+            schemas = [pq.read_schema(path) for path in parts]
+        else:
+            schemas = [pa.ipc.open_file(path).schema for path in parts]
+        schema = pa.unify_schemas(schemas, promote_options='permissive')
+
+        return ds.dataset(parts, schema=schema, format='parquet' if self.file_format == 'parquet' else 'ipc')
+
+    def read(self, columns: Optional[list[str]] = None, filter=None):
+        """
+        Read the catalog (written part files only; call flush() first to include buffered rows).
+
+        :param columns: optional list of columns to read
+        :param filter: optional pyarrow.compute expression to filter rows by,
+            e.g., pyarrow.compute.field('FLAMELENGTH_max') > 10
+        :return: pyarrow.Table of the selected rows (use .to_pandas() for a DataFrame)
+        """
+        import pyarrow as pa
+
+        parts = self.parts()
+        if not parts:
+            return pa.table({})
+
+        return self._dataset(parts).to_table(columns=columns, filter=filter)
+
+    def compact(self) -> Optional[str]:
+        """
+        Merge the part files of the catalog into a single part file, to speed up reads after many batches.
+
+        :return: path to the merged part file (None if the catalog is empty)
+        """
+        parts = self.parts()
+        if not parts:
+            return None
+        merged_path = self._writePart(self._dataset(parts).to_table())
+        for path in parts:
+            os.remove(path)
+
+        return merged_path
+
+
+def _writeLCPWindow(src,
+                    window,
+                    out_path: str,
+                    profile: Optional[dict] = None,
+                    tags: Optional[list[dict]] = None) -> str:
+    """
+    Copy a window of an open LCP file to a new LCP file with the same creation options, band descriptions and tags.
+    The profile and tags of the source can be passed when copying many windows of the same file.
+    """
+    profile = profile or src.profile.copy()
+    tags = tags or [src.tags(band) for band in range(1, src.count + 1)]
+    out_profile = profile.copy()
+    out_profile.update({
+        'width': window.width,
+        'height': window.height,
+        'transform': src.window_transform(window)
+    })
+    if window.width < profile.get('blockxsize', 0) or window.height < profile.get('blockysize', 0):
+        out_profile['tiled'] = False
+        out_profile.pop('blockxsize', None)
+        out_profile.pop('blockysize', None)
+
+    with rio.open(out_path, 'w', **out_profile) as dst:
+        for band in range(1, src.count + 1):
+            dst.write(src.read(band, window=window), band)
+            dst.set_band_description(band, src.descriptions[band - 1])
+            dst.update_tags(band, **tags[band - 1])
+
+    return out_path
+
+
+def tileLCP(lcp_file: str,
+            out_dir: str,
+            tile_size: int = 2048,
+            overlap: int = 64,
+            suppress_messages: bool = False) -> list[dict]:
+    """
+    Split an LCP file (see genLCP) into overlapping sub-LCPs that can be run in parallel.
+    Tiles are copied window by window with the creation options of the source LCP, and keep its band
+    descriptions and tags.
+
+    :param lcp_file: path to the source LCP file
+    :param out_dir: path to the folder to write the tiles into
+    :param tile_size: width and height of the tile cores (cells)
+    :param overlap: number of cells each tile extends beyond its core on every side (except at the landscape edges)
+    :param suppress_messages: if True, do not print messages from this function
+    :return: list of tile dictionaries, with the tile "id", LCP "path", "window" (col_off, row_off, width, height)
+        of the tile, and "core" window, both in cells of the source LCP
+    """
+    from rasterio.windows import Window
+
+    if not suppress_messages:
+        print(f'Tiling LCP file {lcp_file}')
+    os.makedirs(out_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(lcp_file))[0]
+
+    tiles = []
+    with rio.open(lcp_file) as src:
+        profile = src.profile.copy()
+        tags = [src.tags(band) for band in range(1, src.count + 1)]
+        for row in range(0, src.height, tile_size):
+            for col in range(0, src.width, tile_size):
+                core = (col, row, min(tile_size, src.width - col), min(tile_size, src.height - row))
+                col0 = max(col - overlap, 0)
+                row0 = max(row - overlap, 0)
+                col1 = min(col + core[2] + overlap, src.width)
+                row1 = min(row + core[3] + overlap, src.height)
+                window = Window(col0, row0, col1 - col0, row1 - row0)
+
+                tile_id = f'r{row // tile_size:03d}_c{col // tile_size:03d}'
+                tile_path = os.path.join(out_dir, f'{name}_{tile_id}.tif')
+                _writeLCPWindow(src, window, tile_path, profile, tags)
+
+                tiles.append({
+                    'id': tile_id,
+                    'path': tile_path,
+                    'window': (col0, row0, window.width, window.height),
+                    'core': core
+                })
+
+    if not suppress_messages:
+        print(f'\t{len(tiles)} tiles complete')
+
+    return tiles
+
+
+def runTiles(app_select: str,
+             tiles: list[dict],
+             input_file: str,
+             out_dir: str,
+             max_workers: Optional[int] = None,
+             out_type: int = 2,
+             suppress_messages: bool = False) -> list[dict]:
+    """
+    Run the selected app on each tile from tileLCP concurrently, with one process per tile.
+    This is intended for FlamMap basic fire behaviour, where cells are independent apart from gridded winds and
+    fuel conditioning (use a tile overlap that covers their neighbourhood).
+
+    :param app_select: The name of the selected fire modelling application (normally "FlamMap")
+    :param tiles: list of tile dictionaries from tileLCP
+    :param input_file: path to the input file used for all tiles
+    :param out_dir: path to the output folder. Each tile writes its outputs to "{out_dir}/{tile id}/".
+    :param max_workers: number of tiles to run at the same time. Defaults to the number of CPUs.
+    :param out_type: the output type code passed to the app
+    :param suppress_messages: if True, do not print messages from this function
+    :return: the tile dictionaries, updated with the tile "out_dir", "out_name", "stdout" and "stderr"
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def _runTile(tile: dict) -> dict:
+        tile_out_dir = os.path.join(out_dir, tile['id'])
+        os.makedirs(tile_out_dir, exist_ok=True)
+        command_file = os.path.join(tile_out_dir, f'{tile["id"]}_command.txt')
+        genCommandFile(command_file,
+                       [genCommandRow(app_select, tile['path'], input_file,
+                                      os.path.join(tile_out_dir, tile['id']), out_type=out_type)],
+                       suppress_messages=True)
+        stdout, stderr = runApp(app_select, command_file, suppress_messages=True)
+        tile.update({'out_dir': tile_out_dir, 'out_name': tile['id'], 'stdout': stdout, 'stderr': stderr})
+        if not suppress_messages:
+            print(f'\tTile {tile["id"]} complete')
+        return tile
+
+    if not suppress_messages:
+        print(f'\n<<<<< [flammap_cli.py] Running {app_select} on {len(tiles)} tiles >>>>>')
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        return list(executor.map(_runTile, tiles))
+
+
+def _tileWeights(tile: dict, overlap: int, grid_shape: tuple, row: int, rows: int, blend: str) -> np.ndarray:
+    """
+    Get the mosaic weights of a tile for a block of rows of the full landscape grid.
+    With "trim", cells in the tile core get a weight of 1. With "feather", weights ramp linearly from the tile edges
+    to its core across the overlap (edges on the landscape border are not feathered).
+    """
+    height, width = grid_shape
+    cols = np.arange(width)
+    rows_idx = np.arange(row, row + rows)[:, None]
+    if blend == 'trim':
+        c0, r0, cw, ch = tile['core']
+        in_rows = (rows_idx >= r0) & (rows_idx < r0 + ch)
+        in_cols = (cols >= c0) & (cols < c0 + cw)
+        return (in_rows & in_cols).astype('float32')
+
+    c0, r0, cw, ch = tile['window']
+    inf = np.inf
+    dist_left = cols - c0 + 1 if c0 > 0 else np.full(width, inf)
+    dist_right = c0 + cw - cols if c0 + cw < width else np.full(width, inf)
+    dist_top = rows_idx - r0 + 1 if r0 > 0 else np.full(rows_idx.shape, inf)
+    dist_bottom = r0 + ch - rows_idx if r0 + ch < height else np.full(rows_idx.shape, inf)
+    dist = np.minimum(np.minimum(dist_left, dist_right)[None, :], np.minimum(dist_top, dist_bottom))
+    weights = np.clip(dist / max(2 * overlap, 1), 0, 1).astype('float32')
+    inside = ((rows_idx >= r0) & (rows_idx < r0 + ch)) & ((cols >= c0) & (cols < c0 + cw))
+
+    return np.where(inside, weights, 0).astype('float32')
+
+
+def mosaicTiles(tiles: list[dict],
+                lcp_file: str,
+                out_dir: str,
+                switches: Optional[list[str]] = None,
+                blend: str = 'trim',
+                block_rows: int = 256,
+                suppress_messages: bool = False) -> dict[str, str]:
+    """
+    Stitch the tile outputs of runTiles back into full-extent mosaics aligned to the source LCP, block by block,
+    so memory use is bounded by the block size rather than the landscape size.
+
+    :param tiles: list of tile dictionaries from runTiles
+    :param lcp_file: path to the source LCP file
+    :param out_dir: path to the folder to write the mosaics into ("{switch}.tif")
+    :param switches: output switches to mosaic. If None, all outputs of the first tile are used.
+    :param blend: "trim" to take each cell from the tile whose core contains it, or "feather" to blend
+        overlapping tiles with linearly ramped weights. Categorical and direction outputs are always trimmed.
+    :param block_rows: number of rows to process at a time
+    :param suppress_messages: if True, do not print messages from this function
+    :return: dictionary of output switch names and mosaic paths
+    """
+    from contextlib import ExitStack
+    from rasterio.windows import Window
+
+    if blend not in ['trim', 'feather']:
+        raise ValueError('The "blend" parameter must be "trim" or "feather"')
+
+    profile = _getLcpProfile(lcp_file)
+    height, width = profile['height'], profile['width']
+    overlap = max([max(t['core'][0] - t['window'][0], t['core'][1] - t['window'][1]) for t in tiles] + [0])
+    tile_outputs = [RunOutputs(t['out_dir'], out_name=t['out_name']) for t in tiles]
+    if switches is None:
+        switches = list(tile_outputs[0].keys())
+
+    out_meta = {
+        'driver': 'GTiff',
+        'height': height,
+        'width': width,
+        'count': 1,
+        'dtype': 'float32',
+        'nodata': np.nan,
+        'crs': profile['crs'],
+        'transform': profile['transform'],
+        'compress': 'DEFLATE',
+        'predictor': 3,
+        'tiled': True,
+        'blockxsize': 128,
+        'blockysize': 128,
+        'BIGTIFF': 'IF_SAFER'
+    }
+
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for switch in switches:
+        switch_blend = 'trim' if switch in non_blendable_outputs else blend
+        out_path = os.path.join(out_dir, f'{switch}.tif')
+        if not suppress_messages:
+            print(f'\tMosaicking {switch}')
+        with ExitStack() as stack:
+            # Open every tile output on the full landscape grid; only the windows read are decoded
+            readers = []
+            for tile, outputs in zip(tiles, tile_outputs):
+                if switch in outputs:
+                    readers.append((tile, stack.enter_context(_AlignedReader(outputs[switch].path, profile))))
+
+            with rio.open(out_path, 'w', **out_meta) as dst:
+                dst.set_band_description(1, switch)
+                for row in range(0, height, block_rows):
+                    rows = min(block_rows, height - row)
+                    window = Window(0, row, width, rows)
+                    total = np.zeros((rows, width), dtype='float32')
+                    weight_sum = np.zeros((rows, width), dtype='float32')
+                    for tile, src in readers:
+                        c0, r0, cw, ch = tile['window']
+                        if r0 >= row + rows or r0 + ch <= row:
+                            continue
+                        weights = _tileWeights(tile, overlap, (height, width), row, rows, switch_blend)
+                        values = _readWindowFloat(src, window)
+                        weights[~np.isfinite(values)] = 0
+                        total += np.where(weights > 0, values, 0) * weights
+                        weight_sum += weights
+                    mosaic = np.divide(total, weight_sum, out=np.full_like(total, np.nan), where=weight_sum > 0)
+                    dst.write(mosaic, 1, window=window)
+        paths[switch] = out_path
+
+    return paths
+
+
+def _expandToLCP(grid_path: str, lcp_profile: dict, window, out_path: str, block_rows: int = 256) -> str:
+    """
+    Write an output grid computed on a window of an LCP file into a full-extent GeoTIFF of the LCP grid
+    (float32, resampled with nearest neighbour if the output resolution differs, nodata outside the window).
+    """
+    from rasterio.windows import Window
+
+    height, width = lcp_profile['height'], lcp_profile['width']
+    col0, row0, win_width, win_height = window
+    out_meta = {
+        'driver': 'GTiff',
+        'height': height,
+        'width': width,
+        'count': 1,
+        'dtype': 'float32',
+        'nodata': -9999,
+        'crs': lcp_profile['crs'],
+        'transform': lcp_profile['transform'],
+        'compress': 'DEFLATE',
+        'tiled': True,
+        'blockxsize': 256,
+        'blockysize': 256,
+        'BIGTIFF': 'IF_SAFER'
+    }
+    window_profile = {**lcp_profile, 'height': win_height, 'width': win_width,
+                      'transform': rio.windows.transform(Window(*window), lcp_profile['transform'])}
+    with _AlignedReader(grid_path, window_profile) as src, rio.open(out_path, 'w', **out_meta) as dst:
+        for row in range(0, height, block_rows):
+            rows = min(block_rows, height - row)
+            block = np.full((rows, width), -9999, dtype='float32')
+            r0, r1 = max(row, row0), min(row + rows, row0 + win_height)
+            if r0 < r1:
+                values = _readWindowFloat(src, Window(0, r0 - row0, win_width, r1 - r0))
+                block[r0 - row:r1 - row, col0:col0 + win_width] = np.where(np.isfinite(values), values, -9999)
+            dst.write(block, 1, window=Window(0, row, width, rows))
+
+    return out_path
+
+
+def runAdaptiveMTT(lcp_file: str,
+                   input_kwargs: dict,
+                   ign_file: str,
+                   out_dir: str,
+                   out_name: str,
+                   coarse_factor: int = 4,
+                   buffer: Optional[float] = None,
+                   max_clip_fraction: float = 0.8,
+                   max_expansions: int = 2,
+                   barrier_file: Optional[str] = None,
+                   out_type: int = 2,
+                   keep_intermediate: bool = False,
+                   suppress_messages: bool = False) -> dict:
+    """
+    Coarse-to-fine MTT run. MTT is first run at a coarse MTT_RESOLUTION (coarse_factor times the requested
+    resolution) to find the footprint reached within MTT_SIM_TIME. The LCP is then clipped to the buffered footprint
+    and MTT is rerun at the requested resolution only there, and the outputs are written back on the full LCP
+    extent (nodata outside the clip). If the fine fire reaches the edge of the clip, the buffer is doubled and the
+    fine run is repeated (up to max_expansions times, then the full landscape is run), so the coarse run only
+    changes the cost of the fine run, not its outputs. The full landscape is also run directly when the buffered
+    footprint covers most of it.
+
+    :param lcp_file: path to the LCP file
+    :param input_kwargs: genInputFile keyword arguments for the run (e.g., weather, winds, fuel moistures,
+        mtt_resolution and mtt_sim_time). out_dir, out_name, app_select and mtt_ign_file_path are set by this
+        function.
+    :param ign_file: path to the ignition shapefile
+    :param out_dir: path to the output folder
+    :param out_name: base name of the outputs. When the fine run is clipped, outputs are written on the LCP grid
+        as "{out_dir}/{out_name}_{output switch}.tif"; otherwise they are the MTT outputs of "{out_dir}/{out_name}".
+    :param coarse_factor: ratio of the coarse to the fine resolution
+    :param buffer: buffer around the coarse footprint (LCP units). Defaults to 3 coarse cells.
+    :param max_clip_fraction: the full landscape is run when the clip covers more than this fraction of it
+    :param max_expansions: maximum number of times the clip is expanded when the fine fire reaches its edge
+    :param barrier_file: path to the barrier shapefile
+    :param out_type: the output type code passed to MTT
+    :param keep_intermediate: if True, keep the coarse run and clipped LCP/run folders
+    :param suppress_messages: if True, do not print messages from this function
+    :return: dictionary with the "outputs" (output switch: path of each grid; for clipped runs, also file name
+        without the out_name prefix: path of the other outputs, e.g., shapefiles and logs), whether the fine run
+        was "clipped", the fine "window" (col_off, row_off, width, height) in LCP cells, the number of
+        "expansions", and the "coarse" and "fine" run stdout, stderr and wall clock time
+    """
+    import shutil
+    import time
+    from rasterio.windows import Window, from_bounds
+
+    fine_res = input_kwargs.get('mtt_resolution', 100)
+    sim_time = input_kwargs.get('mtt_sim_time', 0)
+    coarse_res = fine_res * coarse_factor
+    buffer = 3 * coarse_res if buffer is None else buffer
+    lcp_profile = _getLcpProfile(lcp_file)
+    height, width = lcp_profile['height'], lcp_profile['width']
+    results = {'outputs': {}, 'clipped': False, 'window': (0, 0, width, height), 'expansions': 0}
+
+    def _run(stage: str, stage_lcp: str, resolution: float, stage_dir: str, stage_name: str) -> RunOutputs:
+        os.makedirs(stage_dir, exist_ok=True)
+        input_file = genInputFile(stage_dir, stage_name, suppress_messages=True,
+                                  **dict(input_kwargs, app_select='MTT', mtt_resolution=resolution,
+                                         mtt_ign_file_path=ign_file))
+        command_file = os.path.join(stage_dir, f'{stage_name}_command.txt')
+        genCommandFile(command_file,
+                       [genCommandRow('MTT', stage_lcp, input_file, os.path.join(stage_dir, stage_name),
+                                      ign_file=ign_file, barrier_file=barrier_file, out_type=out_type)],
+                       suppress_messages=True)
+        start = time.perf_counter()
+        stdout, stderr = runApp('MTT', command_file, suppress_messages=True)
+        results[stage] = {'stdout': stdout, 'stderr': stderr, 'wall_seconds': time.perf_counter() - start}
+        if not suppress_messages:
+            print(f'\t{stage.capitalize()} MTT run complete ({resolution} m, '
+                  f'{results[stage]["wall_seconds"]:.1f} s)')
+        return RunOutputs(stage_dir, out_name=stage_name)
+
+    def _arrivalPath(outputs: RunOutputs, stage: str) -> str:
+        for switch in ('MTT_ARRIVAL', 'ARRIVALTIME'):
+            if switch in outputs:
+                return outputs[switch].path
+        raise RuntimeError(f'The {stage} MTT run did not write an arrival time grid: {results[stage]["stderr"]}')
+
+    if not suppress_messages:
+        print(f'\n<<<<< [flammap_cli.py] Running coarse-to-fine MTT for {out_name} >>>>>')
+
+    # Coarse run over the full landscape
+    coarse_dir = os.path.join(out_dir, f'{out_name}_coarse')
+    coarse_outputs = _run('coarse', lcp_file, coarse_res, coarse_dir, f'{out_name}_coarse')
+    with rio.open(_arrivalPath(coarse_outputs, 'coarse')) as src:
+        arrival = _readWindowFloat(src, None)
+        burned = np.isfinite(arrival) & (arrival >= 0)
+        if sim_time:
+            burned &= arrival <= sim_time
+        rows, cols = np.nonzero(burned)
+        if rows.size:
+            xs, ys = src.transform * (np.array([cols.min(), cols.max() + 1]), np.array([rows.min(), rows.max() + 1]))
+            footprint = [xs.min(), ys.min(), xs.max(), ys.max()]
+        else:
+            footprint = None
+    if footprint is None:
+        # Nothing burned at the coarse resolution: use the ignition locations
+        xy, _ = readIgnitionShapefile(ign_file)
+        footprint = [*xy.min(axis=0), *xy.max(axis=0)]
+
+    fine_dir = os.path.join(out_dir, f'{out_name}_fine')
+    while True:
+        # Window of the buffered footprint, rounded outwards to LCP cells
+        left, bottom, right, top = footprint
+        window = from_bounds(left - buffer, bottom - buffer, right + buffer, top + buffer,
+                             transform=lcp_profile['transform'])
+        col0 = max(int(np.floor(window.col_off)), 0)
+        row0 = max(int(np.floor(window.row_off)), 0)
+        col1 = min(int(np.ceil(window.col_off + window.width)), width)
+        row1 = min(int(np.ceil(window.row_off + window.height)), height)
+        clip = (col0, row0, col1 - col0, row1 - row0)
+        if clip[2] * clip[3] > max_clip_fraction * height * width:
+            break
+
+        # Fine run over the clipped landscape (in an empty folder, so no outputs of an earlier attempt are kept)
+        clip_lcp = os.path.join(fine_dir, f'{out_name}_clip.tif')
+        shutil.rmtree(fine_dir, ignore_errors=True)
+        os.makedirs(fine_dir, exist_ok=True)
+        with rio.open(lcp_file) as src:
+            _writeLCPWindow(src, Window(*clip), clip_lcp)
+        fine_outputs = _run('fine', clip_lcp, fine_res, fine_dir, out_name)
+
+        # Check whether the fire reached the edge of the clip (other than the landscape edges)
+        with rio.open(_arrivalPath(fine_outputs, 'fine')) as src:
+            arrival = _readWindowFloat(src, None)
+        burned = np.isfinite(arrival) & (arrival >= 0)
+        edges = [(burned[:, 0].any(), col0 > 0), (burned[:, -1].any(), col1 < width),
+                 (burned[0, :].any(), row0 > 0), (burned[-1, :].any(), row1 < height)]
+        if any(reached and inner for reached, inner in edges):
+            if results['expansions'] == max_expansions:
+                break
+            results['expansions'] += 1
+            buffer *= 2
+            if not suppress_messages:
+                print('\tFire reached the edge of the clipped landscape, expanding the clip')
+            continue
+
+        results.update({'clipped': True, 'window': clip})
+        written = {}
+        for switch, grid in fine_outputs.items():
+            if grid.path not in written:
+                written[grid.path] = _expandToLCP(grid.path, lcp_profile, clip,
+                                                  os.path.join(out_dir, f'{out_name}_{switch}.tif'))
+            results['outputs'][switch] = written[grid.path]
+
+        # Move the other outputs of the fine run (e.g., major paths and flow paths shapefiles, ember and spot
+        # files, timings and logs) to the output folder, keyed by file name without the out_name prefix
+        skip_prefixes = tuple(os.path.splitext(path)[0] + '.'
+                              for path in [clip_lcp] + [grid.path for _, grid in fine_outputs.items()])
+        skip_paths = (os.path.join(fine_dir, f'{out_name}.input'), os.path.join(fine_dir, f'{out_name}_command.txt'))
+        for path in sorted(glob.glob(os.path.join(fine_dir, '*'))):
+            if not os.path.isfile(path) or path in skip_paths or path.startswith(skip_prefixes):
+                continue
+            name = os.path.basename(path)
+            out_path = os.path.join(out_dir, name)
+            if keep_intermediate:
+                shutil.copy2(path, out_path)
+            else:
+                shutil.move(path, out_path)
+            key = name[len(out_name):].lstrip('_') if name.startswith(out_name) else name
+            results['outputs'][key or name] = out_path
+        break
+
+    if not results['clipped']:
+        # Remove the full-extent grids of earlier clipped attempts, which would be mistaken for outputs of this run
+        for switch in output_switch_dict:
+            stale_path = os.path.join(out_dir, f'{out_name}_{switch}.tif')
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+
+        # Fine run over the full landscape
+        full_outputs = _run('fine', lcp_file, fine_res, out_dir, out_name)
+        results['outputs'] = {switch: grid.path for switch, grid in full_outputs.items()}
+
+    if not keep_intermediate:
+        shutil.rmtree(coarse_dir, ignore_errors=True)
+        shutil.rmtree(fine_dir, ignore_errors=True)
+    if not suppress_messages:
+        print(f'<<<<< Coarse-to-fine MTT complete (clipped: {results["clipped"]}, window: {results["window"]}) >>>>>')
+
+    return results
+
+
+def hashScenario(params: dict) -> str:
+    """Get a hash of the parameters of a scenario (as JSON with sorted keys), used to identify identical runs"""
+    import hashlib
+    import json
+
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _workerId() -> str:
+    """Get an identifier of the current worker (host, process and thread)"""
+    import socket
+
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+class RunManifest:
+    """
+    Durable manifest of batch runs stored in an SQLite database in WAL mode. Each job records its scenario hash,
+    input/command file paths, state ("pending", "running", "done", "failed" or "quarantined"), timings, exit
+    status, outcome (see classifyRun), performance metrics (see getRunMetrics) and output location. Jobs are
+    claimed atomically, so several worker processes can pull from the same manifest without a central service,
+    and a restarted batch resumes exactly where it stopped.
+    Failed jobs are retried with exponential backoff when their failure is transient, preferably by another
+    worker, and quarantined when it is deterministic or they run out of attempts (see fail()).
+    """
+    def __init__(self, db_path: str, timeout: float = 60):
+        """
+        :param db_path: path to the SQLite database file (created if it does not exist)
+        :param timeout: seconds to wait for a lock held by another worker
+        """
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+
+        with self._transaction() as con:
+            con.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                        'job_id TEXT PRIMARY KEY, scenario_hash TEXT, app_select TEXT, command_file TEXT, '
+                        'input_file TEXT, out_dir TEXT, out_name TEXT, params TEXT, '
+                        "state TEXT NOT NULL DEFAULT 'pending', worker TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+                        'created REAL, started REAL, finished REAL, exit_status INTEGER, message TEXT, '
+                        'metrics TEXT, outcome TEXT, retry_after REAL)')
+            con.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)')
+            # Add the columns missing from manifests created by earlier versions
+            columns = {row[1] for row in con.execute('PRAGMA table_info(jobs)')}
+            for column, column_type in (('metrics', 'TEXT'), ('outcome', 'TEXT'), ('retry_after', 'REAL')):
+                if column not in columns:
+                    con.execute(f'ALTER TABLE jobs ADD COLUMN {column} {column_type}')
+
+    def __repr__(self):
+        return f'RunManifest({self.db_path!r}, {self.counts()})'
+
+    def __len__(self) -> int:
+        return self._connect().execute('SELECT COUNT(*) FROM jobs').fetchone()[0]
+
+    def _connect(self):
+        """Get the database connection of the current thread (sqlite3 connections are not shared by threads)"""
+        import sqlite3
+
+        con = getattr(self._local, 'con', None)
+        if con is None:
+            con = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+            con.row_factory = sqlite3.Row
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('PRAGMA synchronous=NORMAL')
+            self._local.con = con
+        return con
+
+    def _transaction(self):
+        """Context manager running a write transaction (the write lock is taken immediately)"""
+        from contextlib import contextmanager
+
+        @contextmanager
+        def _transaction():
+            con = self._connect()
+            con.execute('BEGIN IMMEDIATE')
+            try:
+                yield con
+            except BaseException:
+                con.execute('ROLLBACK')
+                raise
+            con.execute('COMMIT')
+
+        return _transaction()
+
+    @staticmethod
+    def _toDict(row) -> dict:
+        import json
+
+        job = dict(row)
+        job['params'] = json.loads(job['params']) if job['params'] else {}
+        job['metrics'] = json.loads(job['metrics']) if job['metrics'] else None
+        return job
+
+    def close(self) -> None:
+        """Close the database connection of the current thread"""
+        con = getattr(self._local, 'con', None)
+        if con is not None:
+            con.close()
+            self._local.con = None
+
+    def addJobs(self, jobs: list[dict]) -> int:
+        """
+        Add jobs to the manifest in a single transaction. Jobs that already exist (same job_id) are left unchanged,
+        so the jobs of a batch can be added again when it is restarted.
+
+        :param jobs: list of job dictionaries with the keys "app_select", "command_file", and optionally
+            "input_file", "out_dir", "out_name", "params" (scenario parameters) and "job_id"
+            (defaults to the scenario hash of "params", or of the command file path if there are no parameters)
+        :return: the number of new jobs
+        """
+        import json
+        import time
+
+        now = time.time()
+        rows = []
+        for job in jobs:
+            params = job.get('params') or {}
+            scenario_hash = hashScenario(params or {'command_file': job['command_file']})
+            rows.append((job.get('job_id') or scenario_hash, scenario_hash, job['app_select'], job['command_file'],
+                         job.get('input_file'), job.get('out_dir'), job.get('out_name'),
+                         json.dumps(params, sort_keys=True, default=str), now))
+
+        with self._transaction() as con:
+            before = con.total_changes
+            con.executemany('INSERT OR IGNORE INTO jobs (job_id, scenario_hash, app_select, command_file, '
+                            'input_file, out_dir, out_name, params, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            rows)
+            return con.total_changes - before
+
+    def claim(self, worker: Optional[str] = None, n: int = 1) -> list[dict]:
+        """
+        Atomically claim pending jobs, in the order they were added, and mark them as running. Jobs waiting for
+        a retry are only claimed once their backoff delay has passed, and jobs that last failed on another
+        worker are claimed first (so retries run on a fresh worker when there is one).
+
+        :param worker: identifier of the worker claiming the jobs. Defaults to "{host}:{pid}:{thread id}".
+        :param n: maximum number of jobs to claim
+        :return: list of claimed job dictionaries (empty when no jobs are pending)
+        """
+        import time
+
+        worker = worker or _workerId()
+        now = time.time()
+        with self._transaction() as con:
+            job_ids = [row[0] for row in con.execute(
+                "SELECT job_id FROM jobs WHERE state = 'pending' AND (retry_after IS NULL OR retry_after <= ?) "
+                "ORDER BY COALESCE(worker = ?, 0), rowid LIMIT ?", (now, worker, n))]
+            if not job_ids:
+                return []
+            marks = ', '.join('?' * len(job_ids))
+            con.execute(f"UPDATE jobs SET state = 'running', worker = ?, attempts = attempts + 1, started = ?, "
+                        f"finished = NULL, exit_status = NULL, message = NULL, outcome = NULL, retry_after = NULL "
+                        f"WHERE job_id IN ({marks})",
+                        (worker, now, *job_ids))
+            rows = con.execute(f'SELECT * FROM jobs WHERE job_id IN ({marks}) ORDER BY rowid', job_ids).fetchall()
+
+        return [self._toDict(row) for row in rows]
+
+    def complete(self,
+                 job_id: str,
+                 exit_status: int = 0,
+                 message: Optional[str] = None,
+                 out_dir: Optional[str] = None,
+                 metrics: Optional[dict] = None,
+                 outcome: Optional[str] = None) -> None:
+        """
+        Record the end of a job. The job is "done" if its exit status is 0, otherwise "failed".
+        Use fail() instead to retry or quarantine failed jobs according to their outcome.
+
+        :param job_id: the job identifier
+        :param exit_status: the exit status of the app
+        :param message: optional message (e.g., the app errors)
+        :param out_dir: the output location, if it differs from the one recorded when the job was added
+        :param metrics: optional performance metrics of the run (see getRunMetrics)
+        :param outcome: optional outcome class of the run (see classifyRun)
+        :return: None
+        """
+        import json
+        import time
+
+        with self._transaction() as con:
+            con.execute('UPDATE jobs SET state = ?, finished = ?, exit_status = ?, message = ?, '
+                        'out_dir = COALESCE(?, out_dir), metrics = ?, outcome = ? WHERE job_id = ?',
+                        ('done' if exit_status == 0 else 'failed', time.time(), exit_status, message, out_dir,
+                         json.dumps(metrics, default=str) if metrics is not None else None,
+                         outcome or ('success' if exit_status == 0 else 'error'), job_id))
+
+        return
+
+    def fail(self,
+             job_id: str,
+             outcome: str,
+             exit_status: Optional[int] = None,
+             message: Optional[str] = None,
+             metrics: Optional[dict] = None,
+             max_attempts: int = 3,
+             backoff_seconds: float = 30,
+             max_backoff_seconds: float = 3600) -> str:
+        """
+        Record a failed job. Transient failures (see run_outcome_retry) are set back to pending, to be claimed
+        again after an exponential backoff delay (preferably by another worker), until the job has been attempted
+        max_attempts times. Deterministic failures, and jobs out of attempts, are quarantined, so they stop using
+        compute (they can be released with requeue(states=('quarantined',))).
+
+        :param job_id: the job identifier
+        :param outcome: outcome class of the run (see classifyRun)
+        :param exit_status: the exit status of the app
+        :param message: optional message (e.g., the reason of the failure)
+        :param metrics: optional performance metrics of the run (see getRunMetrics)
+        :param max_attempts: maximum number of attempts of a job with transient failures
+        :param backoff_seconds: delay before the first retry (doubled for each further attempt)
+        :param max_backoff_seconds: maximum delay before a retry
+        :return: the new state of the job ("pending" or "quarantined")
+        """
+        import json
+        import time
+
+        with self._transaction() as con:
+            row = con.execute('SELECT attempts FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+            attempts = row[0] if row else max_attempts
+            retry = run_outcome_retry.get(outcome, True) and attempts < max_attempts
+            now = time.time()
+            state = 'pending' if retry else 'quarantined'
+            con.execute('UPDATE jobs SET state = ?, finished = ?, exit_status = ?, message = ?, metrics = ?, '
+                        'outcome = ?, retry_after = ? WHERE job_id = ?',
+                        (state, now, exit_status, message,
+                         json.dumps(metrics, default=str) if metrics is not None else None, outcome,
+                         now + _retryDelay(attempts, backoff_seconds, max_backoff_seconds) if retry else None,
+                         job_id))
+
+        return state
+
+    def nextRetry(self) -> Optional[float]:
+        """Get the time (epoch seconds) at which the next pending job can be claimed, or None if none are pending"""
+        return self._connect().execute(
+            "SELECT MIN(COALESCE(retry_after, 0)) FROM jobs WHERE state = 'pending'").fetchone()[0]
+
+    def requeue(self, states: tuple = ('running',), job_ids: Optional[list[str]] = None) -> int:
+        """
+        Set jobs back to pending (e.g., to retry failed jobs, or release quarantined jobs after fixing their inputs).
+
+        :param states: states of the jobs to requeue
+        :param job_ids: optional list of job identifiers to requeue (among the jobs in the given states)
+        :return: the number of requeued jobs
+        """
+        query = (f"UPDATE jobs SET state = 'pending', worker = NULL, retry_after = NULL "
+                 f"WHERE state IN ({', '.join('?' * len(states))})")
+        args = list(states)
+        if job_ids is not None:
+            query += f' AND job_id IN ({", ".join("?" * len(job_ids))})'
+            args += list(job_ids)
+
+        with self._transaction() as con:
+            return con.execute(query, args).rowcount
+
+    def requeueStale(self, max_age: Optional[float] = None) -> int:
+        """
+        Set running jobs back to pending when their worker has stopped: workers on this host whose process no
+        longer exists, and (if max_age is given) jobs on any host that started more than max_age seconds ago.
+
+        :param max_age: maximum run time (seconds) before a running job is considered stale
+        :return: the number of requeued jobs
+        """
+        import socket
+        import time
+
+        host = socket.gethostname()
+        stale = []
+        for job_id, worker, started in self._connect().execute(
+                "SELECT job_id, worker, started FROM jobs WHERE state = 'running'"):
+            worker_host, _, pid = (worker or '::').partition(':')
+            pid = pid.split(':')[0]
+            if ((worker_host == host and pid.isdigit() and not psutil.pid_exists(int(pid))) or
+                    (max_age is not None and started is not None and time.time() - started > max_age)):
+                stale.append(job_id)
+
+        return self.requeue(job_ids=stale) if stale else 0
+
+    def counts(self) -> dict[str, int]:
+        """Get the number of jobs in each state"""
+        counts = {state: 0 for state in ('pending', 'running', 'done', 'failed', 'quarantined')}
+        counts.update(dict(self._connect().execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall()))
+        return counts
+
+    def getJobs(self, state: Optional[str] = None) -> list[dict]:
+        """
+        Get the jobs of the manifest, in the order they were added.
+
+        :param state: optional state to filter the jobs by
+        :return: list of job dictionaries
+        """
+        if state is None:
+            rows = self._connect().execute('SELECT * FROM jobs ORDER BY rowid')
+        else:
+            rows = self._connect().execute('SELECT * FROM jobs WHERE state = ? ORDER BY rowid', (state,))
+        return [self._toDict(row) for row in rows]
+
+
+def runManifestJobs(db_path: str,
+                    worker: Optional[str] = None,
+                    max_jobs: Optional[int] = None,
+                    requeue_stale: bool = True,
+                    suppress_messages: bool = False,
+                    max_attempts: int = 3,
+                    backoff_seconds: float = 30,
+                    poll_seconds: float = 10,
+                    max_backoff_seconds: float = 3600) -> int:
+    """
+    Worker loop that claims jobs from a RunManifest one at a time and runs them with runApp until no jobs are
+    pending. Several workers (processes, or threads) can run this function on the same manifest.
+    The outcome of each run is classified (see classifyRun, with the outputs requested in the job's input file
+    as expected outputs): transient failures are retried with backoff, deterministic failures are quarantined
+    (see RunManifest.fail). The loop waits for the backoff delay of pending retries before stopping.
+
+    :param db_path: path to the manifest database
+    :param worker: identifier of the worker. Defaults to "{host}:{pid}:{thread id}".
+    :param max_jobs: optional maximum number of jobs to run
+    :param requeue_stale: if True, first set jobs of stopped workers back to pending (see RunManifest.requeueStale)
+    :param suppress_messages: if True, do not print messages from this function
+    :param max_attempts: maximum number of attempts of a job with transient failures
+    :param backoff_seconds: delay before the first retry of a failed job (doubled for each further attempt)
+    :param poll_seconds: maximum time to wait between claims while retries are waiting for their backoff delay
+    :param max_backoff_seconds: maximum delay before a retry
+    :return: the number of jobs run
+    """
+    import time
+
+    manifest = RunManifest(db_path)
+    if requeue_stale:
+        manifest.requeueStale()
+
+    n_run = 0
+    try:
+        while max_jobs is None or n_run < max_jobs:
+            jobs = manifest.claim(worker)
+            if not jobs:
+                next_retry = manifest.nextRetry()
+                if next_retry is None:
+                    break
+                time.sleep(min(max(next_retry - time.time(), 0.1), poll_seconds))
+                continue
+            job = jobs[0]
+            metrics = None
+            try:
+                start = time.perf_counter()
+                stdout, stderr, exit_status = runApp(job['app_select'], job['command_file'],
+                                                     suppress_messages=True, return_code=True)
+                wall_seconds = time.perf_counter() - start
+                expected = job['params'].get('expected_outputs')
+                if expected is None and job['input_file'] and os.path.exists(job['input_file']):
+                    expected = getExpectedOutputs(job['input_file'])
+                result = classifyRun(exit_status, stderr, stdout, out_dir=job['out_dir'],
+                                     out_name=job['out_name'], expected_outputs=expected)
+                message = stderr.strip()[-2000:]
+                if result['reason'] not in message:
+                    message = f'{result["reason"]}\n{message}'.strip()
+                message = message or None
+            except Exception as e:
+                exit_status, message = -1, repr(e)
+                result = {'outcome': 'error', 'retry': True}
+            else:
+                metrics = _tryRunMetrics(job['app_select'], stdout, stderr, out_dir=job['out_dir'],
+                                         out_name=job['out_name'], wall_seconds=wall_seconds)
+            if result['outcome'] == 'success':
+                manifest.complete(job['job_id'], exit_status, message=message, metrics=metrics, outcome='success')
+                status = 'complete'
+            else:
+                state = manifest.fail(job['job_id'], result['outcome'], exit_status, message=message,
+                                      metrics=metrics, max_attempts=max_attempts, backoff_seconds=backoff_seconds,
+                                      max_backoff_seconds=max_backoff_seconds)
+                status = f'failed ({result["outcome"]}, {"retry scheduled" if state == "pending" else state})'
+            n_run += 1
+            if not suppress_messages:
+                print(f'\tJob {job["job_id"]} {status} ({manifest.counts()})')
+    finally:
+        manifest.close()
+
+    return n_run
+
+
+def runManifest(db_path: str,
+                n_workers: Optional[int] = None,
+                suppress_messages: bool = False,
+                max_attempts: int = 3,
+                backoff_seconds: float = 30,
+                max_backoff_seconds: float = 3600) -> dict[str, int]:
+    """
+    Run the pending jobs of a RunManifest with several local worker processes, after setting the jobs of stopped
+    workers back to pending (so a crashed batch resumes where it stopped).
+
+    :param db_path: path to the manifest database
+    :param n_workers: number of worker processes. Defaults to the number of CPUs.
+    :param suppress_messages: if True, do not print messages from this function
+    :param max_attempts: maximum number of attempts of a job with transient failures (see runManifestJobs)
+    :param backoff_seconds: delay before the first retry of a failed job (doubled for each further attempt)
+    :param max_backoff_seconds: maximum delay before a retry
+    :return: the number of jobs in each state after the run
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    manifest = RunManifest(db_path)
+    manifest.requeueStale()
+    if not suppress_messages:
+        print(f'\n<<<<< [flammap_cli.py] Running manifest jobs {manifest.counts()} >>>>>')
+
+    n_workers = n_workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(runManifestJobs, db_path, None, None, False, True, max_attempts, backoff_seconds,
+                                   10, max_backoff_seconds)
+                   for _ in range(n_workers)]
+        for future in futures:
+            future.result()
+
+    counts = manifest.counts()
+    manifest.close()
+    if not suppress_messages:
+        print(f'<<<<< Manifest run complete {counts} >>>>>')
+
+    return counts
+
+
+class FileQueueBroker:
+    """
+    Work queue shared by several nodes through a directory on a shared filesystem. Jobs are JSON files moved
+    between the "pending", "leased", "done" and "failed" subfolders with atomic renames: a node leases a job by
+    renaming it into "leased" (only one node can win the rename), keeps the lease alive by touching the file
+    (heartbeats), and finishes it by renaming it to "done" or "failed". Leases that are not renewed within the
+    lease time (crashed nodes) are moved back to "pending" by any node.
+    Jobs with transient failures can be moved back to "pending" with a backoff delay (stored as a future
+    modification time of the job file, so leasing does not need to read it), and jobs with deterministic failures
+    to "quarantined".
+    Lease times should be much longer than the heartbeat interval and the clock skew between nodes.
+    """
+    def __init__(self, queue_dir: str):
+        """
+        :param queue_dir: path to the shared queue folder (created if it does not exist)
+        """
+        self.queue_dir = queue_dir
+        self._dirs = {state: os.path.join(queue_dir, state)
+                      for state in ('pending', 'leased', 'done', 'failed', 'quarantined')}
+        for path in self._dirs.values():
+            os.makedirs(path, exist_ok=True)
+        self._candidates = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'FileQueueBroker({self.queue_dir!r}, {self.counts()})'
+
+    def publish(self, jobs: list[dict]) -> int:
+        """
+        Publish jobs to the queue. Jobs already in the queue (same job_id, in any state) are skipped.
+
+        :param jobs: list of job dictionaries with at least the keys "job_id", "app_select" and "command_file"
+        :return: the number of published jobs
+        """
+        existing = {name[:-5].split('@')[0]
+                    for path in self._dirs.values() for name in os.listdir(path) if name.endswith('.json')}
+        n_published = 0
+        for job in jobs:
+            if job['job_id'] in existing:
+                continue
+            _writeJson(os.path.join(self._dirs['pending'], f'{job["job_id"]}.json'), job)
+            n_published += 1
+
+        return n_published
+
+    def lease(self, worker: Optional[str] = None) -> Optional[dict]:
+        """
+        Lease a pending job.
+
+        :param worker: identifier of the worker leasing the job (stored with the job result)
+        :return: lease dictionary with the keys "job", "token" and "worker", or None if no job is pending
+        """
+        import random
+        import time
+        import uuid
+
+        with self._lock:
+            for attempt in range(2):
+                if not self._candidates:
+                    # Refresh the listing of pending jobs (kept between calls to avoid listing large folders
+                    # on every lease), in random order to limit contention between nodes
+                    self._candidates = [name for name in os.listdir(self._dirs['pending']) if name.endswith('.json')]
+                    random.shuffle(self._candidates)
+                while self._candidates:
+                    name = self._candidates.pop()
+                    pending_path = os.path.join(self._dirs['pending'], name)
+                    token = uuid.uuid4().hex
+                    now = time.time()
+                    # The lease time is stored in the file name, so expire() never sees the publish (or backoff)
+                    # modification time of a job that was just leased, even through a stale attribute cache
+                    leased_path = os.path.join(self._dirs['leased'], f'{name[:-5]}@{token}@{now:.3f}.json')
+                    try:
+                        if os.stat(pending_path).st_mtime > now:
+                            continue  # Waiting for a retry
+                        os.utime(pending_path, (now, now))
+                        os.rename(pending_path, leased_path)
+                    except (FileNotFoundError, FileExistsError):
+                        continue  # Leased by another node
+                    return {'job': _readJson(leased_path), 'token': token, 'worker': worker or _workerId(),
+                            'path': leased_path}
+
+        return None
+
+    def heartbeat(self, lease: dict) -> bool:
+        """
+        Renew a lease.
+
+        :param lease: lease dictionary from lease()
+        :return: True if the lease is still held, False if it expired and the job was requeued
+        """
+        try:
+            os.utime(lease['path'], None)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def complete(self,
+                 lease: dict,
+                 result: Optional[dict] = None,
+                 failed: bool = False,
+                 quarantined: bool = False) -> bool:
+        """
+        Finish a leased job, storing its result with the job.
+
+        :param lease: lease dictionary from lease()
+        :param result: dictionary of results (e.g., exit status, timings)
+        :param failed: if True, move the job to "failed" rather than "done"
+        :param quarantined: if True, move the job to "quarantined" (deterministic failures)
+        :return: True if the job was finished, False if the lease was lost (the job was requeued)
+        """
+        job = dict(lease['job'], result=dict(result or {}, worker=lease['worker']))
+        out_dir = self._dirs['quarantined' if quarantined else 'failed' if failed else 'done']
+
+        # Take the leased file out of reach of expire() first, then write the result
+        tmp_path = os.path.join(out_dir, f'.{job["job_id"]}@{lease["token"]}.tmp')
+        try:
+            os.rename(lease['path'], tmp_path)
+        except FileNotFoundError:
+            return False
+        _writeJson(tmp_path, job)
+        os.replace(tmp_path, os.path.join(out_dir, f'{job["job_id"]}.json'))
+
+        return True
+
+    def retry(self, lease: dict, delay: float = 0, result: Optional[dict] = None) -> bool:
+        """
+        Move a leased job back to pending after a transient failure, to be leased again once delay seconds have
+        passed. The result is appended to the "failures" of the job, and its "attempts" are counted.
+
+        :param lease: lease dictionary from lease()
+        :param delay: backoff delay (seconds)
+        :param result: dictionary of results of the failed attempt
+        :return: True if the job was requeued, False if the lease was lost (the job was already requeued)
+        """
+        import time
+
+        job = dict(lease['job'])
+        job['failures'] = job.get('failures', []) + [dict(result or {}, worker=lease['worker'])]
+        job['attempts'] = len(job['failures'])
+
+        tmp_path = os.path.join(self._dirs['pending'], f'.{job["job_id"]}@{lease["token"]}.tmp')
+        try:
+            os.rename(lease['path'], tmp_path)
+        except FileNotFoundError:
+            return False
+        _writeJson(tmp_path, job)
+        not_before = time.time() + delay
+        os.utime(tmp_path, (not_before, not_before))
+        os.replace(tmp_path, os.path.join(self._dirs['pending'], f'{job["job_id"]}.json'))
+
+        return True
+
+    def expire(self, lease_seconds: float) -> int:
+        """
+        Move leases that were not renewed within lease_seconds (since they were leased, or since their last
+        heartbeat) back to pending.
+
+        :param lease_seconds: lease time (seconds)
+        :return: the number of requeued jobs
+        """
+        import time
+
+        n_expired = 0
+        now = time.time()
+        for entry in os.scandir(self._dirs['leased']):
+            if not entry.name.endswith('.json'):
+                continue
+            # Last renewal: the latest of the lease time (in the file name) and the last heartbeat (mtime)
+            parts = entry.name[:-5].split('@')
+            try:
+                leased = float(parts[2]) if len(parts) > 2 else 0
+            except ValueError:
+                leased = 0
+            try:
+                if now - max(leased, entry.stat().st_mtime) > lease_seconds:
+                    os.rename(entry.path, os.path.join(self._dirs['pending'], f'{entry.name.split("@")[0]}.json'))
+                    n_expired += 1
+            except FileNotFoundError:
+                continue  # Finished or requeued by another node
+
+        return n_expired
+
+    def counts(self) -> dict[str, int]:
+        """Get the number of jobs in each state"""
+        return {state: sum(name.endswith('.json') for name in os.listdir(path))
+                for state, path in self._dirs.items()}
+
+    def results(self, state: str = 'done') -> list[dict]:
+        """Get the finished jobs (with their "result") in the "done", "failed" or "quarantined" state"""
+        return [_readJson(os.path.join(self._dirs[state], name))
+                for name in sorted(os.listdir(self._dirs[state])) if name.endswith('.json')]
+
+
+class LocalQueueBroker:
+    """
+    In-process stand-in for FileQueueBroker (same methods), e.g., to test distributed workers with threads.
+    """
+    def __init__(self):
+        self._pending = []
+        self._leased = {}
+        self._finished = {'done': {}, 'failed': {}, 'quarantined': {}}
+        self._not_before = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f'LocalQueueBroker({self.counts()})'
+
+    def publish(self, jobs: list[dict]) -> int:
+        """See FileQueueBroker.publish"""
+        with self._lock:
+            existing = ({job['job_id'] for job in self._pending} |
+                        {lease['job']['job_id'] for lease, _ in self._leased.values()} |
+                        {job_id for finished in self._finished.values() for job_id in finished})
+            new_jobs = [dict(job) for job in jobs if job['job_id'] not in existing]
+            self._pending.extend(new_jobs)
+        return len(new_jobs)
+
+    def lease(self, worker: Optional[str] = None) -> Optional[dict]:
+        """See FileQueueBroker.lease"""
+        import time
+        import uuid
+
+        with self._lock:
+            now = time.monotonic()
+            index = next((i for i, job in enumerate(self._pending)
+                          if self._not_before.get(job['job_id'], 0) <= now), None)
+            if index is None:
+                return None
+            job = self._pending.pop(index)
+            self._not_before.pop(job['job_id'], None)
+            lease = {'job': job, 'token': uuid.uuid4().hex, 'worker': worker or _workerId()}
+            self._leased[lease['token']] = (lease, now)
+        return lease
+
+    def heartbeat(self, lease: dict) -> bool:
+        """See FileQueueBroker.heartbeat"""
+        import time
+
+        with self._lock:
+            if lease['token'] not in self._leased:
+                return False
+            self._leased[lease['token']] = (lease, time.monotonic())
+        return True
+
+    def complete(self,
+                 lease: dict,
+                 result: Optional[dict] = None,
+                 failed: bool = False,
+                 quarantined: bool = False) -> bool:
+        """See FileQueueBroker.complete"""
+        with self._lock:
+            if self._leased.pop(lease['token'], None) is None:
+                return False
+            job = dict(lease['job'], result=dict(result or {}, worker=lease['worker']))
+            self._finished['quarantined' if quarantined else 'failed' if failed else 'done'][job['job_id']] = job
+        return True
+
+    def retry(self, lease: dict, delay: float = 0, result: Optional[dict] = None) -> bool:
+        """See FileQueueBroker.retry"""
+        import time
+
+        with self._lock:
+            if self._leased.pop(lease['token'], None) is None:
+                return False
+            job = dict(lease['job'])
+            job['failures'] = job.get('failures', []) + [dict(result or {}, worker=lease['worker'])]
+            job['attempts'] = len(job['failures'])
+            self._not_before[job['job_id']] = time.monotonic() + delay
+            self._pending.append(job)
+        return True
+
+    def expire(self, lease_seconds: float) -> int:
+        """See FileQueueBroker.expire"""
+        import time
+
+        now = time.monotonic()
+        with self._lock:
+            expired = [token for token, (_, renewed) in self._leased.items() if now - renewed > lease_seconds]
+            for token in expired:
+                self._pending.append(self._leased.pop(token)[0]['job'])
+        return len(expired)
+
+    def counts(self) -> dict[str, int]:
+        """See FileQueueBroker.counts"""
+        with self._lock:
+            return {'pending': len(self._pending), 'leased': len(self._leased),
+                    **{state: len(finished) for state, finished in self._finished.items()}}
+
+    def results(self, state: str = 'done') -> list[dict]:
+        """See FileQueueBroker.results"""
+        with self._lock:
+            return list(self._finished[state].values())
+
+
+def runQueueWorker(broker: Union[FileQueueBroker, LocalQueueBroker],
+                   worker: Optional[str] = None,
+                   lease_seconds: float = 600,
+                   heartbeat_seconds: Optional[float] = None,
+                   poll_seconds: float = 10,
+                   wait_for_jobs: bool = False,
+                   max_jobs: Optional[int] = None,
+                   suppress_messages: bool = False,
+                   max_attempts: int = 3,
+                   backoff_seconds: float = 30,
+                   max_backoff_seconds: float = 3600) -> int:
+    """
+    Worker loop for one node of a distributed run: lease jobs from a broker and run them with runApp, renewing
+    the lease with heartbeats from a background thread while the app runs. Expired leases of crashed nodes are
+    requeued by every worker before leasing. The broker can be a FileQueueBroker on a shared filesystem, or any
+    object with the same methods (e.g., LocalQueueBroker in tests).
+    The outcome of each run is classified (see classifyRun, with the job's "expected_outputs", or the outputs
+    requested in its input file): transient failures are put back in the queue with exponential backoff (and
+    usually leased by another node), and deterministic failures, or jobs out of attempts, are quarantined.
+
+    :param broker: the job queue broker
+    :param worker: identifier of the worker. Defaults to "{host}:{pid}:{thread id}".
+    :param lease_seconds: lease time (seconds). Leases not renewed within this time are requeued.
+    :param heartbeat_seconds: interval between heartbeats. Defaults to a third of the lease time.
+    :param poll_seconds: time to wait between polls when no job is pending
+    :param wait_for_jobs: if True, keep polling when the queue is empty (e.g., while a coordinator is still
+        publishing jobs); otherwise stop once no jobs are pending or leased
+    :param max_jobs: optional maximum number of jobs to run
+    :param suppress_messages: if True, do not print messages from this function
+    :param max_attempts: maximum number of attempts of a job with transient failures
+    :param backoff_seconds: delay before the first retry of a failed job (doubled for each further attempt)
+    :param max_backoff_seconds: maximum delay before a retry
+    :return: the number of jobs run
+    """
+    import time
+
+    worker = worker or _workerId()
+    heartbeat_seconds = heartbeat_seconds or lease_seconds / 3
+
+    def _heartbeat(lease: dict, stop: threading.Event) -> None:
+        while not stop.wait(heartbeat_seconds):
+            if not broker.heartbeat(lease):
+                return
+
+    n_run = 0
+    while max_jobs is None or n_run < max_jobs:
+        broker.expire(lease_seconds)
+        lease = broker.lease(worker)
+        if lease is None:
+            counts = broker.counts()
+            # Pending jobs that cannot be leased are waiting for a retry
+            if not wait_for_jobs and counts['leased'] == 0 and counts['pending'] == 0:
+                break
+            time.sleep(poll_seconds)
+            continue
+
+        job = lease['job']
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=_heartbeat, args=(lease, stop), daemon=True)
+        heartbeat.start()
+        started = time.time()
+        metrics = None
+        try:
+            stdout, stderr, exit_status = runApp(job['app_select'], job['command_file'],
+                                                 suppress_messages=True, return_code=True)
+            wall_seconds = time.time() - started
+            message = stderr.strip()[-2000:] or None
+            expected = job.get('expected_outputs')
+            if expected is None and job.get('input_file') and os.path.exists(job['input_file']):
+                expected = getExpectedOutputs(job['input_file'])
+            outcome = classifyRun(exit_status, stderr, stdout, out_dir=job.get('out_dir'),
+                                  out_name=job.get('out_name'), expected_outputs=expected)
+        except Exception as e:
+            exit_status, message = -1, repr(e)
+            outcome = {'outcome': 'error', 'retry': True, 'reason': message}
+        else:
+            metrics = _tryRunMetrics(job['app_select'], stdout, stderr, out_dir=job.get('out_dir'),
+                                     out_name=job.get('out_name'), wall_seconds=wall_seconds)
+        finally:
+            stop.set()
+            heartbeat.join()
+
+        result = {'exit_status': exit_status, 'message': message, 'metrics': metrics, 'outcome': outcome['outcome'],
+                  'reason': outcome['reason'], 'started': started, 'finished': time.time()}
+        attempts = job.get('attempts', 0) + 1
+        if outcome['outcome'] == 'success':
+            completed = broker.complete(lease, result)
+            status = 'complete'
+        elif outcome['retry'] and attempts < max_attempts:
+            completed = broker.retry(lease, _retryDelay(attempts, backoff_seconds, max_backoff_seconds), result)
+            status = f'failed ({outcome["outcome"]}), retry scheduled'
+        else:
+            completed = broker.complete(lease, dict(result, attempts=attempts), quarantined=True)
+            status = f'failed ({outcome["outcome"]}), quarantined'
+        n_run += 1
+        if not suppress_messages:
+            status = status if completed else f'{status}, but its lease expired (requeued)'
+            print(f'\tJob {job["job_id"]} {status}')
+
+    return n_run
+
+
+class ScratchStager:
+    """
+    Stage runs on node-local scratch storage (e.g., a tmpfs such as /dev/shm, or a local SSD) instead of shared
+    network storage. The files referenced by a command file (LCP, input file, ignitions, barriers) and by its
+    input files (e.g., gridded winds, custom fuels) are hard-linked or copied to the scratch folder, once per node
+    for files shared by many runs, and the paths in the command and input files are rewritten to match. The app
+    runs on scratch, and its outputs are compressed (see compressOutputs) and moved back to their original folders
+    asynchronously, while the next run is already executing. Staged inputs are deleted from scratch when the last
+    run using them is collected.
+    Scratch space is budgeted: staging a run waits while the estimated outputs of the runs on scratch, plus the
+    inputs copied (not hard-linked) to scratch for them, would exceed budget_bytes.
+
+    Example:
+        with ScratchStager(budget_bytes=8 * 1024 ** 3) as stager:
+            for command_file in command_files:
+                stdout, stderr, move_back = stager.run('MTT', command_file)
+    """
+    def __init__(self,
+                 scratch_dir: Optional[str] = None,
+                 budget_bytes: Optional[int] = None,
+                 bytes_per_cell: float = 16,
+                 link: bool = True,
+                 compress_outputs: bool = True,
+                 move_workers: int = 2,
+                 suppress_messages: bool = True):
+        """
+        :param scratch_dir: path to the scratch folder. Defaults to a folder in /dev/shm (if available) or in
+            the system temporary folder.
+        :param budget_bytes: maximum estimated bytes of run outputs and copied inputs on scratch. If None, only the
+            free space of the scratch disk is checked (staging waits while it is below the estimate of the next
+            run). A run whose estimate alone exceeds the budget raises ValueError.
+        :param bytes_per_cell: estimated output bytes per LCP cell of a run, used for budgeting
+        :param link: if True, hard-link inputs when the scratch folder is on the same filesystem, otherwise copy
+        :param compress_outputs: if True, convert ASCII grid outputs to compressed GeoTIFFs before moving them back
+        :param move_workers: number of runs moved back at the same time
+        :param suppress_messages: if True, do not print messages from this class
+        """
+        import tempfile
+        from concurrent.futures import ThreadPoolExecutor
+
+        if scratch_dir is None:
+            shm_dir = '/dev/shm'
+            scratch_dir = os.path.join(shm_dir if os.path.isdir(shm_dir) else tempfile.gettempdir(),
+                                       'flammap_scratch')
+        # Absolute paths, since the apps run with the staged command file folder as working directory
+        self.scratch_dir = os.path.abspath(scratch_dir)
+        self.budget_bytes = budget_bytes
+        self.bytes_per_cell = bytes_per_cell
+        self.link = link
+        self.compress_outputs = compress_outputs
+        self.suppress_messages = suppress_messages
+        self.futures = []
+        self.errors = []
+
+        self._inputs = {}
+        self._inputs_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._reserved = 0
+        self._executor = ThreadPoolExecutor(max_workers=move_workers)
+        os.makedirs(os.path.join(self.scratch_dir, 'inputs'), exist_ok=True)
+
+    def __repr__(self):
+        return f'ScratchStager({self.scratch_dir!r}, reserved={self._reserved})'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def reserved_bytes(self) -> int:
+        """Estimated bytes of the outputs of the runs currently on scratch, plus the inputs copied for them"""
+        return self._reserved
+
+    def _copyFile(self, src_path: str, dst_path: str, link: Optional[bool] = None) -> None:
+        """Hard-link or copy a file, through a temporary file so other processes never see a partial copy"""
+        import shutil
+
+        tmp_path = f'{dst_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            if not (self.link if link is None else link):
+                raise OSError
+            os.link(src_path, tmp_path)
+        except OSError:
+            shutil.copy2(src_path, tmp_path)
+        os.replace(tmp_path, dst_path)
+
+        return
+
+    @staticmethod
+    def _inputKey(path: str) -> tuple:
+        """Version of an input file (absolute path, size and modification time)"""
+        stat = os.stat(path)
+
+        return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+    @staticmethod
+    def _sidecarFiles(path: str) -> list[str]:
+        """Files to stage for an input file (all files of a shapefile)"""
+        if path.lower().endswith('.shp'):
+            return glob.glob(f'{glob.escape(os.path.splitext(path)[0])}.*')
+
+        return [path]
+
+    @staticmethod
+    def _referencedFile(line: str, base_dir: str) -> Optional[str]:
+        """Path of the file referenced by an input file line ("KEYWORD: path"), or None"""
+        key, sep, value = line.partition(':')
+        value = value.strip()
+        if sep and value and not key.lstrip().startswith('#'):
+            file_path = value if os.path.isabs(value) else os.path.join(base_dir, value)
+            if os.path.isfile(file_path):
+                return file_path
+
+        return None
+
+    def _inputFiles(self, rows: list[list[str]], base_dir: str) -> list[str]:
+        """Input files staged for the rows of a command file (LCP, files referenced by the input file, ignitions
+        and barriers)"""
+        files = []
+        for row in rows:
+            paths = [value if os.path.isabs(value) else os.path.join(base_dir, value) for value in row]
+            files.append(paths[0])
+            with open(paths[1]) as file:
+                files += [path for path in (self._referencedFile(line, base_dir) for line in file) if path]
+            files += [path for path in paths[2:-2] if os.path.isfile(path)]
+
+        return files
+
+    def _inputBytes(self, paths: list[str]) -> int:
+        """Estimated scratch bytes of the input files that are not staged yet and cannot be hard-linked"""
+        scratch_dev = os.stat(self.scratch_dir).st_dev
+        n_bytes = 0
+        with self._inputs_lock:
+            for key in {self._inputKey(path) for path in paths}:
+                if key in self._inputs or (self.link and os.stat(key[0]).st_dev == scratch_dev):
+                    continue
+                n_bytes += sum(os.path.getsize(file_path) for file_path in self._sidecarFiles(key[0]))
+
+        return n_bytes
+
+    def _stageFile(self, path: str, staged_inputs: list) -> str:
+        """
+        Stage an input file (with the sidecar files of shapefiles) on scratch, once per version of the file, and
+        take a reference on it. The file is copied (or hard-linked) to the shared inputs folder, where other
+        processes sharing the scratch folder reuse it, and hard-linked from there to a folder of this process, so
+        deleting the shared copy never breaks the runs of another process.
+
+        :param path: path to the input file
+        :param staged_inputs: list to which the (key, newly copied bytes) of the staged file are appended
+        :return: path to the staged file
+        """
+        import hashlib
+
+        key = self._inputKey(path)
+        path = key[0]
+        with self._inputs_lock:
+            entry = self._inputs.get(key)
+            new_bytes = 0
+            if entry is None:
+                shared_dir = os.path.join(self.scratch_dir, 'inputs', hashlib.sha1(repr(key).encode()).hexdigest()[:16])
+                entry = {'path': os.path.join(f'{shared_dir}.{os.getpid()}', os.path.basename(path)),
+                         'dir': f'{shared_dir}.{os.getpid()}', 'shared_dir': shared_dir, 'shared': [],
+                         'bytes': 0, 'refs': 0}
+                os.makedirs(shared_dir, exist_ok=True)
+                os.makedirs(entry['dir'], exist_ok=True)
+                for file_path in self._sidecarFiles(path):
+                    shared_path = os.path.join(shared_dir, os.path.basename(file_path))
+                    private_path = os.path.join(entry['dir'], os.path.basename(file_path))
+                    # Files staged by another process sharing the scratch folder are reused
+                    try:
+                        if os.path.getsize(shared_path) != os.path.getsize(file_path):
+                            raise OSError
+                        self._copyFile(shared_path, private_path, link=True)
+                    except OSError:
+                        self._copyFile(file_path, shared_path)
+                        entry['shared'].append(shared_path)
+                        self._copyFile(shared_path, private_path, link=True)
+                    # Hard links to the original file take no scratch space
+                    if not os.path.samefile(private_path, file_path):
+                        entry['bytes'] += os.path.getsize(private_path)
+                self._inputs[key] = entry
+                new_bytes = entry['bytes']
+            entry['refs'] += 1
+        staged_inputs.append((key, new_bytes))
+
+        return entry['path']
+
+    @staticmethod
+    def _removeInput(entry: dict) -> None:
+        """Delete a staged input: the links of this process, and the shared copies it made"""
+        import shutil
+
+        shutil.rmtree(entry['dir'], ignore_errors=True)
+        for shared_path in entry['shared']:
+            try:
+                os.remove(shared_path)
+            except FileNotFoundError:
+                pass
+        try:
+            os.rmdir(entry['shared_dir'])
+        except OSError:
+            # Still holds files of another process
+            pass
+
+        return
+
+    def _releaseInputs(self, staged_inputs: list) -> None:
+        """Drop the references of a run on its staged inputs, deleting the inputs no other run uses"""
+        freed = 0
+        with self._inputs_lock:
+            for key, _ in staged_inputs:
+                entry = self._inputs[key]
+                entry['refs'] -= 1
+                if entry['refs'] > 0:
+                    continue
+                del self._inputs[key]
+                self._removeInput(entry)
+                freed += entry['bytes']
+        self._release(freed)
+
+        return
+
+    def _stageInputFile(self, input_path: str, run_dir: str, base_dir: str, staged_inputs: list) -> str:
+        """Copy an input file to the run folder, staging the files it references and rewriting their paths"""
+        staged_path = os.path.join(run_dir, os.path.basename(input_path))
+        with open(input_path) as src, open(staged_path, 'w') as dst:
+            for line in src:
+                file_path = self._referencedFile(line, base_dir)
+                if file_path:
+                    line = f'{line.partition(":")[0]}: {self._stageFile(file_path, staged_inputs)}\n'
+                dst.write(line)
+
+        return staged_path
+
+    def _reserve(self, n_bytes: int) -> None:
+        """Wait until the scratch budget (and free space) allows n_bytes, then reserve them"""
+        import errno
+        import shutil
+
+        if self.budget_bytes is not None and n_bytes > self.budget_bytes:
+            raise ValueError(f'A run needs an estimated {n_bytes} bytes of scratch space, more than '
+                             f'budget_bytes ({self.budget_bytes})')
+        with self._cond:
+            while True:
+                over_budget = self.budget_bytes is not None and self._reserved + n_bytes > self.budget_bytes
+                has_space = shutil.disk_usage(self.scratch_dir).free >= n_bytes
+                if not over_budget and has_space:
+                    break
+                if not has_space and self._reserved <= 0:
+                    # No run of this object will free space
+                    raise OSError(errno.ENOSPC, f'Not enough free space for an estimated {n_bytes} bytes',
+                                  self.scratch_dir)
+                self._cond.wait(timeout=1)
+            self._reserved += n_bytes
+
+        return
+
+    def _release(self, n_bytes: int) -> None:
+        with self._cond:
+            self._reserved -= n_bytes
+            self._cond.notify_all()
+
+        return
+
+    def stage(self, command_file: str, run_id: Optional[str] = None) -> dict:
+        """
+        Stage the files of a command file on scratch and write a command file with rewritten paths.
+        Blocks while the scratch budget is full.
+
+        :param command_file: path to the original command file
+        :param run_id: name of the run folder on scratch. Defaults to the command file name.
+        :return: dictionary with the staged "command_file", the scratch "run_dir", the (scratch output folder,
+            original output folder) pairs of each command row ("outputs"), the "reserved" output bytes, and the
+            "inputs" referenced by the run
+        """
+        import shutil
+        import uuid
+
+        base_dir = os.path.dirname(os.path.abspath(command_file))
+        run_id = run_id or os.path.splitext(os.path.basename(command_file))[0]
+        run_dir = os.path.join(self.scratch_dir, 'runs', f'{run_id}_{uuid.uuid4().hex[:8]}')
+
+        with open(command_file) as file:
+            rows = [line.split() for line in file if line.strip()]
+        lcp_cells = 0
+        for row in rows:
+            with rio.open(row[0] if os.path.isabs(row[0]) else os.path.join(base_dir, row[0])) as src:
+                lcp_cells += src.width * src.height
+        reserved = int(lcp_cells * self.bytes_per_cell)
+        input_bytes = self._inputBytes(self._inputFiles(rows, base_dir))
+        self._reserve(reserved + input_bytes)
+
+        staged_inputs = []
+        try:
+            os.makedirs(run_dir)
+            staged_rows = []
+            outputs = []
+            for i, row in enumerate(rows):
+                paths = [value if os.path.isabs(value) else os.path.join(base_dir, value) for value in row]
+                staged = [self._stageFile(paths[0], staged_inputs),
+                          self._stageInputFile(paths[1], run_dir, base_dir, staged_inputs)]
+                # Ignition and barrier files (MTT, TOM and Farsite rows), then the output base path
+                for value, path in zip(row[2:-2], paths[2:-2]):
+                    staged.append(self._stageFile(path, staged_inputs) if os.path.isfile(path) else value)
+                out_dir = os.path.join(run_dir, f'out_{i}')
+                os.makedirs(out_dir)
+                staged += [os.path.join(out_dir, os.path.basename(paths[-2])), row[-1]]
+                staged_rows.append(staged)
+                outputs.append((out_dir, os.path.dirname(paths[-2]), os.path.basename(paths[-2])))
+
+            staged_command = os.path.join(run_dir, os.path.basename(command_file))
+            genCommandFile(staged_command, staged_rows, suppress_messages=True)
+        except BaseException:
+            shutil.rmtree(run_dir, ignore_errors=True)
+            self._releaseInputs(staged_inputs)
+            self._release(reserved)
+            raise
+        finally:
+            # The copied inputs are now held by their staged entries (inputs staged by a concurrent run, or
+            # reused, were estimated but not copied by this run)
+            self._release(input_bytes - sum(new_bytes for _, new_bytes in staged_inputs))
+
+        return {'command_file': staged_command, 'run_dir': run_dir, 'outputs': outputs, 'reserved': reserved,
+                'inputs': staged_inputs}
+
+    def _moveBack(self, staged: dict) -> list[str]:
+        import shutil
+
+        moved = []
+        try:
+            for scratch_out_dir, out_dir, out_name in staged['outputs']:
+                if self.compress_outputs:
+                    compressOutputs(RunOutputs(scratch_out_dir, out_name=out_name))
+                os.makedirs(out_dir, exist_ok=True)
+                for entry in os.scandir(scratch_out_dir):
+                    dst_path = os.path.join(out_dir, entry.name)
+                    shutil.move(entry.path, dst_path)
+                    moved.append(dst_path)
+            shutil.rmtree(staged['run_dir'], ignore_errors=True)
+        finally:
+            self._release(staged['reserved'])
+            self._releaseInputs(staged['inputs'])
+
+        return moved
+
+    def collect(self, staged: dict):
+        """
+        Move the outputs of a staged run back to their original folders in the background (compressing them first
+        if compress_outputs is True), then delete the run folder from scratch and release its budget.
+
+        :param staged: dictionary returned by stage()
+        :return: concurrent.futures.Future of the list of moved output paths
+        """
+        future = self._executor.submit(self._moveBack, staged)
+
+        def _done(fut):
+            if fut.exception() is not None:
+                self.errors.append((staged['run_dir'], fut.exception()))
+                if not self.suppress_messages:
+                    print(f'Moving back outputs failed for {staged["run_dir"]}: {fut.exception()}')
+
+        future.add_done_callback(_done)
+        self.futures.append(future)
+
+        return future
+
+    def run(self,
+            app_select: str,
+            command_file: str,
+            run_id: Optional[str] = None) -> tuple:
+        """
+        Stage a command file on scratch, run the app there with runApp, and move the outputs back in the background.
+
+        :param app_select: The name of the selected fire modelling application
+        :param command_file: path to the original command file
+        :param run_id: name of the run folder on scratch. Defaults to the command file name.
+        :return: A tuple containing the standard output messages, the CLI app errors, and the
+            concurrent.futures.Future of the moved output paths
+        """
+        staged = self.stage(command_file, run_id=run_id)
+        try:
+            stdout, stderr = runApp(app_select, staged['command_file'], suppress_messages=self.suppress_messages)
+        finally:
+            future = self.collect(staged)
+
+        return stdout, stderr, future
+
+    def close(self, wait: bool = True, clear_inputs: bool = False) -> None:
+        """
+        Wait for the outputs to be moved back (if wait is True) and shut down the workers.
+
+        :param wait: if True, wait for the queued move-backs to finish
+        :param clear_inputs: if True, also delete the inputs still staged by this object from scratch (inputs are
+            deleted when the last run using them is collected, so only needed if wait is False)
+        :return: None
+        """
+        self._executor.shutdown(wait=wait)
+        if clear_inputs:
+            with self._inputs_lock:
+                for entry in self._inputs.values():
+                    self._removeInput(entry)
+                self._inputs.clear()
+
+        return
+
+
+class _LRUCache:
+    """
+    Thread-safe in-memory cache bounded by its number of entries, evicting the least recently used entries.
+    Values are computed once per key, even when several threads request a missing key at the same time.
+    """
+    def __init__(self, max_entries: int = 256):
+        from collections import OrderedDict
+
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key, factory):
+        """Get the value of a key, computing it with factory() if it is not cached"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            event = self._loading.get(key)
+            if event is None:
+                self._loading[key] = threading.Event()
+                self.misses += 1
+
+        if event is not None:
+            event.wait()
+            return self.get(key, factory)
+
+        try:
+            value = factory()
+            with self._lock:
+                self._entries[key] = value
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        finally:
+            with self._lock:
+                self._loading.pop(key).set()
+
+        return value
+
+    def stats(self) -> dict:
+        return {'entries': len(self._entries), 'max_entries': self.max_entries, 'hits': self.hits,
+                'misses': self.misses}
+
+
+def _fileKey(path: str) -> tuple:
+    """Cache key of a version of a file (absolute path, size and modification time)"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return path, stat.st_size, stat.st_mtime_ns
+
+
+def _parseCell(text: str) -> Union[int, float, str]:
+    """Parse a CSV cell as an int or a float if possible, otherwise return the stripped text"""
+    text = text.strip()
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def _readTableRows(csv_path: str) -> list[list]:
+    """Read the data rows of a CSV table with a header row, as lists of int, float or str values"""
+    import csv
+
+    with open(csv_path, 'r', newline='') as file:
+        rows = [row for row in csv.reader(file) if row and any(cell.strip() for cell in row)]
+
+    return [[_parseCell(cell) for cell in row] for row in rows[1:]]
+
+
+# genInputFile arguments that are formatted tables (number of records, records)
+table_input_args = ('raws_data', 'weather_data', 'wind_data', 'fuel_moisture_data', 'far_burn_periods')
+
+
+def _renderTable(table, cache: _LRUCache) -> tuple[int, str]:
+    """
+    Format a weather, wind, burn period or fuel moisture table for genInputFile (see genWeatherString),
+    cached per CSV file version (or per table content for tables given as lists of rows).
+
+    :param table: path to a CSV table with a header row, list of rows, or already formatted (count, records)
+    :param cache: cache of formatted tables
+    :return: number of records, and the formatted records
+    """
+    if isinstance(table, str):
+        return cache.get(('csv', _fileKey(table)), lambda: genWeatherString(_readTableRows(table)))
+    if len(table) == 2 and isinstance(table[0], int) and isinstance(table[1], str):
+        return tuple(table)
+    rows = [list(row) for row in table]
+    return cache.get(('rows', hashScenario({'rows': rows})), lambda: genWeatherString(rows))
+
+
+def _writeScenarioFiles(scenario: dict, table_cache: _LRUCache) -> tuple[str, str]:
+    """
+    Write the input file and the command file of a scenario (see ScenarioService) in its output folder.
+
+    :param scenario: scenario dictionary
+    :param table_cache: cache of formatted tables (see _renderTable)
+    :return: paths of the input file and of the command file
+    """
+    app_select = scenario['app_select']
+    out_dir = scenario['out_dir']
+    out_name = scenario['out_name']
+    os.makedirs(out_dir, exist_ok=True)
+
+    inputs = dict(scenario.get('inputs') or {})
+    for arg in table_input_args:
+        if inputs.get(arg) is not None:
+            inputs[arg] = _renderTable(inputs[arg], table_cache)
+    input_file = genInputFile(out_dir, f'{out_name}_input', suppress_messages=True, app_select=app_select, **inputs)
+    command_file = os.path.join(out_dir, f'{out_name}_command.txt')
+    genCommandFile(command_file,
+                   [genCommandRow(app_select, scenario['lcp_file'], input_file, os.path.join(out_dir, out_name),
+                                  ign_file=scenario.get('ign_file'), barrier_file=scenario.get('barrier_file'),
+                                  out_type=scenario.get('out_type', 2))],
+                   suppress_messages=True)
+
+    return input_file, command_file
+
+
+class ScenarioService:
+    """
+    Long-running local service for submitting scenarios and polling their results, so pipeline steps do not pay
+    for starting Python, importing this module and re-reading their inputs on every run.
+
+    The service keeps warm, bounded in-memory caches of LCP fingerprints (grid metadata, keyed by file version),
+    formatted weather, wind and burn period blocks, and fuel moisture tables (rendered from CSV tables, keyed by
+    file version), and dispatches scenarios to a worker pool. Each scenario is written as an input file and a
+    command file, run with runApp, and classified (see classifyRun). Identical scenarios (same parameters and
+    same LCP version) are run once.
+
+    A scenario is a dictionary with the keys:
+        "app_select", "lcp_file", "out_dir", "out_name",
+        optionally "ign_file", "barrier_file", "out_type" (default 2), "expected_outputs",
+        and "inputs": keyword arguments of genInputFile. Table arguments (see table_input_args) can be given as paths
+        to CSV tables with a header row (e.g., "raws_data": "weather.csv"), which are rendered with
+        genWeatherString and cached.
+
+    The HTTP API (see serve) accepts JSON:
+        POST /scenarios        submit a scenario, or a list of scenarios (none are submitted if one is
+                               invalid); returns {"job_ids": [...]}
+        GET  /scenarios/{id}   get the state and result of a job
+        GET  /scenarios        get the state of all jobs
+        GET  /status           get the job counts and cache statistics
+        POST /shutdown         stop the service
+
+    Example:
+        service = ScenarioService(max_workers=8)
+        service.serve(socket_path='/tmp/flammap.sock')  # or service.serve(port=8765)
+    """
+    def __init__(self,
+                 max_workers: Optional[int] = None,
+                 max_lcp_entries: int = 256,
+                 max_table_entries: int = 1024,
+                 max_jobs: int = 100000,
+                 suppress_messages: bool = True):
+        """
+        :param max_workers: number of scenarios run at the same time. Defaults to the number of CPUs.
+        :param max_lcp_entries: maximum number of cached LCP fingerprints
+        :param max_table_entries: maximum number of cached weather and fuel moisture tables
+        :param max_jobs: maximum number of finished jobs kept for polling (the oldest are dropped first)
+        :param suppress_messages: if True, do not print messages from this class
+        """
+        from collections import OrderedDict
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.max_jobs = max_jobs
+        self.suppress_messages = suppress_messages
+        self.lcp_cache = _LRUCache(max_lcp_entries)
+        self.table_cache = _LRUCache(max_table_entries)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count())
+        self._server = None
+        self._serving = False
+
+    def __repr__(self):
+        return f'ScenarioService({self.counts()})'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def lcpFingerprint(self, lcp_file: str) -> dict:
+        """
+        Get the fingerprint of an LCP file: its grid metadata and a hash of its version (path, size, modification
+        time and grid), cached per file version.
+
+        :param lcp_file: path to the LCP file
+        :return: dictionary with the keys "path", "hash", "height", "width", "res", "crs" and "bounds"
+        """
+        import hashlib
+
+        key = _fileKey(lcp_file)
+
+        def _load() -> dict:
+            with rio.open(lcp_file) as src:
+                meta = {'path': key[0], 'height': src.height, 'width': src.width, 'res': abs(src.transform.a),
+                        'crs': src.crs.to_string() if src.crs else None, 'bounds': list(src.bounds)}
+            meta['hash'] = hashlib.sha1(repr((key, sorted(meta.items()))).encode()).hexdigest()
+            return meta
+
+        return self.lcp_cache.get(('lcp', key), _load)
+
+    def renderTable(self, table) -> tuple[int, str]:
+        """
+        Format a weather, wind, burn period or fuel moisture table for genInputFile (see genWeatherString),
+        cached per CSV file version (or per table content for tables given as lists of rows).
+
+        :param table: path to a CSV table with a header row, list of rows, or already formatted (count, records)
+        :return: number of records, and the formatted records
+        """
+        return _renderTable(table, self.table_cache)
+
+    def _prepare(self, scenario: dict) -> tuple[str, dict]:
+        """Validate a scenario, and get its job identifier (scenario hash including the LCP version)"""
+        if not isinstance(scenario, dict):
+            raise ValueError(f'Scenario must be a JSON object, not {type(scenario).__name__}')
+        if not isinstance(scenario.get('inputs') or {}, dict):
+            raise ValueError('Scenario inputs must be a JSON object of genInputFile arguments')
+        missing = [key for key in ('app_select', 'lcp_file', 'out_dir', 'out_name') if not scenario.get(key)]
+        if missing:
+            raise ValueError(f'Scenario is missing: {", ".join(missing)}')
+        if scenario['app_select'] not in app_name_dict:
+            raise ValueError(f'Invalid app: {scenario["app_select"]}. Must be one of {", ".join(app_name_dict)}')
+        fingerprint = self.lcpFingerprint(scenario['lcp_file'])
+
+        return hashScenario(dict(scenario, lcp_file=fingerprint['hash'])), fingerprint
+
+    def _run(self, job_id: str, scenario: dict, fingerprint: dict) -> dict:
+        """Write the input and command files of a scenario, and run it"""
+        import time
+
+        self._update(job_id, state='running', started=time.time())
+        app_select = scenario['app_select']
+        out_dir = scenario['out_dir']
+        out_name = scenario['out_name']
+        input_file, command_file = _writeScenarioFiles(scenario, self.table_cache)
+
+        start = time.perf_counter()
+        stdout, stderr, exit_status = runApp(app_select, command_file, suppress_messages=True, return_code=True)
+        wall_seconds = time.perf_counter() - start
+        expected = scenario.get('expected_outputs')
+        if expected is None:
+            expected = getExpectedOutputs(input_file)
+        outcome = classifyRun(exit_status, stderr, stdout, out_dir=out_dir, out_name=out_name,
+                              expected_outputs=expected)
+        metrics = _tryRunMetrics(app_select, stdout, stderr, out_dir=out_dir, out_name=out_name,
+                                 wall_seconds=wall_seconds)
+        metrics.update({'lcp_rows': fingerprint['height'], 'lcp_cols': fingerprint['width'],
+                        'lcp_cells': fingerprint['height'] * fingerprint['width'], 'lcp_res': fingerprint['res']})
+
+        return {'exit_status': exit_status, 'outcome': outcome['outcome'], 'reason': outcome['reason'],
+                'command_file': command_file, 'input_file': input_file, 'metrics': metrics,
+                'message': stderr.strip()[-2000:] or None}
+
+    def _update(self, job_id: str, **values) -> None:
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(values)
+
+    def _done(self, job_id: str, future) -> None:
+        import time
+
+        try:
+            result = future.result()
+            state = 'done' if result['outcome'] == 'success' else 'failed'
+        except Exception as e:
+            result, state = {'outcome': 'error', 'reason': repr(e)}, 'failed'
+        self._update(job_id, state=state, finished=time.time(), result=result)
+        if not self.suppress_messages:
+            print(f'\tJob {job_id} {state}')
+
+    def submit(self, scenario: dict) -> str:
+        """
+        Submit a scenario to the worker pool. A scenario identical to a queued, running or finished job is not
+        run again (failed jobs are run again).
+
+        :param scenario: scenario dictionary (see ScenarioService)
+        :return: the job identifier
+        """
+        return self.submitMany([scenario])[0]
+
+    def submitMany(self, scenarios: list[dict]) -> list[str]:
+        """
+        Submit several scenarios (see submit). All scenarios are validated before any of them is submitted, so an
+        invalid scenario raises ValueError without submitting the others.
+
+        :param scenarios: list of scenario dictionaries (see ScenarioService)
+        :return: the job identifiers
+        """
+        prepared = [(scenario,) + self._prepare(scenario) for scenario in scenarios]
+        return [self._submit(job_id, scenario, fingerprint) for scenario, job_id, fingerprint in prepared]
+
+    def _submit(self, job_id: str, scenario: dict, fingerprint: dict) -> str:
+        """Submit a validated scenario to the worker pool (raises RuntimeError once the service is closed)"""
+        import time
+
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job['state'] != 'failed':
+                return job_id
+            self._jobs[job_id] = {'job_id': job_id, 'state': 'queued', 'submitted': time.time(),
+                                  'out_dir': scenario['out_dir'], 'out_name': scenario['out_name']}
+            self._jobs.move_to_end(job_id)
+            # Drop the oldest finished jobs
+            finished = [key for key, value in self._jobs.items() if value['state'] in ('done', 'failed')]
+            for key in finished[:max(len(self._jobs) - self.max_jobs, 0)]:
+                del self._jobs[key]
+        try:
+            future = self._executor.submit(self._run, job_id, scenario, fingerprint)
+        except RuntimeError:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            raise
+        future.add_done_callback(lambda fut: self._done(job_id, fut))
+
+        return job_id
+
+    def getJob(self, job_id: str) -> Optional[dict]:
+        """Get the state (and the result, once finished) of a job, or None if the job is unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def getJobs(self) -> list[dict]:
+        """Get the state of all jobs (without their results)"""
+        with self._lock:
+            return [{key: value for key, value in job.items() if key != 'result'} for job in self._jobs.values()]
+
+    def counts(self) -> dict[str, int]:
+        """Get the number of jobs in each state"""
+        counts = {state: 0 for state in ('queued', 'running', 'done', 'failed')}
+        with self._lock:
+            for job in self._jobs.values():
+                counts[job['state']] += 1
+        return counts
+
+    def status(self) -> dict:
+        """Get the job counts and the cache statistics"""
+        return {'jobs': self.counts(), 'lcp_cache': self.lcp_cache.stats(), 'table_cache': self.table_cache.stats()}
+
+    def _handler(self):
+        """Build the HTTP request handler class of the service"""
+        import json
+        from http.server import BaseHTTPRequestHandler
+
+        service = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def address_string(self):
+                # Unix socket clients have no address
+                return self.client_address[0] if self.client_address else 'unix'
+
+            def log_message(self, format, *args):
+                if not service.suppress_messages:
+                    super().log_message(format, *args)
+
+            def _send(self, code: int, data) -> None:
+                body = json.dumps(data, default=str).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parts = [part for part in self.path.split('?')[0].split('/') if part]
+                if parts == ['status']:
+                    self._send(200, service.status())
+                elif parts == ['scenarios']:
+                    self._send(200, service.getJobs())
+                elif len(parts) == 2 and parts[0] == 'scenarios':
+                    job = service.getJob(parts[1])
+                    self._send(200 if job else 404, job or {'error': f'Unknown job: {parts[1]}'})
+                else:
+                    self._send(404, {'error': f'Unknown path: {self.path}'})
+
+            def do_POST(self):
+                parts = [part for part in self.path.split('?')[0].split('/') if part]
+                if parts == ['shutdown']:
+                    self._send(200, {'state': 'stopping'})
+                    threading.Thread(target=service.shutdown, daemon=True).start()
+                    return
+                if parts != ['scenarios']:
+                    self._send(404, {'error': f'Unknown path: {self.path}'})
+                    return
+                try:
+                    data = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'null')
+                    scenarios = data if isinstance(data, list) else [data]
+                    self._send(200, {'job_ids': service.submitMany(scenarios)})
+                except RuntimeError as e:
+                    # The worker pool is shut down
+                    self._send(503, {'error': str(e)})
+                except (ValueError, TypeError, KeyError, AttributeError, OSError) as e:
+                    self._send(400, {'error': str(e)})
+
+        return _Handler
+
+    def serve(self,
+              host: str = '127.0.0.1',
+              port: int = 8765,
+              socket_path: Optional[str] = None,
+              background: bool = False):
+        """
+        Serve the HTTP API on a local TCP port, or on a Unix socket.
+
+        :param host: host address to listen on (local only by default)
+        :param port: TCP port to listen on (0 = any free port)
+        :param socket_path: path of a Unix socket to listen on instead of a TCP port
+        :param background: if True, serve from a background thread and return, otherwise block until shutdown
+        :return: the server (its server_address holds the bound address)
+        """
+        import socketserver
+        from http.server import ThreadingHTTPServer
+
+        if socket_path is not None:
+            class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+                daemon_threads = True
+
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            self._server = _UnixHTTPServer(socket_path, self._handler())
+        else:
+            self._server = ThreadingHTTPServer((host, port), self._handler())
+
+        if not self.suppress_messages:
+            address = socket_path or self._server.server_address
+            print(f'<<<<< [flammap_cli.py] Scenario service listening on {address} >>>>>')
+        self._serving = True
+        if background:
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        else:
+            try:
+                self._server.serve_forever()
+            finally:
+                self.close()
+
+        return self._server
+
+    def shutdown(self) -> None:
+        """Stop serving requests (running jobs are finished)"""
+        # shutdown() blocks until serve_forever() returns, so it must not be called on a server that is not serving
+        if self._server is not None and self._serving:
+            self._serving = False
+            self._server.shutdown()
+
+        return
+
+    def close(self, wait: bool = True) -> None:
+        """Stop serving requests and shut down the worker pool"""
+        self.shutdown()
+        if self._server is not None:
+            self._server.server_close()
+            if isinstance(self._server.server_address, str) and os.path.exists(self._server.server_address):
+                os.remove(self._server.server_address)
+            self._server = None
+        self._executor.shutdown(wait=wait)
+
+        return
+
+
+# genLCP arguments of the 8 landscape source rasters, in order
+lcp_source_args = ('elev_path', 'slope_path', 'aspect_path', 'fbfm_path', 'cc_path', 'ch_path', 'cbh_path', 'cbd_path')
+
+# Scenario keys of batch manifests that are not genInputFile arguments
+batch_scenario_keys = ('app_select', 'out_dir', 'out_name', 'lcp_file', 'ign_file', 'barrier_file', 'out_type',
+                       'expected_outputs') + lcp_source_args
+
+# Default model cost rates used by estimateBatch when there are no finished runs to calibrate them with:
+# CPU seconds per cell (FlamMap, TOM), or per cell and simulated minute (MTT, Farsite).
+# These are rough orders of magnitude; calibrate them with a previous batch manifest for real estimates.
+batch_cost_rates = {
+    'FlamMap': 2e-6,
+    'TOM': 2e-5,
+    'MTT': 2e-8,
+    'Farsite': 5e-8
+}
+
+
+def _numericInputArgs() -> set[str]:
+    """Get the names of the genInputFile arguments annotated as numbers (int or float, and not str)"""
+    import inspect
+    from typing import get_args, get_origin
+
+    names = set()
+    for name, param in inspect.signature(genInputFile).parameters.items():
+        types = get_args(param.annotation) if get_origin(param.annotation) is Union else (param.annotation,)
+        if any(arg_type in (int, float) for arg_type in types) and str not in types:
+            names.add(name)
+
+    return names
+
+
+def loadBatchManifest(manifest_path: str, out_dir: Optional[str] = None) -> list[dict]:
+    """
+    Read a batch manifest of scenarios (see ScenarioService) from a CSV or a YAML file.
+
+    CSV manifests have one scenario per row, with a header row of scenario keys and genInputFile arguments
+    (empty cells are ignored, and only numeric genInputFile arguments and "out_type" are parsed as numbers).
+    YAML manifests hold a list of scenarios, or a mapping with "defaults" (keys shared by all scenarios) and
+    "scenarios". For example:
+        app_select,out_name,lcp_file,ign_file,raws_data,raws_units,raws_elev,mtt_sim_time,mtt_resolution
+        MTT,run_001,landscape.tif,ignition.shp,weather.csv,Metric,205,480,30
+
+    Scenario keys:
+        "app_select" (or "app"), "out_name" (default "run_{row number}"),
+        "out_dir" (default "{out_dir}/{out_name}"), "lcp_file", "ign_file", "barrier_file", "out_type",
+        "expected_outputs", and the landscape source rasters of genLCP ("elev_path", "slope_path", ...,
+        "cbd_path"). Scenarios with source rasters get their LCP file generated before the runs (at "lcp_file",
+        or in "{out_dir}/lcps" if there is none); scenarios with the same source rasters share their LCP file.
+        All other keys are genInputFile arguments; table arguments (see table_input_args) can be paths to CSV
+        tables with a header row.
+    Relative paths (keys ending with "_file" or "_path", and table arguments) are relative to the manifest.
+
+    :param manifest_path: path to the CSV or YAML manifest file
+    :param out_dir: root folder of the batch outputs. Defaults to a folder named after the manifest, next to it.
+    :return: list of scenario dictionaries
+    """
+    import csv
+
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    if out_dir is None:
+        out_dir = os.path.join(manifest_dir, os.path.splitext(os.path.basename(manifest_path))[0])
+    out_dir = os.path.abspath(out_dir)
+
+    if manifest_path.lower().endswith(('.yaml', '.yml')):
+        import yaml
+
+        with open(manifest_path, 'r') as file:
+            data = yaml.safe_load(file) or []
+        defaults = {}
+        if isinstance(data, dict):
+            defaults = data.get('defaults') or {}
+            data = data.get('scenarios') or []
+        rows = [dict(defaults, **row) for row in data]
+    elif manifest_path.lower().endswith('.csv'):
+        with open(manifest_path, 'r', newline='') as file:
+            rows = [{key.strip(): value.strip() for key, value in row.items()
+                     if key and value is not None and value.strip() != ''}
+                    for row in csv.DictReader(file)]
+        # CSV cells are text: only numeric genInputFile arguments (and out_type) are parsed as numbers, so names,
+        # paths and times (e.g., out_name "001", or "08 01 1300") are kept as written
+        numeric_args = _numericInputArgs() | {'out_type'}
+        rows = [{key: _parseCell(value) if key in numeric_args else value for key, value in row.items()}
+                for row in rows]
+    else:
+        raise ValueError(f'Invalid manifest file: {manifest_path}. Must be a CSV or YAML file')
+
+    scenarios = []
+    for i, row in enumerate(rows):
+        row = dict(row)
+        if 'app' in row:
+            row.setdefault('app_select', row.pop('app'))
+        # YAML scalars such as 001 are loaded as numbers
+        for key in batch_scenario_keys:
+            if key not in ('out_type', 'expected_outputs') and row.get(key) is not None:
+                row[key] = str(row[key])
+        for key, value in row.items():
+            if (isinstance(value, str) and (key.endswith(('_file', '_path')) or key in table_input_args)
+                    and not os.path.isabs(value)):
+                row[key] = os.path.join(manifest_dir, value)
+        if isinstance(row.get('expected_outputs'), str):
+            row['expected_outputs'] = [name.strip() for name in row['expected_outputs'].split(';') if name.strip()]
+
+        scenario = {key: row[key] for key in batch_scenario_keys if key in row}
+        scenario['inputs'] = {key: value for key, value in row.items() if key not in batch_scenario_keys}
+        scenario.setdefault('out_name', f'run_{i + 1:05d}')
+        scenario.setdefault('out_dir', os.path.join(out_dir, scenario['out_name']))
+        if scenario.get('app_select') not in app_name_dict:
+            raise ValueError(f'Invalid app in scenario {scenario["out_name"]}: {scenario.get("app_select")}. '
+                             f'Must be one of {", ".join(app_name_dict)}')
+        sources = [scenario.get(key) for key in lcp_source_args]
+        if any(sources):
+            if not all(scenario.get(key) for key in ('elev_path', 'fbfm_path', 'cc_path', 'ch_path', 'cbh_path',
+                                                     'cbd_path')):
+                raise ValueError(f'Scenario {scenario["out_name"]} is missing LCP source rasters')
+            scenario.setdefault('lcp_file', os.path.join(out_dir, 'lcps', f'{hashScenario({"sources": sources})}.tif'))
+        if not scenario.get('lcp_file'):
+            raise ValueError(f'Scenario {scenario["out_name"]} has no lcp_file or LCP source rasters')
+        scenarios.append(scenario)
+
+    return scenarios
+
+
+def _simMinutes(scenario: dict, default_sim_minutes: float = 1440) -> float:
+    """Get the simulated time of a scenario in minutes (1 for FlamMap and TOM, which have no simulated time)"""
+    from datetime import datetime
+
+    inputs = scenario.get('inputs') or {}
+    if scenario['app_select'] == 'MTT':
+        return float(inputs.get('mtt_sim_time') or default_sim_minutes)
+    if scenario['app_select'] == 'Farsite':
+        try:
+            start, end = (datetime.strptime(f'2001 {inputs[key]}', '%Y %m %d %H%M')
+                          for key in ('far_start_time', 'far_end_time'))
+        except (KeyError, ValueError):
+            return float(default_sim_minutes)
+        minutes = (end - start).total_seconds() / 60
+        # Fires burning through the new year
+        return minutes if minutes > 0 else minutes + 365 * 1440
+    return 1.0
+
+
+def _batchCostRates(db_path: Optional[str]) -> tuple[dict[str, float], dict[str, int]]:
+    """
+    Calibrate the cost rates of estimateBatch (see batch_cost_rates) from the finished runs of a batch manifest,
+    as their total wall time divided by their total work (cells, or cells x simulated minutes), per app.
+
+    :return: cost rates per app, and number of runs used for each app (apps without runs keep default rates)
+    """
+    rates = dict(batch_cost_rates)
+    n_runs = {}
+    if db_path is None or not os.path.exists(db_path):
+        return rates, n_runs
+
+    manifest = RunManifest(db_path)
+    totals = {}
+    for job in manifest.getJobs('done'):
+        work = job['params'].get('work')
+        seconds = (job['metrics'] or {}).get('wall_seconds')
+        if work and seconds:
+            total = totals.setdefault(job['app_select'], [0.0, 0.0])
+            total[0] += seconds
+            total[1] += work
+            n_runs[job['app_select']] = n_runs.get(job['app_select'], 0) + 1
+    manifest.close()
+    for app, (seconds, work) in totals.items():
+        rates[app] = seconds / work
+
+    return rates, n_runs
+
+
+def estimateBatch(scenarios: list[dict],
+                  n_workers: Optional[int] = None,
+                  calibration_db: Optional[str] = None,
+                  default_sim_minutes: float = 1440) -> dict:
+    """
+    Estimate the cost of a batch before any compute is spent, from the cell count of each scenario's landscape
+    (read from the LCP file, or from its elevation source raster if it is not generated yet) and its simulated
+    time. The work of a run is its cell count (FlamMap, TOM), or its cell count times its simulated minutes
+    (MTT, Farsite). MTT cell counts are scaled to the MTT resolution when it is coarser than the landscape.
+    The CPU time is the work times a cost rate per app (see batch_cost_rates), calibrated with the finished runs
+    of a previous batch manifest when one is given.
+
+    :param scenarios: list of scenario dictionaries (see loadBatchManifest)
+    :param n_workers: number of parallel runs. Defaults to the number of CPUs.
+    :param calibration_db: optional path to a batch manifest database with finished runs (see runBatch)
+    :param default_sim_minutes: simulated minutes of MTT and Farsite runs without a simulation time
+        (MTT runs burning the entire landscape, or Farsite runs without start and end times)
+    :return: dictionary with the keys "runs" (per-scenario "out_name", "app_select", "lcp_cells", "sim_minutes",
+        "work" and "cpu_seconds"), "n_runs", "n_lcps" (LCP files to generate), "lcp_cells" (total),
+        "cpu_seconds", "wall_seconds" (CPU seconds spread over the workers), "n_workers", "rates" and
+        "calibration_runs" (number of finished runs used to calibrate the rate of each app)
+    """
+    n_workers = n_workers or os.cpu_count()
+    rates, n_calibration = _batchCostRates(calibration_db)
+
+    grids = {}
+    runs = []
+    n_lcps = 0
+    for scenario in scenarios:
+        lcp_file = scenario['lcp_file']
+        if lcp_file not in grids:
+            grid_path = lcp_file
+            if not os.path.exists(lcp_file):
+                grid_path = scenario.get('elev_path')
+                n_lcps += 1
+            if grid_path is None or not os.path.exists(grid_path):
+                raise FileNotFoundError(f'Landscape of scenario {scenario["out_name"]} not found: {lcp_file}')
+            with rio.open(grid_path) as src:
+                grids[lcp_file] = (src.height * src.width, abs(src.transform.a))
+        cells, res = grids[lcp_file]
+        inputs = scenario.get('inputs') or {}
+        if scenario['app_select'] == 'MTT' and inputs.get('mtt_resolution', 0) > res:
+            cells = cells * (res / inputs['mtt_resolution']) ** 2
+        sim_minutes = _simMinutes(scenario, default_sim_minutes)
+        work = cells * sim_minutes
+        runs.append({'out_name': scenario['out_name'], 'app_select': scenario['app_select'],
+                     'lcp_cells': int(round(cells)), 'sim_minutes': sim_minutes, 'work': work,
+                     'cpu_seconds': work * rates[scenario['app_select']]})
+
+    cpu_seconds = sum(run['cpu_seconds'] for run in runs)
+    # Runs are not split between workers, so the longest run bounds the wall time
+    wall_seconds = max(cpu_seconds / min(n_workers, max(len(runs), 1)),
+                       max((run['cpu_seconds'] for run in runs), default=0))
+
+    return {'runs': runs, 'n_runs': len(runs), 'n_lcps': n_lcps,
+            'lcp_cells': sum(cells for cells, _ in grids.values()), 'cpu_seconds': cpu_seconds,
+            'wall_seconds': wall_seconds, 'n_workers': n_workers,
+            'rates': rates, 'calibration_runs': n_calibration}
+
+
+def _formatSeconds(seconds: Optional[float]) -> str:
+    """Format a duration as "1d 02:03:04" (or "?" if unknown)"""
+    if seconds is None:
+        return '?'
+    seconds = int(round(seconds))
+    days, seconds = divmod(seconds, 86400)
+    text = f'{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}'
+    return f'{days}d {text}' if days else text
+
+
+def runBatch(manifest_path: str,
+             out_dir: Optional[str] = None,
+             n_workers: Optional[int] = None,
+             dry_run: bool = False,
+             calibration_db: Optional[str] = None,
+             max_attempts: int = 3,
+             backoff_seconds: float = 30,
+             max_backoff_seconds: float = 3600,
+             report_seconds: float = 10,
+             suppress_messages: bool = False) -> dict:
+    """
+    Run a batch of scenarios from a CSV or YAML manifest (see loadBatchManifest): generate the missing LCP files,
+    write the input and command files of each scenario, and run them with several local worker processes through
+    a RunManifest database ("batch_manifest.db" in the output folder), printing the throughput and the estimated
+    time remaining while the batch runs. A stopped batch resumes where it stopped when it is run again.
+    With dry_run=True, only the cost of the batch is estimated (see estimateBatch), calibrated with the finished
+    runs of the batch manifest database (or of calibration_db) if there are any.
+
+    :param manifest_path: path to the CSV or YAML manifest file
+    :param out_dir: root folder of the batch outputs. Defaults to a folder named after the manifest, next to it.
+    :param n_workers: number of parallel runs (worker processes). Defaults to the number of CPUs.
+    :param dry_run: if True, estimate the cost of the batch without generating files or running it
+    :param calibration_db: optional path to the manifest database of a previous batch, used to calibrate
+        the cost estimate. Defaults to the batch manifest database.
+    :param max_attempts: maximum number of attempts of a run with transient failures (see runManifestJobs)
+    :param backoff_seconds: delay before the first retry of a failed run (doubled for each further attempt)
+    :param max_backoff_seconds: maximum delay before a retry
+    :param report_seconds: interval between progress reports
+    :param suppress_messages: if True, do not print messages from this function
+    :return: the cost estimate (see estimateBatch), with the number of jobs in each state ("counts") and the
+        elapsed seconds ("elapsed_seconds") after the run if dry_run is False
+    """
+    import time
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+    n_workers = n_workers or os.cpu_count()
+    scenarios = loadBatchManifest(manifest_path, out_dir)
+    if out_dir is None:
+        out_dir = os.path.join(os.path.dirname(os.path.abspath(manifest_path)),
+                               os.path.splitext(os.path.basename(manifest_path))[0])
+    db_path = os.path.join(out_dir, 'batch_manifest.db')
+
+    estimate = estimateBatch(scenarios, n_workers=n_workers, calibration_db=calibration_db or db_path)
+    if not suppress_messages:
+        calibrated = ', '.join(f'{app}: {n} runs' for app, n in estimate['calibration_runs'].items())
+        print(f'\n<<<<< [flammap_cli.py] Batch plan for {manifest_path} >>>>>')
+        print(f'\tRuns: {estimate["n_runs"]} ({", ".join(sorted({run["app_select"] for run in estimate["runs"]}))})')
+        print(f'\tLCP files to generate: {estimate["n_lcps"]}')
+        print(f'\tLandscape cells: {estimate["lcp_cells"]:,}')
+        print(f'\tEstimated CPU time: {_formatSeconds(estimate["cpu_seconds"])}')
+        print(f'\tEstimated wall time with {n_workers} workers: {_formatSeconds(estimate["wall_seconds"])}')
+        print(f'\tCost rates calibrated with: {calibrated or "none (default rates, rough estimate)"}')
+    if dry_run:
+        return estimate
+
+    # Generate the missing LCP files (once per file, shared by scenarios)
+    lcp_jobs = {}
+    for scenario in scenarios:
+        if scenario.get('elev_path') and not os.path.exists(scenario['lcp_file']):
+            lcp_jobs.setdefault(scenario['lcp_file'], [scenario.get(key) for key in lcp_source_args])
+    if lcp_jobs:
+        with ThreadPoolExecutor(max_workers=min(n_workers, len(lcp_jobs))) as executor:
+            futures = []
+            for lcp_file, sources in lcp_jobs.items():
+                os.makedirs(os.path.dirname(lcp_file), exist_ok=True)
+                futures.append(executor.submit(genLCP, lcp_file, *sources))
+            for future in futures:
+                future.result()
+
+    # Write the input and command files, and add the runs to the batch manifest
+    table_cache = _LRUCache()
+    jobs = []
+    for scenario, run in zip(scenarios, estimate['runs']):
+        input_file, command_file = _writeScenarioFiles(scenario, table_cache)
+        params = dict(scenario, lcp_cells=run['lcp_cells'], sim_minutes=run['sim_minutes'], work=run['work'])
+        jobs.append({'app_select': scenario['app_select'], 'command_file': command_file, 'input_file': input_file,
+                     'out_dir': scenario['out_dir'], 'out_name': scenario['out_name'], 'params': params})
+    manifest = RunManifest(db_path)
+    manifest.addJobs(jobs)
+    manifest.requeueStale()
+
+    counts = manifest.counts()
+    n_total = sum(counts.values())
+    n_start = counts['done'] + counts['failed'] + counts['quarantined']
+    if not suppress_messages:
+        print(f'<<<<< Running batch {counts} >>>>>')
+
+    # Run the jobs, reporting the throughput and the time remaining
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(runManifestJobs, db_path,
+                                   requeue_stale=False,
+                                   suppress_messages=True,
+                                   max_attempts=max_attempts,
+                                   backoff_seconds=backoff_seconds,
+                                   max_backoff_seconds=max_backoff_seconds)
+                   for _ in range(n_workers)]
+        pending = futures
+        while pending:
+            _, pending = wait(pending, timeout=report_seconds)
+            counts = manifest.counts()
+            n_finished = counts['done'] + counts['failed'] + counts['quarantined']
+            elapsed = time.time() - start
+            rate = (n_finished - n_start) / elapsed if elapsed > 0 else 0
+            eta = (n_total - n_finished) / rate if rate > 0 else None
+            if not suppress_messages:
+                print(f'\t[{_formatSeconds(elapsed)}] {n_finished}/{n_total} finished '
+                      f'(done {counts["done"]}, running {counts["running"]}, failed {counts["failed"]}, '
+                      f'quarantined {counts["quarantined"]}) | {rate * 3600:.1f} runs/h | '
+                      f'ETA {_formatSeconds(eta) if pending else "00:00:00"}')
+        for future in futures:
+            future.result()
+    manifest.close()
+
+    estimate.update({'counts': counts, 'elapsed_seconds': time.time() - start})
+    if not suppress_messages:
+        print(f'<<<<< Batch complete {counts} >>>>>')
+
+    return estimate
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """
+    Command line interface:
+        python flammap_cli.py run manifest.csv [--out-dir DIR] [--workers N] [--dry-run] ...
+        python flammap_cli.py serve [--host HOST] [--port PORT | --socket PATH] [--workers N]
+        python flammap_cli.py test [--app {FlamMap,MTT,TOM,Farsite}]
+
+    :param argv: command line arguments (defaults to sys.argv[1:])
+    :return: the exit status
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='flammap_cli.py',
+                                     description='Run FlamMap, MTT, TOM and Farsite scenarios from the command line')
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help='run a batch of scenarios from a CSV or YAML manifest')
+    run_parser.add_argument('manifest', help='path to the CSV or YAML manifest of scenarios')
+    run_parser.add_argument('--out-dir', help='root folder of the batch outputs (default: next to the manifest)')
+    run_parser.add_argument('--workers', type=int, help='number of parallel runs (default: number of CPUs)')
+    run_parser.add_argument('--dry-run', action='store_true', help='only estimate the cost of the batch')
+    run_parser.add_argument('--calibration-db', help='manifest database of a previous batch to calibrate the estimate')
+    run_parser.add_argument('--max-attempts', type=int, default=3, help='attempts of runs with transient failures')
+    run_parser.add_argument('--backoff-seconds', type=float, default=30, help='delay before the first retry')
+    run_parser.add_argument('--max-backoff-seconds', type=float, default=3600, help='maximum delay before a retry')
+    run_parser.add_argument('--report-seconds', type=float, default=10, help='interval between progress reports')
+
+    serve_parser = subparsers.add_parser('serve', help='serve the scenario service (see ScenarioService)')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='host address to listen on')
+    serve_parser.add_argument('--port', type=int, default=8765, help='TCP port to listen on')
+    serve_parser.add_argument('--socket', help='path of a Unix socket to listen on instead of a TCP port')
+    serve_parser.add_argument('--workers', type=int, help='number of parallel runs (default: number of CPUs)')
+
+    test_parser = subparsers.add_parser('test', help='run the app test with the sample datasets')
+    test_parser.add_argument('--app', default='Farsite', choices=list(app_name_dict), help='app to test')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        result = runBatch(args.manifest, out_dir=args.out_dir, n_workers=args.workers, dry_run=args.dry_run,
+                          calibration_db=args.calibration_db, max_attempts=args.max_attempts,
+                          backoff_seconds=args.backoff_seconds, max_backoff_seconds=args.max_backoff_seconds,
+                          report_seconds=args.report_seconds)
+        if not args.dry_run and result['counts']['failed'] + result['counts']['quarantined']:
+            return 1
+    elif args.command == 'serve':
+        with ScenarioService(max_workers=args.workers, suppress_messages=False) as service:
+            service.serve(host=args.host, port=args.port, socket_path=args.socket)
+    elif args.command == 'test':
+        appTest(app_selection=args.app)
+    else:
+        parser.print_help()
+
+    return 0
+
+
 if __name__ == '__main__':
-    # Choose app to test the Missoula Fire Lab Command Line Applications
-    _app_selection = 'Farsite'  # Options: 'FlamMap', 'MTT', 'Farsite'
+    import sys
 
-    # Test the application
-    appTest(app_selection=_app_selection)
+    sys.exit(main())
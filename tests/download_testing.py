@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Download cache tests for downloadApps/_fetchArchive, against a local HTTP server that supports ETags and
+range requests (no network access needed).
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import flammap_cli as fm
+
+
+def make_archive() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('FB/readme.txt', 'fire behavior apps\n' * 1000)
+        archive.writestr('FB/bin/TestMTT', os.urandom(50000))
+    return buffer.getvalue()
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """Serves one archive with an ETag, conditional requests and single byte ranges"""
+    archive = make_archive()
+    etag = '"v1"'
+    requests = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        data = self.archive
+        self.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        byte_range = self.headers.get('Range')
+        if byte_range and self.headers.get('If-Range', self.etag) == self.etag:
+            start = int(byte_range.split('=')[1].split('-')[0])
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+            data = data[start:]
+        else:
+            self.send_response(200)
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ArchiveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/FB.zip'
+
+
+def write_part(zip_path: str, url: str, size: int) -> None:
+    """Simulate an interrupted transfer of the first size bytes of the archive"""
+    with open(f'{zip_path}.part', 'wb') as file:
+        file.write(ArchiveHandler.archive[:size])
+    fm._writeJson(f'{zip_path}.part.json',
+                  {'url': url, 'etag': ArchiveHandler.etag, 'last_modified': None,
+                   'size': len(ArchiveHandler.archive)})
+
+
+def test_download_resume_and_cache():
+    server, url = serve()
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        out_dir = os.path.join(tmp_dir, 'supplementary_data')
+        cache_dir = os.path.join(tmp_dir, 'cache')
+        zip_path = os.path.join(cache_dir, 'FB.zip')
+        os.makedirs(cache_dir)
+        size = len(ArchiveHandler.archive)
+
+        # Resume an interrupted transfer with a range request
+        write_part(zip_path, url, size // 3)
+        assert fm.downloadApps(url, out_dir=out_dir, cache_dir=cache_dir, suppress_messages=True)
+        assert ArchiveHandler.requests[-1]['Range'] == f'bytes={size // 3}-'
+        with open(zip_path, 'rb') as file:
+            assert file.read() == ArchiveHandler.archive
+        assert os.path.exists(os.path.join(out_dir, 'FB', 'bin', 'TestMTT'))
+
+        # The cached archive is current (304)
+        assert fm.downloadApps(url, out_dir=out_dir, cache_dir=cache_dir, suppress_messages=True)
+        assert ArchiveHandler.requests[-1]['If-None-Match'] == ArchiveHandler.etag
+
+        # A complete partial file that was not published yet (416) is finalized
+        os.remove(zip_path)
+        os.remove(f'{zip_path}.json')
+        write_part(zip_path, url, size)
+        meta = fm._fetchArchive(url, zip_path, suppress_messages=True)
+        assert meta['size'] == size and not os.path.exists(f'{zip_path}.part')
+        with open(zip_path, 'rb') as file:
+            assert file.read() == ArchiveHandler.archive
+
+        # A partial file longer than the remote file (416) is discarded and downloaded again
+        os.remove(zip_path)
+        os.remove(f'{zip_path}.json')
+        write_part(zip_path, url, size)
+        with open(f'{zip_path}.part', 'ab') as file:
+            file.write(b'garbage')
+        meta = fm._fetchArchive(url, zip_path, suppress_messages=True)
+        assert meta['size'] == size
+        with open(zip_path, 'rb') as file:
+            assert file.read() == ArchiveHandler.archive
+
+        # The stamp of a custom out_dir is checked, so a current archive is not extracted again
+        os.remove(os.path.join(out_dir, 'FB', 'readme.txt'))
+        assert fm.downloadApps(url, out_dir=out_dir, cache_dir=cache_dir, suppress_messages=True)
+        assert not os.path.exists(os.path.join(out_dir, 'FB', 'readme.txt'))
+        assert fm.downloadApps(url, out_dir=out_dir, cache_dir=cache_dir, force=True, suppress_messages=True)
+        assert os.path.exists(os.path.join(out_dir, 'FB', 'readme.txt'))
+    finally:
+        server.shutdown()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    test_download_resume_and_cache()
+    print('Download tests passed')